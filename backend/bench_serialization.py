@@ -0,0 +1,95 @@
+"""Compare list-endpoint serialization before and after the trusted orjson path.
+
+Run from backend/: python bench_serialization.py [--items 100] [--likes 200] [--rounds 200]
+
+Each endpoint shape is served twice by a throwaway app, once through
+response_model validation with the stdlib JSONResponse (the old path) and once
+through serialization.trusted_response. No database is needed.
+"""
+import argparse
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import List
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from serialization import trusted_response
+from server import Post, Question, Answer, Notification
+
+
+def fake_docs(kind: str, items: int, likes: int):
+    now = datetime.now(timezone.utc).isoformat()
+    voters = [str(uuid.uuid4()) for _ in range(likes)]
+    docs = []
+    for i in range(items):
+        base = {"id": str(uuid.uuid4()), "createdAt": now, "updatedAt": now}
+        if kind == "posts":
+            base.update({
+                "authorId": "author", "title": f"Post {i}", "content": "lorem ipsum " * 400,
+                "excerpt": "lorem ipsum", "category": "general", "tags": ["python", "fastapi"],
+                "likes": voters, "bookmarks": voters[: likes // 4], "views": i, "commentsCount": 3, "published": True
+            })
+        elif kind == "questions":
+            base.update({
+                "userId": "author", "title": f"Question {i}", "description": "how do I " * 100,
+                "tags": ["python"], "status": "open", "views": i, "upvotes": voters
+            })
+        elif kind == "answers":
+            base.update({"questionId": "q", "userId": "author", "content": "try this " * 150, "upvotes": voters})
+        else:
+            base.update({"userId": "user", "type": "new_follower", "message": "Someone followed you", "link": "/u/x"})
+        docs.append(base)
+    return docs
+
+
+ENDPOINTS = {"posts": Post, "questions": Question, "answers": Answer, "notifications": Notification}
+
+
+def build_app(docs_by_kind):
+    app = FastAPI()
+    for kind, model in ENDPOINTS.items():
+        docs = docs_by_kind[kind]
+
+        def before(docs=docs):
+            return docs
+
+        def after(docs=docs, model=model):
+            return trusted_response(model, docs)
+
+        app.get(f"/before/{kind}", response_model=List[model], response_class=JSONResponse)(before)
+        app.get(f"/after/{kind}", response_model=List[model])(after)
+    return app
+
+
+def timed(client: TestClient, path: str, rounds: int) -> float:
+    client.get(path)  # warm up
+    started = time.perf_counter()
+    for _ in range(rounds):
+        response = client.get(path)
+        response.raise_for_status()
+    return (time.perf_counter() - started) / rounds * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--likes", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    docs_by_kind = {kind: fake_docs(kind, args.items, args.likes) for kind in ENDPOINTS}
+    client = TestClient(build_app(docs_by_kind))
+
+    print(f"{args.items} items, {args.likes} likes/upvotes each, {args.rounds} requests per row")
+    print(f"{'endpoint':<15}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+    for kind in ENDPOINTS:
+        before = timed(client, f"/before/{kind}", args.rounds)
+        after = timed(client, f"/after/{kind}", args.rounds)
+        print(f"{kind:<15}{before:>12.2f}{after:>12.2f}{before / after:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+import asyncio
+import gzip
+import logging
+import shutil
+import mimetypes
+import os
+import re
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+import aiofiles
+import aiofiles.os
+from fastapi import UploadFile
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from database import db
+from uploads import UPLOAD_DIR, stream_to_temp, discard
+import images
+
+logger = logging.getLogger(__name__)
+
+# Content-addressed attachment store: one stored copy per distinct SHA-256,
+# shared by every message attachment, project file, avatar and post cover that
+# references it.
+#
+# Mongo `blobs` documents: {_id: sha256, key, size, contentType, refCount, variants, metadataStripped,
+# deletingAt, createdAt, updatedAt} where variants maps a resized image's name to its key and
+# deletingAt marks a blob garbage collection is deleting.
+
+BLOB_PREFIX = "blobs"
+# Unreferenced blobs are kept this long, so an upload has time to be attached to a message
+BLOB_GC_GRACE_HOURS = 24
+BLOB_GC_BATCH_SIZE = 200
+# A GC tombstone older than this is treated as abandoned by a crashed run
+BLOB_TOMBSTONE_TIMEOUT = 10 * 60
+BLOB_TOMBSTONE_POLL = 0.2  # seconds an upload waits between checks while GC deletes its content
+# Local blobs of these types also get a .gz sibling, served by UploadFiles
+# to clients that accept gzip; media formats are already compressed
+COMPRESSIBLE_TYPES = {"application/json", "application/javascript", "application/xml", "image/svg+xml"}
+
+
+_SHA256 = re.compile(r"[0-9a-f]{64}")
+
+
+def blob_key(sha256: str, filename: Optional[str]) -> str:
+    # Two levels of sharding keep directories small: blobs/ab/cd/abcd...
+    ext = Path(filename or "").suffix.lower()
+    if not ext.replace(".", "").isalnum() or len(ext) > 10:
+        ext = ""
+    return f"{BLOB_PREFIX}/{sha256[:2]}/{sha256[2:4]}/{sha256}{ext}"
+
+
+def variant_key(sha256: str, name: str) -> str:
+    return f"{BLOB_PREFIX}/{sha256[:2]}/{sha256[2:4]}/{sha256}_{name}.webp"
+
+
+class LocalBlobBackend:
+    """Blobs under UPLOAD_DIR, served by the /uploads static mount.
+
+    `public_url` is where that mount is reachable from browsers (for example
+    https://api.example.com/uploads); without it URLs are relative to the API host.
+    """
+
+    def __init__(self, root: Path = UPLOAD_DIR, public_url: Optional[str] = None):
+        self.root = root
+        self.public_url = (public_url or "/uploads").rstrip("/")
+
+    async def put(self, temp_path: Path, key: str, content_type: str):
+        dest = self.root / key
+        await aiofiles.os.makedirs(dest.parent, exist_ok=True)
+        await aiofiles.os.replace(temp_path, dest)
+        if content_type.startswith("text/") or content_type in COMPRESSIBLE_TYPES:
+            await asyncio.to_thread(self._precompress, dest)
+
+    @staticmethod
+    def _precompress(path: Path):
+        compressed = path.with_name(path.name + ".gz")
+        with open(path, "rb") as src, gzip.open(compressed, "wb", compresslevel=9) as out:
+            shutil.copyfileobj(src, out)
+        # Only worth keeping if it actually saves bandwidth
+        if compressed.stat().st_size >= path.stat().st_size:
+            compressed.unlink()
+
+    async def exists(self, key: str) -> bool:
+        return await aiofiles.os.path.exists(self.root / key)
+
+    async def delete(self, key: str):
+        await discard(self.root / key)
+        await discard(self.root / f"{key}.gz")
+
+    def url(self, key: str) -> str:
+        return f"{self.public_url}/{key}"
+
+
+class S3BlobBackend:
+    """Blobs in an S3-compatible bucket (AWS, MinIO, R2...) through boto3.
+
+    boto3 is blocking, so every call runs in a worker thread.
+    """
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, public_url: Optional[str] = None):
+        import boto3
+        self.bucket = bucket
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.public_url = (public_url or f"https://{bucket}.s3.amazonaws.com").rstrip("/")
+
+    async def put(self, temp_path: Path, key: str, content_type: str):
+        try:
+            await asyncio.to_thread(
+                self.client.upload_file, str(temp_path), self.bucket, key,
+                ExtraArgs={"ContentType": content_type, "CacheControl": "public, max-age=31536000, immutable"}
+            )
+        finally:
+            await discard(temp_path)
+
+    async def exists(self, key: str) -> bool:
+        try:
+            await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=key)
+            return True
+        except Exception:
+            return False
+
+    async def delete(self, key: str):
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=key)
+
+    def url(self, key: str) -> str:
+        return f"{self.public_url}/{key}"
+
+
+def create_backend():
+    """Pick the blob backend from BLOB_STORE (local by default, or s3).
+
+    BLOB_PUBLIC_URL is the public base URL blob keys are appended to.
+    """
+    kind = os.environ.get("BLOB_STORE", "local").lower()
+    public_url = os.environ.get("BLOB_PUBLIC_URL")
+    if kind == "s3":
+        return S3BlobBackend(
+            os.environ["S3_BUCKET"],
+            endpoint_url=os.environ.get("S3_ENDPOINT_URL"),
+            public_url=public_url
+        )
+    return LocalBlobBackend(public_url=public_url)
+
+
+backend = create_backend()
+
+
+async def ensure_indexes():
+    await db.blobs.create_index([("refCount", 1), ("updatedAt", 1)])
+
+
+async def _store_variants(sha256: str, source: Path, variants: Dict[str, int]) -> Dict[str, str]:
+    try:
+        rendered = await images.render_variants(source, variants)
+    except images.InvalidImage as e:
+        # Stored as a plain file; callers that need an image check variantUrls
+        logger.warning(f"Could not decode image {sha256}: {e}")
+        return {}
+    keys = {}
+    for name, data in rendered.items():
+        temp_path = UPLOAD_DIR / f".variant-{uuid.uuid4().hex}"
+        async with aiofiles.open(temp_path, "wb") as out:
+            await out.write(data)
+        keys[name] = variant_key(sha256, name)
+        await backend.put(temp_path, keys[name], "image/webp")
+    await db.blobs.update_one({"_id": sha256}, {"$set": {f"variants.{name}": key for name, key in keys.items()}})
+    return keys
+
+
+async def _strip_original(sha256: str, path: Path) -> Dict[str, Any]:
+    # Originals are served as-is, so camera EXIF (GPS position, device) must not reach them
+    try:
+        size = await images.strip_metadata(path)
+    except images.InvalidImage:
+        return {}
+    fields = {"metadataStripped": True, **({"size": size} if size is not None else {})}
+    await db.blobs.update_one({"_id": sha256}, {"$set": fields})
+    return fields
+
+
+async def _claim_for_upload(sha256: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Upsert the blob document for an upload, waiting out a garbage collection in progress.
+
+    The filter skips tombstoned documents, so while GC is deleting this
+    content's files the upsert collides on _id instead of reviving the blob
+    and then losing its files. The tombstone is gone once GC finishes, and
+    the upload then starts a fresh document and writes the file again. A
+    tombstone left behind by a GC that died is taken over after
+    BLOB_TOMBSTONE_TIMEOUT.
+    """
+    while True:
+        now = datetime.now(timezone.utc)
+        try:
+            return await db.blobs.find_one_and_update(
+                {"_id": sha256, "deletingAt": {"$exists": False}},
+                {"$setOnInsert": {**fields, "createdAt": now}, "$set": {"updatedAt": now}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            stale = now - timedelta(seconds=BLOB_TOMBSTONE_TIMEOUT)
+            await db.blobs.delete_one({"_id": sha256, "deletingAt": {"$lt": stale}})
+            await asyncio.sleep(BLOB_TOMBSTONE_POLL)
+
+
+async def store_upload(file: UploadFile, max_size: int, variants: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """Stream an upload into the store and return its blob document plus url.
+
+    Content that is already stored is not written again. The blob starts
+    unreferenced; callers take a reference once something points at it.
+
+    For images, `variants` ({name: longest edge}) adds resized WebP copies,
+    returned as variantUrls. They are rendered once per content hash. Stored
+    image originals have their EXIF/XMP removed; the key stays the hash of
+    the uploaded bytes, so re-uploads still deduplicate.
+    """
+    stored = await stream_to_temp(file, max_size)
+    content_type = file.content_type or mimetypes.guess_type(file.filename or "")[0] or "application/octet-stream"
+    try:
+        blob = await _claim_for_upload(stored["sha256"], {
+            "key": blob_key(stored["sha256"], file.filename),
+            "size": stored["size"],
+            "contentType": content_type,
+            "refCount": 0
+        })
+        wanted = {name: edge for name, edge in (variants or {}).items() if name not in (blob.get("variants") or {})}
+        if wanted and images.is_processable(blob["contentType"]):
+            blob["variants"] = {**(blob.get("variants") or {}), **await _store_variants(blob["_id"], stored["tempPath"], wanted)}
+        if await backend.exists(blob["key"]):
+            await discard(stored["tempPath"])
+        else:
+            if images.is_processable(blob["contentType"]):
+                blob.update(await _strip_original(blob["_id"], stored["tempPath"]))
+            await backend.put(stored["tempPath"], blob["key"], blob["contentType"])
+    except BaseException:
+        await discard(stored["tempPath"])
+        raise
+    blob["sha256"] = blob.pop("_id")
+    blob["url"] = backend.url(blob["key"])
+    blob["variantUrls"] = {name: backend.url(key) for name, key in (blob.get("variants") or {}).items() if name in (variants or {})}
+    return blob
+
+
+async def _adjust_refs(counts: Dict[str, int]):
+    if not counts:
+        return
+    now = datetime.now(timezone.utc)
+    await db.blobs.bulk_write([
+        UpdateOne({"_id": sha256}, {"$inc": {"refCount": n}, "$set": {"updatedAt": now}})
+        for sha256, n in counts.items() if n
+    ], ordered=False)
+
+
+def _count(sha256s: Iterable[Optional[str]]) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for sha256 in sha256s:
+        if sha256:
+            counts[sha256] = counts.get(sha256, 0) + 1
+    return counts
+
+
+async def add_refs(sha256s: Iterable[Optional[str]]):
+    await _adjust_refs(_count(sha256s))
+
+
+async def release_refs(sha256s: Iterable[Optional[str]]):
+    await _adjust_refs({sha256: -n for sha256, n in _count(sha256s).items()})
+
+
+def _sha256_from_url(url: Any) -> Optional[str]:
+    # Keys are blobs/ab/cd/<sha256><ext>, whatever base URL they are served under
+    if not isinstance(url, str) or f"/{BLOB_PREFIX}/" not in url:
+        return None
+    sha256 = url.rsplit("/", 1)[-1].split(".", 1)[0]
+    return sha256 if _SHA256.fullmatch(sha256) else None
+
+
+def _image_sha256_from_url(url: Any) -> Optional[str]:
+    # Images are usually referenced by a resized variant, blobs/ab/cd/<sha256>_<name>.webp
+    if not isinstance(url, str) or f"/{BLOB_PREFIX}/" not in url:
+        return None
+    sha256 = url.rsplit("/", 1)[-1].split(".", 1)[0].split("_", 1)[0]
+    return sha256 if _SHA256.fullmatch(sha256) else None
+
+
+async def image_sha256(url: Optional[str]) -> Optional[str]:
+    """The stored blob an image URL (original or variant) points at, if any."""
+    sha256 = _image_sha256_from_url(url)
+    if sha256 and await db.blobs.find_one({"_id": sha256, "deletingAt": {"$exists": False}}, {"_id": 1}):
+        return sha256
+    return None
+
+
+async def verify_attachments(attachments: List[Dict[str, Any]]):
+    """Set each attachment's sha256 from the stored blob its url points at.
+
+    The sha256 decides which blob a message holds a reference to, so the
+    client's value is never used. Attachments outside the store get None.
+    """
+    shas = {a.get("url"): _sha256_from_url(a.get("url")) for a in attachments}
+    keys: Dict[str, str] = {}
+    wanted = [sha256 for sha256 in shas.values() if sha256]
+    if wanted:
+        async for blob in db.blobs.find({"_id": {"$in": wanted}, "deletingAt": {"$exists": False}}, {"key": 1}):
+            keys[blob["_id"]] = blob["key"]
+    for attachment in attachments:
+        sha256 = shas[attachment.get("url")]
+        stored = sha256 in keys and attachment["url"].endswith(f"/{keys[sha256]}")
+        attachment["sha256"] = sha256 if stored else None
+
+
+async def release_message_attachments(query: Dict[str, Any]):
+    """Drop the references held by the messages matching query (call before deleting them)."""
+    pipeline = [
+        {"$match": {**query, "attachments.sha256": {"$exists": True}}},
+        {"$unwind": "$attachments"},
+        {"$match": {"attachments.sha256": {"$exists": True}}},
+        {"$group": {"_id": "$attachments.sha256", "n": {"$sum": 1}}}
+    ]
+    counts = {row["_id"]: -row["n"] async for row in db.messages.aggregate(pipeline)}
+    await _adjust_refs(counts)
+
+
+async def release_post_covers(query: Dict[str, Any]):
+    """Drop the cover references held by the posts matching query (call before deleting them)."""
+    posts = await db.posts.find({**query, "coverSha256": {"$type": "string"}}, {"_id": 0, "coverSha256": 1}).to_list(None)
+    await release_refs(p["coverSha256"] for p in posts)
+
+
+async def collect_garbage(lease=None) -> Dict[str, Any]:
+    """Delete blobs nobody has referenced for the grace period.
+
+    Each blob is first claimed by setting a deletingAt tombstone, then its
+    files are deleted, then the document. store_upload never revives a
+    tombstoned blob (see _claim_for_upload), so an upload of the same
+    content can't end up pointing at files GC is about to remove.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=BLOB_GC_GRACE_HOURS)
+    deleted = 0
+    freed = 0
+    while True:
+        if lease and not await lease.is_valid():
+            return {"deleted": deleted, "freedBytes": freed, "fenced": True}
+        now = datetime.now(timezone.utc)
+        # Tombstones older than the timeout belong to a GC run that died midway
+        claimable = {
+            "refCount": {"$lte": 0},
+            "updatedAt": {"$lt": cutoff},
+            "$or": [
+                {"deletingAt": {"$exists": False}},
+                {"deletingAt": {"$lt": now - timedelta(seconds=BLOB_TOMBSTONE_TIMEOUT)}}
+            ]
+        }
+        candidates = await db.blobs.find(claimable, {"_id": 1}).limit(BLOB_GC_BATCH_SIZE).to_list(BLOB_GC_BATCH_SIZE)
+        if not candidates:
+            break
+        for candidate in candidates:
+            # A blob referenced or claimed meanwhile no longer matches
+            claimed = await db.blobs.find_one_and_update(
+                {**claimable, "_id": candidate["_id"]},
+                {"$set": {"deletingAt": now}},
+                return_document=ReturnDocument.AFTER
+            )
+            if not claimed:
+                continue
+            try:
+                for key in [claimed["key"], *(claimed.get("variants") or {}).values()]:
+                    await backend.delete(key)
+            except Exception as e:
+                # The tombstone stays, so a later run retries once it goes stale
+                logger.error(f"Failed to delete blob {claimed['key']}: {e}")
+                continue
+            await db.blobs.delete_one({"_id": claimed["_id"], "deletingAt": claimed["deletingAt"]})
+            deleted += 1
+            freed += claimed.get("size", 0)
+    logger.info(f"Blob GC: deleted {deleted} blobs, freed {freed} bytes")
+    return {"deleted": deleted, "freedBytes": freed}
@@ -0,0 +1,154 @@
+import asyncio
+import functools
+import logging
+import random
+import time
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Each TTL is spread by up to this fraction so keys filled together don't expire together
+CACHE_TTL_JITTER = 0.1
+CACHE_MAX_ENTRIES = 2000
+
+
+class _Entry:
+    __slots__ = ("value", "fresh_until", "stale_until")
+
+    def __init__(self, value: Any, fresh_until: float, stale_until: float):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+
+def _freeze(value: Any) -> Hashable:
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(v) for v in value)
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return repr(value)
+
+
+class ResponseCache:
+    """In-process TTL cache for results that are the same for every caller.
+
+    - Single flight: while a key is being computed, other callers await that
+      computation instead of starting their own.
+    - Stale-while-revalidate: for `stale` seconds after expiry the old value
+      is returned at once and refreshed in the background.
+    - invalidate(namespace) drops a namespace after a write. A computation
+      that started before the invalidation is not stored.
+
+    Values are shared between callers and must not be mutated. The cache is
+    per worker, so invalidation only reaches this worker's copy; the TTL
+    bounds how stale the others can be.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: Dict[Tuple[str, Hashable], _Entry] = {}
+        self._inflight: Dict[Tuple[str, Hashable], asyncio.Task] = {}
+        self._generations: Dict[str, int] = defaultdict(int)
+        self._stats: Dict[str, Dict[str, int]] = defaultdict(
+            lambda: {"hits": 0, "stale": 0, "misses": 0, "coalesced": 0, "errors": 0}
+        )
+
+    async def get(self, namespace: str, key: Hashable, compute: Callable[[], Awaitable[Any]], ttl: float, stale: float = 0) -> Any:
+        full_key = (namespace, key)
+        stats = self._stats[namespace]
+        entry = self._entries.get(full_key)
+        now = time.monotonic()
+        if entry is not None:
+            if now < entry.fresh_until:
+                stats["hits"] += 1
+                return entry.value
+            if now < entry.stale_until:
+                stats["stale"] += 1
+                self._refresh(full_key, compute, ttl, stale)
+                return entry.value
+        stats["coalesced" if full_key in self._inflight else "misses"] += 1
+        # Shielded so one caller disconnecting doesn't cancel the shared computation
+        return await asyncio.shield(self._refresh(full_key, compute, ttl, stale))
+
+    def _refresh(self, full_key: Tuple[str, Hashable], compute, ttl: float, stale: float) -> asyncio.Task:
+        task = self._inflight.get(full_key)
+        if task is None:
+            task = asyncio.ensure_future(self._compute(full_key, compute, ttl, stale))
+            self._inflight[full_key] = task
+            task.add_done_callback(lambda t: self._finish(full_key, t))
+        return task
+
+    def _finish(self, full_key: Tuple[str, Hashable], task: asyncio.Task):
+        if self._inflight.get(full_key) is task:
+            del self._inflight[full_key]
+        if not task.cancelled() and task.exception() is not None:
+            self._stats[full_key[0]]["errors"] += 1
+            logger.error(f"Computing cached {full_key[0]} {full_key[1]!r} failed: {task.exception()}")
+
+    async def _compute(self, full_key: Tuple[str, Hashable], compute, ttl: float, stale: float) -> Any:
+        namespace = full_key[0]
+        generation = self._generations[namespace]
+        value = await compute()
+        if self._generations[namespace] == generation:
+            ttl *= random.uniform(1 - CACHE_TTL_JITTER, 1 + CACHE_TTL_JITTER)
+            now = time.monotonic()
+            self._entries[full_key] = _Entry(value, now + ttl, now + ttl + stale)
+            self._evict(now)
+        return value
+
+    def _evict(self, now: float):
+        if len(self._entries) <= self.max_entries:
+            return
+        for full_key in [k for k, e in self._entries.items() if e.stale_until <= now]:
+            del self._entries[full_key]
+        # Still full: drop the oldest insertions
+        while len(self._entries) > self.max_entries:
+            del self._entries[next(iter(self._entries))]
+
+    def invalidate(self, *namespaces: str):
+        for namespace in namespaces:
+            self._generations[namespace] += 1
+            for full_key in [k for k in self._entries if k[0] == namespace]:
+                del self._entries[full_key]
+            # Later callers start a fresh computation instead of joining one that may be outdated
+            for full_key in [k for k in self._inflight if k[0] == namespace]:
+                del self._inflight[full_key]
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        sizes: Dict[str, int] = defaultdict(int)
+        for namespace, _ in self._entries:
+            sizes[namespace] += 1
+        metrics = {}
+        for namespace, stats in self._stats.items():
+            served = stats["hits"] + stats["stale"] + stats["misses"] + stats["coalesced"]
+            metrics[namespace] = {
+                **stats,
+                "entries": sizes.get(namespace, 0),
+                "hitRate": round((stats["hits"] + stats["stale"]) / served, 4) if served else None
+            }
+        return metrics
+
+
+response_cache = ResponseCache()
+
+
+def cached(namespace: str, ttl: float, stale: float = 0, vary: Optional[Iterable[str]] = None):
+    """Cache an async route handler's result in response_cache.
+
+    The key is built from the handler's keyword arguments, or only the ones
+    named in `vary`. Only use it on handlers whose result doesn't depend on
+    the caller.
+    """
+    vary = tuple(vary) if vary is not None else None
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            params = kwargs if vary is None else {name: kwargs.get(name) for name in vary}
+            key = tuple(sorted((name, _freeze(value)) for name, value in params.items()))
+            return await response_cache.get(namespace, key, lambda: func(*args, **kwargs), ttl, stale)
+        return wrapper
+    return decorator
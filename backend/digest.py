@@ -0,0 +1,203 @@
+import heapq
+import logging
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, List, Set
+
+from database import db
+from email_service import render_weekly_digest, outbox_email, enqueue_emails
+
+logger = logging.getLogger(__name__)
+
+DIGEST_BATCH_SIZE = 500
+DIGEST_POSTS_PER_USER = 5
+DIGEST_QUESTIONS_PER_USER = 3
+# Candidates loaded per followed author or tag. A user's picks are their best
+# matches across their keys, so the top few of each key cover them; the slack is
+# for the user's own posts, which are skipped
+DIGEST_CANDIDATES_PER_KEY = 2 * DIGEST_POSTS_PER_USER
+DIGEST_WINDOW_DAYS = 7
+
+POST_SCORE = {"$add": [
+    {"$multiply": [{"$size": {"$ifNull": ["$likes", []]}}, 2]},
+    {"$ifNull": ["$commentsCount", 0]},
+    {"$multiply": [{"$ifNull": ["$views", 0]}, 0.1]}
+]}
+QUESTION_SCORE = {"$add": [
+    {"$multiply": [{"$size": {"$ifNull": ["$upvotes", []]}}, 2]},
+    {"$multiply": [{"$ifNull": ["$views", 0]}, 0.1]}
+]}
+SCORE_ORDER = {"score": -1, "createdAt": -1}
+
+DIGEST_USER_PROJECTION = {
+    "_id": 0, "id": 1, "email": 1, "username": 1,
+    "following": 1, "followingTags": 1, "interests": 1
+}
+
+
+async def ensure_indexes():
+    await db.users.create_index([("settings.notifications.weeklyDigest", 1), ("id", 1)])
+
+
+def _rank_index(items: List[Dict[str, Any]], key: str) -> Dict[str, List[int]]:
+    # key -> ascending list of positions in the score-sorted candidate list
+    index: Dict[str, List[int]] = {}
+    for position, item in enumerate(items):
+        values = item.get(key)
+        if isinstance(values, list):
+            for value in values:
+                index.setdefault(value, []).append(position)
+        elif values is not None:
+            index.setdefault(values, []).append(position)
+    return index
+
+
+def _top_matches(indexes: List[Dict[str, List[int]]], keys: List[Set[str]], limit: int, exclude=None) -> List[int]:
+    lists = [index[k] for index, ks in zip(indexes, keys) for k in ks if k in index]
+    picked: List[int] = []
+    for position in heapq.merge(*lists):
+        if picked and picked[-1] == position:
+            continue
+        if exclude and exclude(position):
+            continue
+        picked.append(position)
+        if len(picked) >= limit:
+            break
+    return picked
+
+
+async def _top_per_key(collection, match: Dict[str, Any], fields: Dict[str, Any], key: str, values: Set[str]) -> List[Dict[str, Any]]:
+    # The DIGEST_CANDIDATES_PER_KEY best documents for each of `values` of `key` (a field or an array field)
+    if not values:
+        return []
+    values = list(values)
+    return await collection.aggregate([
+        {"$match": {**match, key: {"$in": values}}},
+        {"$project": {**fields, "_key": f"${key}"}},
+        {"$unwind": "$_key"},
+        {"$match": {"_key": {"$in": values}}},
+        {"$group": {"_id": "$_key", "top": {"$topN": {
+            "n": DIGEST_CANDIDATES_PER_KEY, "sortBy": SCORE_ORDER, "output": "$$ROOT"
+        }}}},
+        {"$unwind": "$top"},
+        {"$replaceRoot": {"newRoot": "$top"}},
+        {"$project": {"_key": 0}}
+    ]).to_list(None)
+
+
+def _by_score(*candidate_lists: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # One copy of each document, best first, as _rank_index expects
+    unique = {doc["id"]: doc for docs in candidate_lists for doc in docs}
+    return sorted(unique.values(), key=lambda doc: (doc["score"], doc["createdAt"]), reverse=True)
+
+
+async def _load_candidates(users: List[Dict[str, Any]], since: str):
+    authors: Set[str] = set()
+    tags: Set[str] = set()
+    interests: Set[str] = set()
+    for user in users:
+        authors.update(user.get("following") or [])
+        tags.update(user.get("followingTags") or [])
+        interests.update(user.get("interests") or [])
+        interests.update(user.get("followingTags") or [])
+
+    post_match = {"published": True, "createdAt": {"$gte": since}}
+    post_fields = {"_id": 0, "id": 1, "title": 1, "authorId": 1, "tags": 1, "createdAt": 1, "score": POST_SCORE}
+    posts = _by_score(
+        await _top_per_key(db.posts, post_match, post_fields, "authorId", authors),
+        await _top_per_key(db.posts, post_match, post_fields, "tags", tags)
+    )
+
+    question_match = {"status": "open", "createdAt": {"$gte": since}}
+    question_fields = {"_id": 0, "id": 1, "title": 1, "userId": 1, "tags": 1, "createdAt": 1, "score": QUESTION_SCORE}
+    questions = _by_score(await _top_per_key(db.questions, question_match, question_fields, "tags", interests))
+
+    return posts, questions
+
+
+async def build_digest_batch(users: List[Dict[str, Any]], since: str) -> List[Dict[str, Any]]:
+    posts, questions = await _load_candidates(users, since)
+
+    by_author = _rank_index(posts, "authorId")
+    by_tag = _rank_index(posts, "tags")
+    questions_by_tag = _rank_index(questions, "tags")
+
+    selections = []
+    author_ids: Set[str] = set()
+    for user in users:
+        user_id = user["id"]
+        post_positions = _top_matches(
+            [by_author, by_tag],
+            [set(user.get("following") or []), set(user.get("followingTags") or [])],
+            DIGEST_POSTS_PER_USER,
+            exclude=lambda i: posts[i]["authorId"] == user_id
+        )
+        if not post_positions:
+            continue
+        question_positions = _top_matches(
+            [questions_by_tag],
+            [set(user.get("interests") or []) | set(user.get("followingTags") or [])],
+            DIGEST_QUESTIONS_PER_USER,
+            exclude=lambda i: questions[i]["userId"] == user_id
+        )
+        selections.append((user, post_positions, question_positions))
+        author_ids.update(posts[i]["authorId"] for i in post_positions)
+
+    authors = {}
+    if author_ids:
+        author_docs = await db.users.find(
+            {"id": {"$in": list(author_ids)}}, {"_id": 0, "id": 1, "name": 1}
+        ).to_list(len(author_ids))
+        authors = {a["id"]: a.get("name") for a in author_docs}
+
+    emails = []
+    for user, post_positions, question_positions in selections:
+        user_posts = [{**posts[i], "authorName": authors.get(posts[i]["authorId"])} for i in post_positions]
+        user_questions = [questions[i] for i in question_positions]
+        body = render_weekly_digest(user["username"], user_posts, user_questions)
+        emails.append(outbox_email("weekly_digest", user["email"], "Your weekly DevConnect digest", body))
+    return emails
+
+
+async def run_weekly_digest(lease=None) -> Dict[str, Any]:
+    started = time.perf_counter()
+    now = datetime.now(timezone.utc)
+    since = (now - timedelta(days=DIGEST_WINDOW_DAYS)).isoformat()
+    # Users digested in the last few days are skipped, so a rerun after a crash resumes instead of resending
+    resend_cutoff = (now - timedelta(days=DIGEST_WINDOW_DAYS - 1)).isoformat()
+
+    stats = {"users": 0, "emails": 0, "batches": 0}
+    last_id = None
+    while True:
+        query: Dict[str, Any] = {
+            "settings.notifications.weeklyDigest": True,
+            "$or": [{"lastDigestAt": {"$exists": False}}, {"lastDigestAt": {"$lt": resend_cutoff}}]
+        }
+        if last_id:
+            query["id"] = {"$gt": last_id}
+        users = await db.users.find(query, DIGEST_USER_PROJECTION).sort("id", 1).limit(DIGEST_BATCH_SIZE).to_list(DIGEST_BATCH_SIZE)
+        if not users:
+            break
+        last_id = users[-1]["id"]
+
+        if lease and not await lease.is_valid():
+            stats["fenced"] = True
+            break
+
+        emails = await build_digest_batch(users, since)
+        stats["emails"] += await enqueue_emails(emails)
+        await db.users.update_many(
+            {"id": {"$in": [u["id"] for u in users]}},
+            {"$set": {"lastDigestAt": now.isoformat()}}
+        )
+        stats["users"] += len(users)
+        stats["batches"] += 1
+
+    elapsed = time.perf_counter() - started
+    stats["elapsedSeconds"] = round(elapsed, 2)
+    stats["usersPerSecond"] = round(stats["users"] / elapsed, 1) if elapsed > 0 else 0
+    logger.info(
+        f"Weekly digest: {stats['users']} users, {stats['emails']} emails queued "
+        f"in {stats['elapsedSeconds']}s ({stats['usersPerSecond']} users/s)"
+    )
+    return stats
@@ -1,8 +1,16 @@
 import os
+import asyncio
+import logging
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from html import escape
 from fastapi_mail import FastMail, MessageSchema, ConnectionConfig, MessageType
 from pydantic import EmailStr
-from typing import List
+from typing import List, Dict, Any
+from pymongo import UpdateOne
 from dotenv import load_dotenv
+from database import db
 
 load_dotenv()
 
@@ -49,9 +57,8 @@ async def send_streak_reminder(email: str, username: str, streak: int):
     """
     await send_email(subject, [email], body)
 
-async def send_new_content_notification(email: str, username: str, post_title: str, tags: List[str], post_id: str):
-    subject = f"New post in #{tags[0]}: {post_title}"
-    body = f"""
+def render_new_content(username: str, post_title: str, tags: List[str], post_id: str) -> str:
+    return f"""
     <html>
         <body>
             <h2>Hi {username},</h2>
@@ -63,6 +70,13 @@ async def send_new_content_notification(email: str, username: str, post_title: s
         </body>
     </html>
     """
+
+def new_content_subject(post_title: str, tags: List[str]) -> str:
+    return f"New post in #{tags[0]}: {post_title}"
+
+async def send_new_content_notification(email: str, username: str, post_title: str, tags: List[str], post_id: str):
+    subject = new_content_subject(post_title, tags)
+    body = render_new_content(username, post_title, tags, post_id)
     await send_email(subject, [email], body)
 
 async def send_welcome_email(email: str, username: str):
@@ -99,3 +113,113 @@ async def send_new_follower_email(email: str, username: str, follower_name: str)
     </html>
     """
     await send_email(subject, [email], body)
+
+def render_weekly_digest(username: str, posts: List[Dict[str, Any]], questions: List[Dict[str, Any]]) -> str:
+    post_items = "".join(
+        f"""<li><a href="http://localhost:3000/posts/{p['id']}">{escape(p['title'])}</a>"""
+        f"""{' by ' + escape(p['authorName']) if p.get('authorName') else ''}</li>"""
+        for p in posts
+    )
+    question_items = "".join(
+        f"""<li><a href="http://localhost:3000/questions/{q['id']}">{escape(q['title'])}</a></li>"""
+        for q in questions
+    )
+    questions_section = f"""
+            <h3>Questions waiting for an answer</h3>
+            <ul>{question_items}</ul>""" if questions else ""
+    return f"""
+    <html>
+        <body>
+            <h2>Hi {escape(username)},</h2>
+            <p>Here's what happened this week in the topics and people you follow.</p>
+            <h3>Top posts</h3>
+            <ul>{post_items}</ul>{questions_section}
+            <br>
+            <a href="http://localhost:3000/feed" style="background-color: #0ea5e9; color: white; padding: 10px 20px; text-decoration: none; border-radius: 5px;">Open your feed</a>
+        </body>
+    </html>
+    """
+
+# ====================
+# Outbox
+# ====================
+# Bulk producers (digests, fan-out notifications) insert emails here instead of
+# sending inline; the scheduled deliver_outbox job drains it.
+
+OUTBOX_MAX_ATTEMPTS = 5
+# A failed send is retried after 1, 2, 4, 8... minutes (with a little jitter)
+OUTBOX_RETRY_BASE_SECONDS = 60
+OUTBOX_RETRY_JITTER = 0.1
+
+def retry_delay(attempts: int) -> timedelta:
+    delay = OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+    return timedelta(seconds=delay * random.uniform(1 - OUTBOX_RETRY_JITTER, 1 + OUTBOX_RETRY_JITTER))
+
+def outbox_email(kind: str, email: str, subject: str, body: str) -> Dict[str, Any]:
+    now = datetime.now(timezone.utc)
+    return {
+        "id": str(uuid.uuid4()),
+        "kind": kind,
+        "to": email,
+        "subject": subject,
+        "body": body,
+        "status": "pending",
+        "attempts": 0,
+        "nextAttemptAt": now,
+        "createdAt": now
+    }
+
+async def enqueue_emails(emails: List[Dict[str, Any]]) -> int:
+    if not emails:
+        return 0
+    result = await db.email_outbox.insert_many(emails, ordered=False)
+    return len(result.inserted_ids)
+
+async def ensure_outbox_indexes():
+    await db.email_outbox.create_index([("status", 1), ("nextAttemptAt", 1)])
+    # Emails queued before retries were scheduled are due straight away
+    await db.email_outbox.update_many(
+        {"status": "pending", "nextAttemptAt": {"$exists": False}},
+        [{"$set": {"nextAttemptAt": "$createdAt"}}]
+    )
+
+async def deliver_outbox(lease=None, batch_size: int = 200, concurrency: int = 10, max_emails: int = 5000):
+    semaphore = asyncio.Semaphore(concurrency)
+    stats = {"sent": 0, "failed": 0}
+
+    async def deliver(email):
+        async with semaphore:
+            return await send_email(email["subject"], [email["to"]], email["body"])
+
+    while stats["sent"] + stats["failed"] < max_emails:
+        if lease and not await lease.is_valid():
+            break
+        # Emails waiting out a retry delay are left for a later run
+        batch = await db.email_outbox.find(
+            {"status": "pending", "nextAttemptAt": {"$lte": datetime.now(timezone.utc)}}
+        ).sort("nextAttemptAt", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+
+        results = await asyncio.gather(*(deliver(email) for email in batch))
+
+        updates = []
+        now = datetime.now(timezone.utc)
+        for email, ok in zip(batch, results):
+            attempts = email.get("attempts", 0) + 1
+            update = {"attempts": attempts, "updatedAt": now}
+            if ok:
+                update["status"] = "sent"
+                stats["sent"] += 1
+            elif attempts >= OUTBOX_MAX_ATTEMPTS:
+                update["status"] = "failed"
+                stats["failed"] += 1
+            else:
+                update["nextAttemptAt"] = now + retry_delay(attempts)
+                stats["failed"] += 1
+            updates.append(UpdateOne({"_id": email["_id"]}, {"$set": update}))
+        await db.email_outbox.bulk_write(updates, ordered=False)
+
+    if stats["sent"] or stats["failed"]:
+        logging.info(f"Email outbox: sent {stats['sent']}, failed {stats['failed']}")
+    return stats
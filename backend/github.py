@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Point GITHUB_API_URL at a local fake to exercise this without touching GitHub
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+GITHUB_TOKEN = os.environ.get("GITHUB_TOKEN")
+
+# Repos younger than this are served as-is; older ones (up to the stale limit)
+# are served immediately while a background refresh revalidates them
+GITHUB_FRESH_SECONDS = 10 * 60
+GITHUB_STALE_SECONDS = 24 * 60 * 60
+GITHUB_CACHE_SIZE = 5000
+GITHUB_REPO_COUNT = 6
+# Back-off used when GitHub fails without saying when to come back
+GITHUB_ERROR_BACKOFF_SECONDS = 60
+_USERNAME = re.compile(r"^[A-Za-z0-9](?:[A-Za-z0-9-]{0,38})$")
+
+
+class _CachedRepos:
+    __slots__ = ("repos", "etag", "fetched_at")
+
+    def __init__(self, repos: List[Dict[str, Any]], etag: Optional[str], fetched_at: float):
+        self.repos = repos
+        self.etag = etag
+        self.fetched_at = fetched_at
+
+
+def _summarize(repo: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "name": repo["name"],
+        "description": repo["description"],
+        "language": repo["language"],
+        "stars": repo["stargazers_count"],
+        "url": repo["html_url"],
+        "updatedAt": repo["updated_at"]
+    }
+
+
+class GitHubClient:
+    """Cached access to users' public repositories.
+
+    One pooled httpx client is shared by every request (opened and closed in
+    the app lifespan). Results are cached per GitHub username and revalidated
+    with If-None-Match, so an unchanged list costs a 304 instead of a full
+    response and, when authenticated, no rate limit. Concurrent misses for the
+    same username share one upstream request. The cache is per worker.
+    """
+
+    def __init__(self, base_url: str = GITHUB_API_URL, token: Optional[str] = GITHUB_TOKEN):
+        self.base_url = base_url
+        self.token = token
+        self._client: Optional[httpx.AsyncClient] = None
+        self._cache: "OrderedDict[str, _CachedRepos]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._blocked_until = 0.0
+        self.stats = {"hits": 0, "stale": 0, "misses": 0, "notModified": 0, "errors": 0}
+
+    async def start(self):
+        headers = {"User-Agent": "DevConnect-App", "Accept": "application/vnd.github+json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            headers=headers,
+            timeout=httpx.Timeout(5.0, connect=3.0),
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10)
+        )
+
+    async def close(self):
+        for task in list(self._inflight.values()):
+            task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get_repos(self, username: str) -> List[Dict[str, Any]]:
+        key = username.lower()
+        entry = self._cache.get(key)
+        if entry is not None:
+            self._cache.move_to_end(key)
+            age = time.monotonic() - entry.fetched_at
+            if age < GITHUB_FRESH_SECONDS:
+                self.stats["hits"] += 1
+                return entry.repos
+            if age < GITHUB_STALE_SECONDS:
+                self.stats["stale"] += 1
+                self._refresh(key)
+                return entry.repos
+        self.stats["misses"] += 1
+        try:
+            return await asyncio.shield(self._refresh(key))
+        except Exception:
+            # Already logged when the shared fetch finished
+            return entry.repos if entry is not None else []
+
+    def _refresh(self, key: str) -> asyncio.Task:
+        # Single flight: every caller for this username waits on the same request
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        return task
+
+    def _finish(self, key: str, task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Failed to fetch GitHub repos for {key}: {task.exception()}")
+
+    async def _fetch(self, key: str) -> List[Dict[str, Any]]:
+        entry = self._cache.get(key)
+        now = time.monotonic()
+        if now < self._blocked_until:
+            if entry is not None:
+                return entry.repos
+            raise RuntimeError("GitHub rate limit exhausted")
+        if self._client is None:
+            await self.start()
+
+        headers = {"If-None-Match": entry.etag} if entry is not None and entry.etag else {}
+        response = await self._client.get(
+            f"/users/{key}/repos",
+            params={"sort": "updated", "per_page": GITHUB_REPO_COUNT},
+            headers=headers
+        )
+
+        if response.status_code == 304 and entry is not None:
+            self.stats["notModified"] += 1
+            entry.fetched_at = now
+            return entry.repos
+        if response.status_code == 200:
+            repos = [_summarize(repo) for repo in response.json()]
+            self._store(key, _CachedRepos(repos, response.headers.get("etag"), now))
+            return repos
+        if response.status_code == 404:
+            # Unknown GitHub user; cache the empty answer like any other
+            self._store(key, _CachedRepos([], None, now))
+            return []
+
+        self.stats["errors"] += 1
+        self._back_off(response)
+        raise RuntimeError(f"GitHub API error: {response.status_code} - {response.text[:200]}")
+
+    def _store(self, key: str, entry: _CachedRepos):
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > GITHUB_CACHE_SIZE:
+            self._cache.popitem(last=False)
+
+    def _back_off(self, response: httpx.Response):
+        # Stop calling GitHub until the rate limit window resets
+        retry_after = response.headers.get("retry-after")
+        reset = response.headers.get("x-ratelimit-reset")
+        delay = GITHUB_ERROR_BACKOFF_SECONDS
+        if retry_after and retry_after.isdigit():
+            delay = int(retry_after)
+        elif reset and reset.isdigit() and response.headers.get("x-ratelimit-remaining") == "0":
+            delay = max(int(reset) - time.time(), 0)
+        self._blocked_until = time.monotonic() + delay
+
+
+def parse_github_username(github_url: Optional[str]) -> Optional[str]:
+    # Accepts https://github.com/user, github.com/user or a bare user name
+    if not github_url:
+        return None
+    name = github_url.strip().rstrip("/").split("/")[-1]
+    return name if _USERNAME.match(name) else None
+
+
+github = GitHubClient()
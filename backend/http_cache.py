@@ -0,0 +1,47 @@
+import hashlib
+from typing import Any, Dict, Iterable, Optional
+
+from fastapi import Request, Response
+
+# Clients may keep a copy but must revalidate it on every use
+PUBLIC_REVALIDATE = "public, no-cache"
+PRIVATE_REVALIDATE = "private, no-cache"
+
+
+def document_etag(doc: Dict[str, Any], exclude: Iterable[str] = ()) -> str:
+    """Weak ETag over a document's fields, minus the ones in `exclude`.
+
+    Fields like likes or followers change without bumping updatedAt, so every
+    field takes part; view counters are excluded so reads don't invalidate.
+    """
+    excluded = set(exclude)
+    digest = hashlib.blake2b(digest_size=16)
+    for key in sorted(doc):
+        if key not in excluded:
+            digest.update(f"{key}\x1f{doc[key]!r}\x1e".encode())
+    return f'W/"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as If-None-Match requires
+    tag = etag.removeprefix("W/")
+    return tag in [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+
+
+def conditional_response(request: Request, response: Response, etag: str, cache_control: str = PUBLIC_REVALIDATE) -> Optional[Response]:
+    """Return a 304 if the client's copy is current, else set validators on `response`.
+
+    Handlers return the 304 as-is, skipping response-model validation and
+    serialization of the body.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if cache_control.startswith("private"):
+        headers["Vary"] = "Authorization"
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -0,0 +1,140 @@
+import asyncio
+import io
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels for each variant; all variants are WebP without metadata
+AVATAR_VARIANTS = {"sm": 64, "md": 256}
+COVER_VARIANTS = {"thumb": 480, "display": 1600}
+ATTACHMENT_VARIANTS = {"thumb": 320, "display": 1280}
+
+WEBP_QUALITY = 80
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "2"))
+
+# Image info keys holding metadata that is removed from stored originals
+METADATA_KEYS = ("exif", "xmp", "XML:com.adobe.xmp")
+
+# Formats Pillow is asked to decode; anything else is stored as a plain file
+PROCESSABLE_TYPES = {"image/jpeg", "image/png", "image/webp", "image/gif", "image/bmp", "image/tiff"}
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    # Decoding and resizing are CPU bound, so they run outside the event loop's process
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _executor
+
+
+def _reset_executor(broken: ProcessPoolExecutor):
+    # Concurrent callers may all see the same broken pool; only the first replaces it
+    global _executor
+    if _executor is broken:
+        _executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _render_variants(source: str, variants: Dict[str, int], quality: int) -> Dict[str, bytes]:
+    """Runs in a worker process: decode once, emit one WebP per variant."""
+    try:
+        with Image.open(source) as image:
+            image.load()
+            # Bake in the camera orientation; EXIF itself is not carried over
+            image = ImageOps.exif_transpose(image)
+    except Exception as e:
+        raise InvalidImage(str(e))
+
+    has_alpha = image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+
+    rendered: Dict[str, bytes] = {}
+    for name, max_edge in variants.items():
+        variant = image.copy()
+        variant.thumbnail((max_edge, max_edge), Image.LANCZOS)
+        out = io.BytesIO()
+        variant.save(out, "WEBP", quality=quality, method=4)
+        rendered[name] = out.getvalue()
+    return rendered
+
+
+def _strip_metadata(source: str) -> Optional[int]:
+    """Runs in a worker process: rewrite an image without EXIF/XMP.
+
+    The orientation is baked in first, since dropping EXIF drops it too. The
+    colour profile is kept. Returns the new size, or None if the file had no
+    metadata to remove and was left alone.
+    """
+    temp_path = f"{source}.clean"
+    try:
+        with Image.open(source) as image:
+            image_format = image.format
+            if not image.getexif() and not any(key in image.info for key in METADATA_KEYS):
+                return None
+            image.load()
+            icc_profile = image.info.get("icc_profile")
+            params: Dict[str, Any] = {"format": image_format}
+            if icc_profile:
+                params["icc_profile"] = icc_profile
+            if getattr(image, "n_frames", 1) > 1:
+                # Animations keep their frames; orientation tags are rare enough on them to skip
+                cleaned, params["save_all"] = image, True
+            else:
+                cleaned = ImageOps.exif_transpose(image)
+            if image_format == "JPEG":
+                # Reuse the original quantization tables when the pixels weren't rotated
+                params["quality"] = "keep" if cleaned is image else 95
+            elif image_format == "WEBP":
+                params["quality"] = 95
+            cleaned.save(temp_path, **params)
+    except Exception as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise InvalidImage(str(e))
+    os.replace(temp_path, source)
+    return os.path.getsize(source)
+
+
+def is_processable(content_type: Optional[str]) -> bool:
+    return (content_type or "").lower() in PROCESSABLE_TYPES
+
+
+async def _run(func: Callable, *args) -> Any:
+    loop = asyncio.get_running_loop()
+    executor = _get_executor()
+    try:
+        return await loop.run_in_executor(executor, func, *args)
+    except BrokenProcessPool:
+        # A worker died (OOM kill, decoder crash) and the pool refuses all work
+        # from then on; replace it and retry once
+        logger.warning("Image worker pool broke; restarting it")
+        _reset_executor(executor)
+        return await loop.run_in_executor(_get_executor(), func, *args)
+
+
+async def render_variants(source: Path, variants: Dict[str, int]) -> Dict[str, bytes]:
+    return await _run(_render_variants, str(source), variants, WEBP_QUALITY)
+
+
+async def strip_metadata(source: Path) -> Optional[int]:
+    return await _run(_strip_metadata, str(source))
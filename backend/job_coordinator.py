@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# Unique per process, so two workers on the same host never share a lease
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+DEFAULT_LEASE_SECONDS = 300
+
+
+class JobLease:
+    """A Mongo-backed lease on a job name.
+
+    `token` is a fencing token: it increases every time the lease changes hands,
+    so a worker that stalled past its lease can detect that someone else took over.
+    """
+
+    def __init__(self, job_name: str, token: int, lease_seconds: int):
+        self.job_name = job_name
+        self.token = token
+        self.lease_seconds = lease_seconds
+
+    def _filter(self) -> Dict[str, Any]:
+        return {"_id": self.job_name, "owner": WORKER_ID, "token": self.token}
+
+    async def renew(self) -> bool:
+        now = datetime.now(timezone.utc)
+        result = await db.job_locks.update_one(
+            self._filter(),
+            {"$set": {"expiresAt": now + timedelta(seconds=self.lease_seconds), "renewedAt": now}}
+        )
+        return result.matched_count == 1
+
+    async def is_valid(self) -> bool:
+        # Jobs call this before side effects that must not happen twice
+        lock = await db.job_locks.find_one(
+            {**self._filter(), "expiresAt": {"$gt": datetime.now(timezone.utc)}},
+            {"_id": 1}
+        )
+        return lock is not None
+
+    async def release(self):
+        await db.job_locks.update_one(
+            self._filter(),
+            {"$set": {"expiresAt": datetime.now(timezone.utc), "releasedAt": datetime.now(timezone.utc)}}
+        )
+
+
+async def ensure_indexes():
+    await db.job_runs.create_index([("job", 1), ("startedAt", -1)])
+
+
+async def acquire_lease(job_name: str, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> Optional[JobLease]:
+    now = datetime.now(timezone.utc)
+    try:
+        lock = await db.job_locks.find_one_and_update(
+            {"_id": job_name, "expiresAt": {"$lte": now}},
+            {
+                "$set": {
+                    "owner": WORKER_ID,
+                    "acquiredAt": now,
+                    "expiresAt": now + timedelta(seconds=lease_seconds)
+                },
+                "$inc": {"token": 1}
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Another worker holds an unexpired lease, so the upsert collided with its document
+        return None
+    return JobLease(job_name, lock["token"], lease_seconds)
+
+
+async def _keep_alive(lease: JobLease):
+    while True:
+        await asyncio.sleep(max(lease.lease_seconds / 3, 1))
+        if not await lease.renew():
+            logger.warning(f"Lost lease on job {lease.job_name} (token {lease.token})")
+            return
+
+
+async def run_exclusive(
+    job_name: str,
+    func: Callable[[JobLease], Awaitable[Any]],
+    lease_seconds: int = DEFAULT_LEASE_SECONDS
+):
+    lease = await acquire_lease(job_name, lease_seconds)
+    if not lease:
+        logger.info(f"Skipping job {job_name}: lease held by another worker")
+        return None
+
+    run = {
+        "id": str(uuid.uuid4()),
+        "job": job_name,
+        "owner": WORKER_ID,
+        "token": lease.token,
+        "status": "running",
+        "startedAt": datetime.now(timezone.utc)
+    }
+    await db.job_runs.insert_one(run)
+
+    heartbeat = asyncio.create_task(_keep_alive(lease))
+    started = time.perf_counter()
+    status = "success"
+    error = None
+    result = None
+    try:
+        result = await func(lease)
+    except Exception as e:
+        status = "failed"
+        error = f"{type(e).__name__}: {e}"
+        logger.exception(f"Job {job_name} failed")
+    finally:
+        heartbeat.cancel()
+        await db.job_runs.update_one(
+            {"id": run["id"]},
+            {"$set": {
+                "status": status,
+                "error": error,
+                "result": result if isinstance(result, dict) else None,
+                "finishedAt": datetime.now(timezone.utc),
+                "durationMs": round((time.perf_counter() - started) * 1000, 1)
+            }}
+        )
+        await lease.release()
+    return result
+
+
+def coordinated(job_name: str, func: Callable[[JobLease], Awaitable[Any]], lease_seconds: int = DEFAULT_LEASE_SECONDS):
+    """Wrap a job so that only one worker in the deployment runs it at a time."""
+    async def runner():
+        return await run_exclusive(job_name, func, lease_seconds)
+    runner.__name__ = job_name
+    return runner
+
+
+async def get_job_status(runs_per_job: int = 10) -> Dict[str, Any]:
+    locks = await db.job_locks.find({}).to_list(100)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    jobs: Dict[str, Dict[str, Any]] = {}
+    for lock in locks:
+        expires_at = lock.get("expiresAt")
+        if expires_at is not None and expires_at.tzinfo is not None:
+            expires_at = expires_at.replace(tzinfo=None)
+        jobs[lock["_id"]] = {
+            "job": lock["_id"],
+            "owner": lock.get("owner"),
+            "token": lock.get("token", 0),
+            "locked": bool(expires_at and expires_at > now),
+            "expiresAt": lock.get("expiresAt"),
+            "runs": []
+        }
+
+    for job_name, job in jobs.items():
+        job["runs"] = await db.job_runs.find(
+            {"job": job_name}, {"_id": 0}
+        ).sort("startedAt", -1).limit(runs_per_job).to_list(runs_per_job)
+
+    return {"worker": WORKER_ID, "jobs": list(jobs.values())}
@@ -0,0 +1,97 @@
+import math
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from fastapi import HTTPException
+
+# List views ship an excerpt instead of the full body, and counts plus the
+# viewer's own like/bookmark/upvote flags instead of the member arrays. The
+# counts and flags are computed by Mongo in the projection, so the arrays are
+# never read off disk into the response. `fields=` picks any other subset.
+
+EXCERPT_LENGTH = 200  # same cut the editor uses when the author leaves it blank
+WORDS_PER_MINUTE = 200
+
+
+def make_excerpt(text: Optional[str], length: int = EXCERPT_LENGTH) -> str:
+    text = (text or "").strip()
+    return text if len(text) <= length else text[:length].rstrip() + "..."
+
+
+def reading_time(text: Optional[str]) -> int:
+    # Minutes, rounded up like the client's calculateReadTime
+    return max(1, math.ceil(len((text or "").split()) / WORDS_PER_MINUTE))
+
+
+def post_summary(post: Dict[str, Any]) -> Dict[str, Any]:
+    """Fields derived from a post's content, stored on create and update."""
+    return {
+        "excerpt": post.get("excerpt") or make_excerpt(post.get("content")),
+        "readingTime": reading_time(post.get("content"))
+    }
+
+
+def question_summary(question: Dict[str, Any]) -> Dict[str, Any]:
+    return {"excerpt": make_excerpt(question.get("description"))}
+
+
+def _size(field: str) -> Callable[[Optional[str]], Dict[str, Any]]:
+    return lambda viewer_id: {"$size": {"$ifNull": [f"${field}", []]}}
+
+
+def _contains_viewer(field: str) -> Callable[[Optional[str]], Dict[str, Any]]:
+    def expression(viewer_id: Optional[str]) -> Dict[str, Any]:
+        if viewer_id is None:
+            return {"$literal": False}
+        return {"$in": [viewer_id, {"$ifNull": [f"${field}", []]}]}
+    return expression
+
+
+POST_COMPUTED = {
+    "likesCount": _size("likes"),
+    "bookmarksCount": _size("bookmarks"),
+    "likedByMe": _contains_viewer("likes"),
+    "bookmarkedByMe": _contains_viewer("bookmarks")
+}
+# Depend on who is asking, so they are never part of a cached shared result
+POST_VIEWER_FIELDS = ("likedByMe", "bookmarkedByMe")
+POST_LIST_FIELDS = (
+    "id", "authorId", "title", "excerpt", "coverImage", "category", "tags", "views",
+    "commentsCount", "published", "readingTime", "createdAt", "updatedAt", *POST_COMPUTED
+)
+POST_FIELDS = frozenset(POST_LIST_FIELDS) | {"content", "likes", "bookmarks"}
+
+QUESTION_COMPUTED = {
+    "upvotesCount": _size("upvotes"),
+    "upvotedByMe": _contains_viewer("upvotes")
+}
+QUESTION_LIST_FIELDS = (
+    "id", "userId", "title", "excerpt", "tags", "status", "views", "createdAt", "updatedAt", *QUESTION_COMPUTED
+)
+QUESTION_FIELDS = frozenset(QUESTION_LIST_FIELDS) | {"description", "upvotes"}
+
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str], default: Iterable[str]) -> List[str]:
+    """`fields=a,b,c` -> the requested field names (id always included), or the list view."""
+    if not fields:
+        return list(default)
+    requested = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in requested if f not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return requested if "id" in requested else ["id", *requested]
+
+
+def projection(fields: Iterable[str], computed: Dict[str, Callable], viewer_id: Optional[str] = None) -> Dict[str, Any]:
+    """Mongo projection (find or $project) returning exactly `fields`."""
+    spec: Dict[str, Any] = {"_id": 0}
+    for field in fields:
+        spec[field] = computed[field](viewer_id) if field in computed else 1
+    return spec
+
+
+def post_projection(fields: Iterable[str], viewer_id: Optional[str] = None) -> Dict[str, Any]:
+    return projection(fields, POST_COMPUTED, viewer_id)
+
+
+def question_projection(fields: Iterable[str], viewer_id: Optional[str] = None) -> Dict[str, Any]:
+    return projection(fields, QUESTION_COMPUTED, viewer_id)
@@ -0,0 +1,207 @@
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from database import db
+from pagination import before_cursor_filter, next_cursor
+
+MESSAGE_PAGE_SIZE = 50
+MAX_MESSAGE_PAGE_SIZE = 200
+
+# ====================
+# Conversation members
+# ====================
+# One document per (conversation, user) holds that user's read pointer and a
+# counter of messages they haven't read yet, so opening a chat is a single
+# small update and unread badges are a single indexed read.
+
+
+async def ensure_indexes():
+    # Inbox: a user's conversations, most recently active first
+    await db.conversations.create_index([("participants", 1), ("updatedAt", -1), ("id", -1)])
+    # At most one 1:1 conversation per pair of users; group conversations have no pairKey
+    await db.conversations.create_index(
+        "pairKey", unique=True, partialFilterExpression={"pairKey": {"$exists": True}}
+    )
+    # History: newest messages of a conversation first, paged backwards
+    await db.messages.create_index([("conversationId", 1), ("createdAt", -1), ("id", -1)])
+    await db.conversation_members.create_index([("conversationId", 1), ("userId", 1)], unique=True)
+    await db.conversation_members.create_index([("userId", 1), ("unreadCount", 1)])
+
+
+async def add_members(conversation_id: str, user_ids: List[str]):
+    if not user_ids:
+        return
+    now = datetime.now(timezone.utc).isoformat()
+    await db.conversation_members.bulk_write([
+        UpdateOne(
+            {"conversationId": conversation_id, "userId": user_id},
+            {"$setOnInsert": {
+                "conversationId": conversation_id,
+                "userId": user_id,
+                "lastReadAt": now,
+                "lastReadMessageId": None,
+                "unreadCount": 0,
+                "joinedAt": now
+            }},
+            upsert=True
+        )
+        for user_id in user_ids
+    ], ordered=False)
+
+
+async def remove_member(conversation_id: str, user_id: str):
+    await db.conversation_members.delete_one({"conversationId": conversation_id, "userId": user_id})
+
+
+async def delete_members(conversation_id: str):
+    await db.conversation_members.delete_many({"conversationId": conversation_id})
+
+
+async def record_message(conversation_id: str, message: Dict[str, Any]):
+    await db.conversation_members.update_many(
+        {"conversationId": conversation_id, "userId": {"$ne": message["senderId"]}},
+        {"$inc": {"unreadCount": 1}}
+    )
+    # Senders have read everything up to their own message
+    await mark_read(conversation_id, message["senderId"], message)
+
+
+async def mark_read(conversation_id: str, user_id: str, last_message: Optional[Dict[str, Any]] = None):
+    update = {"unreadCount": 0, "lastReadAt": datetime.now(timezone.utc).isoformat()}
+    if last_message:
+        update["lastReadAt"] = max(update["lastReadAt"], last_message["createdAt"])
+        update["lastReadMessageId"] = last_message["id"]
+    await db.conversation_members.update_one(
+        {"conversationId": conversation_id, "userId": user_id},
+        {"$set": update, "$setOnInsert": {"joinedAt": update["lastReadAt"]}},
+        upsert=True
+    )
+
+
+async def get_unread_counts(user_id: str) -> Dict[str, int]:
+    members = await db.conversation_members.find(
+        {"userId": user_id, "unreadCount": {"$gt": 0}},
+        {"_id": 0, "conversationId": 1, "unreadCount": 1}
+    ).to_list(None)
+    return {m["conversationId"]: m["unreadCount"] for m in members}
+
+
+async def annotate_read_state(conversation_id: str, user_id: str, messages: List[Dict[str, Any]]):
+    # A message counts as read once every other participant's pointer has passed it
+    others = await db.conversation_members.find(
+        {"conversationId": conversation_id, "userId": {"$ne": user_id}},
+        {"_id": 0, "lastReadAt": 1}
+    ).to_list(None)
+    read_up_to = min((m.get("lastReadAt") or "" for m in others), default="")
+    for msg in messages:
+        msg["read"] = bool(read_up_to) and msg["createdAt"] <= read_up_to
+
+
+# ====================
+# Message history
+# ====================
+
+def new_message_id() -> str:
+    # ObjectId strings start with a timestamp, so ids sort in creation order
+    return str(ObjectId())
+
+
+async def get_message_page(query: Dict[str, Any], limit: int = MESSAGE_PAGE_SIZE, before: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """Load the newest `limit` messages older than `before`.
+
+    Returns the page in chronological order plus the cursor for the next older
+    page (None once the start of the conversation is reached).
+    """
+    limit = max(1, min(limit, MAX_MESSAGE_PAGE_SIZE))
+    cursor_filter = before_cursor_filter(before, "createdAt")
+    if cursor_filter:
+        query = {"$and": [query, cursor_filter]}
+    messages = await db.messages.find(query, {"_id": 0}).sort(
+        [("createdAt", -1), ("id", -1)]
+    ).limit(limit).to_list(limit)
+    older = next_cursor(messages, "createdAt", limit)
+    messages.reverse()
+    return messages, older
+
+
+# ====================
+# Conversation summary
+# ====================
+
+def last_message_summary(message: Dict[str, Any]) -> Dict[str, Any]:
+    # Read state is per participant and comes from the member's unreadCount, not from here
+    return {
+        "id": message["id"],
+        "senderId": message["senderId"],
+        "receiverId": message.get("receiverId"),
+        "content": (message.get("content") or "")[:200],
+        "attachments": [
+            {"filename": a.get("filename"), "type": a.get("type")}
+            for a in message.get("attachments") or []
+        ],
+        "projectId": message.get("projectId"),
+        "projectTitle": message.get("projectTitle"),
+        "createdAt": message["createdAt"]
+    }
+
+
+async def touch_conversation(conversation_id: str, sender_id: str, message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Atomically check the sender is a participant and set lastMessage/updatedAt.
+
+    Returns None when the conversation doesn't exist or the sender isn't in it.
+    """
+    return await db.conversations.find_one_and_update(
+        {"id": conversation_id, "participants": sender_id},
+        {"$set": {"lastMessage": last_message_summary(message), "updatedAt": message["createdAt"]}},
+        projection={"_id": 0, "id": 1, "participants": 1, "isGroup": 1}
+    )
+
+
+# ====================
+# Direct (1:1) conversations
+# ====================
+
+def pair_key(user_a: str, user_b: str) -> str:
+    return ":".join(sorted([user_a, user_b]))
+
+
+async def get_or_create_direct_conversation(user_a: str, user_b: str, created_by: str) -> Tuple[Dict[str, Any], bool]:
+    """Find or create the 1:1 conversation between two users with a single upsert.
+
+    The unique pairKey index makes concurrent first messages converge on one
+    conversation. Returns (conversation, created).
+    """
+    key = pair_key(user_a, user_b)
+    now = datetime.now(timezone.utc).isoformat()
+    new_id = str(uuid.uuid4())
+    try:
+        conversation = await db.conversations.find_one_and_update(
+            {"pairKey": key},
+            {"$setOnInsert": {
+                "id": new_id,
+                "name": None,
+                "participants": sorted([user_a, user_b]),
+                "admins": [],
+                "isGroup": False,
+                "avatar": None,
+                "createdBy": created_by,
+                "lastMessage": None,
+                "createdAt": now,
+                "updatedAt": now
+            }},
+            upsert=True,
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Lost the race to a concurrent upsert; the winner's document is there now
+        conversation = await db.conversations.find_one({"pairKey": key}, {"_id": 0})
+    created = conversation["id"] == new_id
+    if created:
+        await add_members(conversation["id"], conversation["participants"])
+    return conversation, created
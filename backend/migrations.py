@@ -0,0 +1,248 @@
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+from database import db, client
+from listings import post_summary, question_summary
+import messaging
+
+# One-shot data migrations. Each step is idempotent, so the script can be
+# re-run after a partial failure:
+#
+#   python migrations.py
+#
+# Run it before a new version takes traffic and once more after the deploy
+# (see "Upgrading an Existing Database" in DEPLOYMENT.md).
+
+BATCH_SIZE = 500
+
+
+async def merge_direct_conversations():
+    print("Merging duplicate 1:1 conversations...")
+    groups = defaultdict(list)
+    cursor = db.conversations.find(
+        {"isGroup": False, "participants": {"$size": 2}},
+        {"_id": 0, "id": 1, "participants": 1, "pairKey": 1, "lastMessage": 1, "createdAt": 1, "updatedAt": 1}
+    )
+    async for conv in cursor:
+        groups[messaging.pair_key(*conv["participants"])].append(conv)
+
+    merged = 0
+    keyed = 0
+    for key, convs in groups.items():
+        # Keep the conversation that already owns the key, otherwise the oldest
+        convs.sort(key=lambda c: (c.get("pairKey") != key, c.get("createdAt") or ""))
+        keeper, duplicates = convs[0], convs[1:]
+        duplicate_ids = [c["id"] for c in duplicates]
+        if duplicate_ids:
+            await db.messages.update_many(
+                {"conversationId": {"$in": duplicate_ids}},
+                {"$set": {"conversationId": keeper["id"]}}
+            )
+            # Fold unread counters into the keeper's member documents
+            async for member in db.conversation_members.find({"conversationId": {"$in": duplicate_ids}}):
+                await db.conversation_members.update_one(
+                    {"conversationId": keeper["id"], "userId": member["userId"]},
+                    {"$inc": {"unreadCount": member.get("unreadCount", 0)},
+                     "$setOnInsert": {"lastReadAt": member.get("lastReadAt"), "joinedAt": member.get("joinedAt")}},
+                    upsert=True
+                )
+            await db.conversation_members.delete_many({"conversationId": {"$in": duplicate_ids}})
+            await db.conversations.delete_many({"id": {"$in": duplicate_ids}})
+            merged += len(duplicate_ids)
+
+        latest = max(convs, key=lambda c: c.get("updatedAt") or "")
+        update = {"pairKey": key, "updatedAt": latest.get("updatedAt")}
+        if latest.get("lastMessage"):
+            update["lastMessage"] = latest["lastMessage"]
+        await db.conversations.update_one({"id": keeper["id"]}, {"$set": update})
+        keyed += 1
+    print(f"  {keyed} conversations keyed, {merged} duplicates merged")
+
+
+async def migrate_legacy_messages():
+    """Move receiverId-only messages into their canonical 1:1 conversation.
+
+    Works through the messages in _id order one batch at a time and records the
+    last _id handled in `migrations`, so an interrupted run resumes where it
+    stopped.
+    """
+    print("Assigning legacy messages to conversations...")
+    await messaging.ensure_indexes()
+    checkpoint = await db.migrations.find_one({"_id": "legacy_messages"}) or {}
+    last_id = checkpoint.get("lastId")
+    conversation_ids = {}
+    moved = 0
+    while True:
+        query = {"conversationId": None, "receiverId": {"$ne": None}}
+        if last_id:
+            query["_id"] = {"$gt": last_id}
+        batch = await db.messages.find(query).sort("_id", 1).limit(BATCH_SIZE).to_list(BATCH_SIZE)
+        if not batch:
+            break
+
+        by_conversation = defaultdict(list)
+        for message in batch:
+            key = messaging.pair_key(message["senderId"], message["receiverId"])
+            if key not in conversation_ids:
+                conversation, _ = await messaging.get_or_create_direct_conversation(
+                    message["senderId"], message["receiverId"], message["senderId"]
+                )
+                conversation_ids[key] = conversation["id"]
+            by_conversation[conversation_ids[key]].append(message)
+
+        for conversation_id, messages in by_conversation.items():
+            await db.messages.update_many(
+                {"_id": {"$in": [m["_id"] for m in messages]}},
+                {"$set": {"conversationId": conversation_id}}
+            )
+            # Messages are assigned before counters move, so a crash can only undercount unread
+            unread = defaultdict(int)
+            for message in messages:
+                if not message.get("read"):
+                    unread[message["receiverId"]] += 1
+            for user_id, count in unread.items():
+                await db.conversation_members.update_one(
+                    {"conversationId": conversation_id, "userId": user_id},
+                    {"$inc": {"unreadCount": count}}
+                )
+            latest = max(messages, key=lambda m: m["createdAt"])
+            await db.conversations.update_one(
+                {"id": conversation_id, "$or": [
+                    {"lastMessage": None},
+                    {"lastMessage.createdAt": {"$lt": latest["createdAt"]}}
+                ]},
+                {"$set": {"lastMessage": messaging.last_message_summary(latest), "updatedAt": latest["createdAt"]}}
+            )
+
+        last_id = batch[-1]["_id"]
+        moved += len(batch)
+        await db.migrations.update_one(
+            {"_id": "legacy_messages"},
+            {"$set": {"lastId": last_id, "updatedAt": datetime.now(timezone.utc).isoformat()}},
+            upsert=True
+        )
+        print(f"  {moved} messages moved")
+    print(f"  done, {len(conversation_ids)} conversations touched")
+
+
+async def backfill_conversation_members():
+    print("Backfilling conversation members...")
+    await messaging.ensure_indexes()
+
+    # Unread counts seeded from the old per-message `read` flag
+    unread = defaultdict(lambda: defaultdict(int))
+    pipeline = [
+        {"$match": {"conversationId": {"$ne": None}, "read": False}},
+        {"$group": {"_id": {"conversationId": "$conversationId", "senderId": "$senderId"}, "count": {"$sum": 1}}}
+    ]
+    async for row in db.messages.aggregate(pipeline):
+        unread[row["_id"]["conversationId"]][row["_id"]["senderId"]] += row["count"]
+
+    now = datetime.now(timezone.utc).isoformat()
+    processed = 0
+    cursor = db.conversations.find({}, {"_id": 0, "id": 1, "participants": 1, "createdAt": 1})
+    ops = []
+    async for conv in cursor:
+        by_sender = unread.get(conv["id"], {})
+        for user_id in conv.get("participants", []):
+            unread_count = sum(n for sender, n in by_sender.items() if sender != user_id)
+            ops.append(UpdateOne(
+                {"conversationId": conv["id"], "userId": user_id},
+                {"$setOnInsert": {
+                    "conversationId": conv["id"],
+                    "userId": user_id,
+                    # Users with nothing unread have effectively read up to now
+                    "lastReadAt": conv.get("createdAt") if unread_count else now,
+                    "lastReadMessageId": None,
+                    "unreadCount": unread_count,
+                    "joinedAt": conv.get("createdAt")
+                }},
+                upsert=True
+            ))
+        processed += 1
+        if len(ops) >= BATCH_SIZE:
+            await db.conversation_members.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await db.conversation_members.bulk_write(ops, ordered=False)
+    print(f"  {processed} conversations processed")
+
+
+async def backfill_last_messages():
+    print("Backfilling conversation lastMessage...")
+    pipeline = [
+        {"$match": {"conversationId": {"$ne": None}}},
+        {"$sort": {"createdAt": -1}},
+        {"$group": {"_id": "$conversationId", "message": {"$first": "$$ROOT"}}}
+    ]
+    ops = []
+    updated = 0
+    async for row in db.messages.aggregate(pipeline, allowDiskUse=True):
+        message = row["message"]
+        ops.append(UpdateOne(
+            {"id": row["_id"], "lastMessage": None},
+            {"$set": {"lastMessage": messaging.last_message_summary(message), "updatedAt": message["createdAt"]}}
+        ))
+        if len(ops) >= BATCH_SIZE:
+            updated += (await db.conversations.bulk_write(ops, ordered=False)).modified_count
+            ops = []
+    if ops:
+        updated += (await db.conversations.bulk_write(ops, ordered=False)).modified_count
+    print(f"  {updated} conversations updated")
+
+
+async def backfill_notification_counters():
+    print("Backfilling unread notification counters...")
+    pipeline = [
+        {"$match": {"read": False}},
+        {"$group": {"_id": "$userId", "unread": {"$sum": 1}}}
+    ]
+    ops = []
+    users = 0
+    async for row in db.notifications.aggregate(pipeline, allowDiskUse=True):
+        ops.append(UpdateOne({"_id": row["_id"]}, {"$setOnInsert": {"unread": row["unread"]}}, upsert=True))
+        users += 1
+        if len(ops) >= BATCH_SIZE:
+            await db.notification_state.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await db.notification_state.bulk_write(ops, ordered=False)
+    print(f"  {users} users processed")
+
+
+async def backfill_list_summaries():
+    # Excerpts and reading times used by list views, for documents written before they were stored
+    print("Backfilling post and question excerpts...")
+    for collection, summarize, fields, check in (
+        (db.posts, post_summary, {"_id": 1, "content": 1, "excerpt": 1}, "readingTime"),
+        (db.questions, question_summary, {"_id": 1, "description": 1}, "excerpt")
+    ):
+        ops = []
+        updated = 0
+        async for doc in collection.find({check: {"$exists": False}}, fields):
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": summarize(doc)}))
+            updated += 1
+            if len(ops) >= BATCH_SIZE:
+                await collection.bulk_write(ops, ordered=False)
+                ops = []
+        if ops:
+            await collection.bulk_write(ops, ordered=False)
+        print(f"  {collection.name}: {updated} documents updated")
+
+
+async def main():
+    # Must run before the unique pairKey index can be built
+    await merge_direct_conversations()
+    await backfill_conversation_members()
+    await migrate_legacy_messages()
+    await backfill_last_messages()
+    await backfill_notification_counters()
+    await backfill_list_summaries()
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
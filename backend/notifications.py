@@ -0,0 +1,323 @@
+import asyncio
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from database import db
+from realtime import deliver_to_users
+
+logger = logging.getLogger(__name__)
+
+# Notifications are buffered briefly and written in one bulk_write per flush
+NOTIFICATION_FLUSH_INTERVAL = 0.5  # seconds
+NOTIFICATION_MAX_BUFFER = 500
+# Actors named when rendering a grouped notification ("A and B", "A and N others")
+NOTIFICATION_RECENT_ACTORS = 3
+# Read notifications move to notifications_archive after this many days,
+# and archived ones expire after NOTIFICATION_ARCHIVE_TTL_DAYS
+NOTIFICATION_ARCHIVE_AFTER_DAYS = 30
+NOTIFICATION_ARCHIVE_TTL_DAYS = 180
+NOTIFICATION_BATCH_SIZE = 500
+
+_buffer: List[Tuple[str, Dict[str, Any]]] = []
+_flush_task: Optional[asyncio.Task] = None
+_flush_lock = asyncio.Lock()
+
+
+async def ensure_indexes():
+    await db.notifications.create_index([("userId", 1), ("createdAt", -1), ("id", -1)])
+    await db.notifications.create_index([("read", 1), ("createdAt", 1)])
+    await db.notifications_archive.create_index("archivedAt", expireAfterSeconds=NOTIFICATION_ARCHIVE_TTL_DAYS * 86400)
+    # One open (unread) notification per group; concurrent upserts converge on it
+    await db.notifications.create_index(
+        [("userId", 1), ("groupKey", 1)],
+        unique=True,
+        partialFilterExpression={"read": False, "groupKey": {"$exists": True}}
+    )
+
+
+async def notify(user_ids: Iterable[str], event: Dict[str, Any]):
+    """Queue a notification for each user.
+
+    event: {type, message, link, actorId?, groupKey?, template?}
+
+    Events sharing a groupKey collapse into one unread notification per user
+    whose message is rendered from `template`, where "{actors}" becomes
+    "Alice", "Alice and Bob" or "Alice and 12 others". The actor is never
+    notified about their own action.
+    """
+    global _flush_task
+    for user_id in user_ids:
+        if user_id and user_id != event.get("actorId"):
+            _buffer.append((user_id, event))
+    if len(_buffer) >= NOTIFICATION_MAX_BUFFER:
+        await flush()
+    elif _buffer and (_flush_task is None or _flush_task.done()):
+        _flush_task = asyncio.ensure_future(_flush_later())
+
+
+async def _flush_later():
+    await asyncio.sleep(NOTIFICATION_FLUSH_INTERVAL)
+    await flush()
+
+
+async def flush():
+    async with _flush_lock:
+        while _buffer:
+            pending = _buffer[:NOTIFICATION_MAX_BUFFER]
+            del _buffer[:len(pending)]
+            try:
+                await _write(pending)
+            except Exception as e:
+                logger.error(f"Failed to write {len(pending)} notifications: {e}")
+
+
+def _render_actors(names: List[str], count: int) -> str:
+    if not names:
+        return "Someone"
+    if count == 1:
+        return names[0]
+    if count == 2 and len(names) >= 2:
+        return f"{names[0]} and {names[1]}"
+    others = count - 1
+    return f"{names[0]} and {others} other{'s' if others > 1 else ''}"
+
+
+async def _bulk_write(ops: List[Any]) -> Tuple[Set[int], Set[int]]:
+    """Unordered bulk write that reports (failed op indexes, upserted op indexes).
+
+    A failing op doesn't lose the rest of the batch. Group upserts that lost
+    a race to a concurrent one (duplicate key on the open-group index) are
+    retried once, which then updates the winner's document.
+    """
+    try:
+        result = await db.notifications.bulk_write(ops, ordered=False)
+        return set(), set(result.upserted_ids)
+    except BulkWriteError as e:
+        details = e.details
+    upserted = {u["index"] for u in details.get("upserted", [])}
+    failed = set()
+    for error in details.get("writeErrors", []):
+        index = error["index"]
+        if error.get("code") == 11000 and isinstance(ops[index], UpdateOne):
+            try:
+                await db.notifications.bulk_write([ops[index]])
+                continue
+            except Exception as retry_error:
+                error = {"errmsg": str(retry_error)}
+        failed.add(index)
+        logger.error(f"Notification write failed: {error.get('errmsg')}")
+    return failed, upserted
+
+
+async def _write(pending: List[Tuple[str, Dict[str, Any]]]):
+    now = datetime.now(timezone.utc).isoformat()
+    ops = []
+    created: List[Dict[str, Any]] = []
+    # (userId, groupKey) -> (event, actor ids in arrival order)
+    groups: Dict[Tuple[str, str], Tuple[Dict[str, Any], List[str]]] = {}
+
+    for user_id, event in pending:
+        group_key = event.get("groupKey")
+        if group_key:
+            _, actors = groups.setdefault((user_id, group_key), (event, []))
+            if event.get("actorId"):
+                actors.append(event["actorId"])
+            continue
+        notification = {
+            "id": str(uuid.uuid4()),
+            "userId": user_id,
+            "type": event["type"],
+            "message": event["message"],
+            "link": event.get("link"),
+            "read": False,
+            "createdAt": now
+        }
+        ops.append(InsertOne(notification))
+        created.append(notification)
+
+    for (user_id, group_key), (event, actors) in groups.items():
+        update: Dict[str, Any] = {
+            # createdAt tracks the latest activity so bumped groups resurface at the top
+            "$set": {"createdAt": now},
+            "$setOnInsert": {
+                "id": str(uuid.uuid4()),
+                "type": event["type"],
+                "message": event["message"],
+                "link": event.get("link"),
+                "template": event.get("template")
+            }
+        }
+        if actors:
+            # A set, so the same person liking, unliking and liking again counts once
+            update["$addToSet"] = {"actorIds": {"$each": actors}}
+        ops.append(UpdateOne({"userId": user_id, "groupKey": group_key, "read": False}, update, upsert=True))
+
+    if not ops:
+        return
+    if groups:
+        await _close_groups_read_by_pointer(groups)
+    failed, upserted = await _bulk_write(ops)
+    # ops holds the inserts first, then one upsert per group
+    first_group = len(created)
+    group_keys = list(groups)
+
+    # Every inserted or newly upserted notification is one more unread
+    created = [n for index, n in enumerate(created) if index not in failed]
+    group_keys_written = [key for index, key in enumerate(group_keys, start=first_group) if index not in failed]
+    new_unread: Dict[str, int] = defaultdict(int)
+    for notification in created:
+        new_unread[notification["userId"]] += 1
+    for index in upserted:
+        new_unread[group_keys[index - first_group][0]] += 1
+    if new_unread:
+        await db.notification_state.bulk_write([
+            UpdateOne({"_id": user_id}, {"$inc": {"unread": count}}, upsert=True)
+            for user_id, count in new_unread.items()
+        ], ordered=False)
+
+    grouped: List[Dict[str, Any]] = []
+    if group_keys_written:
+        grouped = await db.notifications.find(
+            {"$or": [{"userId": u, "groupKey": g, "read": False} for u, g in group_keys_written]},
+            {"_id": 0}
+        ).to_list(len(group_keys_written))
+        await _render_grouped(grouped)
+
+    for notification in created + grouped:
+        notification.pop("_id", None)
+    await deliver_to_users('new_notification', [(n["userId"], n) for n in created + grouped])
+
+
+async def _render_grouped(notifications: List[Dict[str, Any]]):
+    actor_ids = {a for n in notifications for a in n.get("actorIds", [])[-NOTIFICATION_RECENT_ACTORS:]}
+    names: Dict[str, str] = {}
+    if actor_ids:
+        users = await db.users.find(
+            {"id": {"$in": list(actor_ids)}}, {"_id": 0, "id": 1, "name": 1}
+        ).to_list(len(actor_ids))
+        names = {u["id"]: u.get("name") or "Someone" for u in users}
+
+    ops = []
+    for notification in notifications:
+        if not notification.get("template"):
+            continue
+        actor_ids = notification.get("actorIds", [])
+        recent = [names.get(a, "Someone") for a in reversed(actor_ids[-NOTIFICATION_RECENT_ACTORS:])]
+        notification["actorCount"] = max(len(actor_ids), 1)
+        actors = _render_actors(recent, notification["actorCount"])
+        notification["message"] = notification["template"].replace("{actors}", actors)
+        ops.append(UpdateOne({"id": notification["id"]}, {"$set": {
+            "message": notification["message"], "actorCount": notification["actorCount"]
+        }}))
+    if ops:
+        await db.notifications.bulk_write(ops, ordered=False)
+
+
+async def _close_groups_read_by_pointer(groups: Dict[Tuple[str, str], Any]):
+    # A group notification covered by "mark all read" must not be bumped back to
+    # unread without being counted; materialize its read flag so a fresh one is opened
+    keys_by_user: Dict[str, List[str]] = defaultdict(list)
+    for user_id, group_key in groups:
+        keys_by_user[user_id].append(group_key)
+    states = await db.notification_state.find(
+        {"_id": {"$in": list(keys_by_user)}, "readAllAt": {"$exists": True}}
+    ).to_list(len(keys_by_user))
+    for state in states:
+        await db.notifications.update_many(
+            {"userId": state["_id"], "groupKey": {"$in": keys_by_user[state["_id"]]},
+             "read": False, "createdAt": {"$lte": state["readAllAt"]}},
+            {"$set": {"read": True}}
+        )
+
+
+# ====================
+# Read state
+# ====================
+# The unread badge is a counter on notification_state kept in step with every
+# write. "Mark all read" moves a readAllAt pointer instead of rewriting every
+# document; notifications created before it are reported as read.
+
+async def get_read_state(user_id: str) -> Dict[str, Any]:
+    return await db.notification_state.find_one({"_id": user_id}) or {}
+
+
+async def get_unread_count(user_id: str) -> int:
+    return max((await get_read_state(user_id)).get("unread", 0), 0)
+
+
+def apply_read_pointer(notifications: List[Dict[str, Any]], state: Dict[str, Any]):
+    read_all_at = state.get("readAllAt")
+    if read_all_at:
+        for notification in notifications:
+            if notification["createdAt"] <= read_all_at:
+                notification["read"] = True
+
+
+async def mark_read(user_id: str, notification_id: str):
+    state = await get_read_state(user_id)
+    query: Dict[str, Any] = {"id": notification_id, "userId": user_id, "read": False}
+    if state.get("readAllAt"):
+        query["createdAt"] = {"$gt": state["readAllAt"]}
+    result = await db.notifications.update_one(query, {"$set": {"read": True}})
+    if result.modified_count:
+        await db.notification_state.update_one(
+            {"_id": user_id, "unread": {"$gt": 0}}, {"$inc": {"unread": -1}}
+        )
+
+
+async def mark_all_read(user_id: str):
+    await db.notification_state.update_one(
+        {"_id": user_id},
+        {"$set": {"unread": 0, "readAllAt": datetime.now(timezone.utc).isoformat()}},
+        upsert=True
+    )
+
+
+# ====================
+# Retention
+# ====================
+
+async def archive_read_notifications(lease=None) -> Dict[str, Any]:
+    """Move read notifications older than the cutoff to notifications_archive.
+
+    "Read" includes notifications covered by a user's readAllAt pointer. Runs in
+    batches; the archive collection expires documents through its TTL index.
+    """
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=NOTIFICATION_ARCHIVE_AFTER_DAYS)).isoformat()
+
+    # Fold readAllAt pointers into the documents they cover, one user at a time
+    async for state in db.notification_state.find({"readAllAt": {"$exists": True}}):
+        if lease and not await lease.is_valid():
+            return {"archived": 0, "fenced": True}
+        await db.notifications.update_many(
+            {"userId": state["_id"], "read": False, "createdAt": {"$lte": min(state["readAllAt"], cutoff)}},
+            {"$set": {"read": True}}
+        )
+
+    archived = 0
+    while True:
+        if lease and not await lease.is_valid():
+            return {"archived": archived, "fenced": True}
+        batch = await db.notifications.find(
+            {"read": True, "createdAt": {"$lt": cutoff}}
+        ).limit(NOTIFICATION_BATCH_SIZE).to_list(NOTIFICATION_BATCH_SIZE)
+        if not batch:
+            break
+        now = datetime.now(timezone.utc)
+        for notification in batch:
+            notification["archivedAt"] = now
+        try:
+            await db.notifications_archive.insert_many(batch, ordered=False)
+        except BulkWriteError:
+            # Duplicates were archived by an interrupted run; the rest went in
+            pass
+        await db.notifications.delete_many({"_id": {"$in": [n["_id"] for n in batch]}})
+        archived += len(batch)
+    logger.info(f"Archived {archived} read notifications")
+    return {"archived": archived}
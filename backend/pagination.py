@@ -0,0 +1,38 @@
+import base64
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+# Keyset cursors: an opaque token wrapping the (sort value, id) of the last item
+# on a page, so the next page is an index range scan instead of a skip.
+
+
+def encode_cursor(value: str, item_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{value}|{item_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, item_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|", 1)
+        return value, item_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def before_cursor_filter(cursor: Optional[str], field: str) -> Dict[str, Any]:
+    """Filter for items strictly older than the cursor when sorting (field, id) descending."""
+    if not cursor:
+        return {}
+    value, item_id = decode_cursor(cursor)
+    return {"$or": [
+        {field: {"$lt": value}},
+        {field: value, "id": {"$lt": item_id}}
+    ]}
+
+
+def next_cursor(items, field: str, limit: int) -> Optional[str]:
+    if len(items) < limit or not items:
+        return None
+    last = items[-1]
+    return encode_cursor(last[field], last["id"])
@@ -0,0 +1,290 @@
+import json
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from database import db
+from email_service import render_new_content, new_content_subject, outbox_email, enqueue_emails
+from notifications import notify
+
+logger = logging.getLogger(__name__)
+
+# Users loaded per query when turning matched ids into emails
+FANOUT_BATCH_SIZE = 500
+
+
+async def ensure_indexes():
+    await db.users.create_index("followingTags")
+    await db.saved_searches.create_index([("userId", 1), ("createdAt", -1)])
+
+
+class TagFollowerIndex:
+    """In-memory inverted index tag -> ids of users following it.
+
+    Kept in step by the follow/unfollow/profile endpoints of this worker and
+    rebuilt from Mongo by `load`, which also picks up changes made through
+    other workers.
+    """
+
+    def __init__(self):
+        self._followers: Dict[str, Set[str]] = {}
+        self._tags_by_user: Dict[str, Set[str]] = {}
+
+    async def load(self):
+        started = time.perf_counter()
+        followers: Dict[str, Set[str]] = {}
+        tags_by_user: Dict[str, Set[str]] = {}
+        cursor = db.users.find(
+            {"followingTags.0": {"$exists": True}},
+            {"_id": 0, "id": 1, "followingTags": 1}
+        )
+        async for user in cursor:
+            tags = set(user.get("followingTags") or [])
+            tags_by_user[user["id"]] = tags
+            for tag in tags:
+                followers.setdefault(tag, set()).add(user["id"])
+        # Swap in one step so matching never sees a half-built index
+        self._followers, self._tags_by_user = followers, tags_by_user
+        logger.info(
+            f"Tag follower index loaded: {len(followers)} tags, {len(tags_by_user)} users "
+            f"in {time.perf_counter() - started:.2f}s"
+        )
+
+    def follow(self, user_id: str, tag: str):
+        self._tags_by_user.setdefault(user_id, set()).add(tag)
+        self._followers.setdefault(tag, set()).add(user_id)
+
+    def unfollow(self, user_id: str, tag: str):
+        self._tags_by_user.get(user_id, set()).discard(tag)
+        followers = self._followers.get(tag)
+        if followers is not None:
+            followers.discard(user_id)
+            if not followers:
+                del self._followers[tag]
+
+    def set_tags(self, user_id: str, tags: Iterable[str]):
+        tags = set(tags)
+        current = self._tags_by_user.get(user_id, set())
+        for tag in current - tags:
+            self.unfollow(user_id, tag)
+        for tag in tags - current:
+            self.follow(user_id, tag)
+
+    def remove_user(self, user_id: str):
+        self.set_tags(user_id, ())
+        self._tags_by_user.pop(user_id, None)
+
+    def match(self, tags: Iterable[str]) -> Set[str]:
+        matched: Set[str] = set()
+        for tag in tags:
+            matched |= self._followers.get(tag, set())
+        return matched
+
+    def follower_count(self, tag: str) -> int:
+        return len(self._followers.get(tag, ()))
+
+
+tag_followers = TagFollowerIndex()
+
+
+# ====================
+# Saved search percolator
+# ====================
+# Saved searches are compiled once and tested against each new post/question at
+# write time, instead of users re-running /search to look for new results.
+
+# Text fields /search matches per content kind
+SEARCH_FIELDS = {"post": ("title", "content"), "question": ("title", "description")}
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class CompiledSearch:
+    """A saved search's filters as a matcher for newly created documents.
+
+    The time window and sort order don't apply to a document that was just
+    created, so only the text, type, tags and status filters are kept.
+    """
+
+    def __init__(self, search: Dict[str, Any], config: Dict[str, Any]):
+        self.id = search["id"]
+        self.user_id = search["userId"]
+        self.name = search["name"]
+        text = (config.get("query") or config.get("q") or "").strip()
+        search_type = config.get("type") or "all"
+        self.kinds = {"post", "question"} if search_type == "all" else {search_type.rstrip("s")}
+        self.tags = set(config.get("tags") or [])
+        self.status = config.get("status") or "all"
+        # Matched as a case-insensitive substring: running a user-supplied regex on
+        # every new document in the event loop would let one search stall the worker
+        self.text = text.lower()
+        # Text of three or more characters can be pre-filtered by trigram
+        self.needle = self.text if len(self.text) >= 3 else None
+
+    def matches(self, kind: str, doc: Dict[str, Any]) -> bool:
+        if kind not in self.kinds:
+            return False
+        tags = doc.get("tags") or []
+        if self.tags and not self.tags.intersection(tags):
+            return False
+        if kind == "question":
+            if self.status == "solved" and doc.get("status") != "answered":
+                return False
+            if self.status == "unsolved" and doc.get("status") == "answered":
+                return False
+        if not self.text:
+            return True
+        fields = [doc.get(f) or "" for f in SEARCH_FIELDS[kind]]
+        return any(self.text in value.lower() for value in fields + tags)
+
+
+def compile_search(search: Dict[str, Any]) -> Optional[CompiledSearch]:
+    try:
+        config = json.loads(search.get("query") or "{}")
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(config, dict):
+        return None
+    compiled = CompiledSearch(search, config)
+    if not compiled.kinds & set(SEARCH_FIELDS):
+        return None
+    return compiled
+
+
+class SavedSearchPercolator:
+    """Saved searches indexed so a new document is only checked against plausible ones.
+
+    A search with a tag filter is filed under its tags, one with literal text
+    under a trigram of that text, and the rest are checked against everything.
+    """
+
+    def __init__(self):
+        self._searches: Dict[str, CompiledSearch] = {}
+        self._by_tag: Dict[str, Set[str]] = {}
+        self._by_trigram: Dict[str, Set[str]] = {}
+        self._scan: Set[str] = set()
+
+    async def load(self):
+        percolator = SavedSearchPercolator()
+        async for search in db.saved_searches.find({}, {"_id": 0}):
+            percolator.add(search)
+        self._searches, self._by_tag = percolator._searches, percolator._by_tag
+        self._by_trigram, self._scan = percolator._by_trigram, percolator._scan
+        logger.info(f"Saved search percolator loaded: {len(self._searches)} searches")
+
+    def _buckets(self, compiled: CompiledSearch) -> List[Set[str]]:
+        if compiled.tags:
+            return [self._by_tag.setdefault(tag, set()) for tag in compiled.tags]
+        if compiled.needle:
+            return [self._by_trigram.setdefault(compiled.needle[:3], set())]
+        return [self._scan]
+
+    def add(self, search: Dict[str, Any]):
+        self.remove(search["id"])
+        compiled = compile_search(search)
+        if compiled is None:
+            return
+        self._searches[compiled.id] = compiled
+        for bucket in self._buckets(compiled):
+            bucket.add(compiled.id)
+
+    def remove(self, search_id: str):
+        compiled = self._searches.pop(search_id, None)
+        if compiled is not None:
+            for bucket in self._buckets(compiled):
+                bucket.discard(search_id)
+
+    def match(self, kind: str, doc: Dict[str, Any]) -> List[CompiledSearch]:
+        candidates = set(self._scan)
+        for tag in doc.get("tags") or []:
+            candidates |= self._by_tag.get(tag, set())
+        if self._by_trigram:
+            text = "\n".join([doc.get(f) or "" for f in SEARCH_FIELDS[kind]] + list(doc.get("tags") or [])).lower()
+            for trigram in _trigrams(text) & self._by_trigram.keys():
+                candidates |= self._by_trigram[trigram]
+        return [
+            self._searches[search_id] for search_id in candidates
+            if search_id in self._searches and self._searches[search_id].matches(kind, doc)
+        ]
+
+
+saved_searches = SavedSearchPercolator()
+
+
+async def reconcile(lease=None):
+    # Per-worker state, so this runs on every worker rather than under a lease
+    await tag_followers.load()
+    await saved_searches.load()
+
+
+async def _email_tag_followers(user_ids: List[str], post: Dict[str, Any]) -> int:
+    queued = 0
+    subject = new_content_subject(post["title"], post["tags"])
+    for start in range(0, len(user_ids), FANOUT_BATCH_SIZE):
+        chunk = user_ids[start:start + FANOUT_BATCH_SIZE]
+        users = await db.users.find(
+            {"id": {"$in": chunk}, "emailSettings.newContent": True},
+            {"_id": 0, "email": 1, "username": 1}
+        ).to_list(len(chunk))
+        queued += await enqueue_emails([
+            outbox_email(
+                "new_content", user["email"], subject,
+                render_new_content(user["username"], post["title"], post["tags"], post["id"])
+            )
+            for user in users
+        ])
+    return queued
+
+
+async def _notify_tag_followers(post: Dict[str, Any]):
+    if not post.get("tags"):
+        return
+    followers = tag_followers.match(post["tags"])
+    followers.discard(post["authorId"])
+    if not followers:
+        return
+    user_ids = sorted(followers)
+    await notify(user_ids, {
+        "type": "new_content",
+        "message": f"New post in #{post['tags'][0]}: {post['title']}",
+        "link": f"/posts/{post['id']}",
+        "actorId": post["authorId"]
+    })
+    queued = await _email_tag_followers(user_ids, post)
+    logger.info(f"Post {post['id']} matched {len(user_ids)} tag followers, {queued} emails queued")
+
+
+async def _notify_saved_searches(kind: str, doc: Dict[str, Any], author_id: str):
+    link = f"/{kind}s/{doc['id']}"
+    for search in saved_searches.match(kind, doc):
+        await notify([search.user_id], {
+            "type": "saved_search_match",
+            "message": f"New {kind} matching \"{search.name}\": {doc['title']}",
+            "link": link,
+            "actorId": author_id,
+            "groupKey": f"saved_search:{search.id}",
+            "template": f"{{actors}} posted new results for \"{search.name}\""
+        })
+
+
+async def percolate_post(post: Dict[str, Any]):
+    """Match a newly published post against everyone interested in it.
+
+    Runs as a background task after create_post has responded.
+    """
+    try:
+        if not post.get("published", True):
+            return
+        await _notify_tag_followers(post)
+        await _notify_saved_searches("post", post, post["authorId"])
+    except Exception as e:
+        logger.error(f"Percolating post {post.get('id')} failed: {e}")
+
+
+async def percolate_question(question: Dict[str, Any]):
+    try:
+        await _notify_saved_searches("question", question, question["userId"])
+    except Exception as e:
+        logger.error(f"Percolating question {question.get('id')} failed: {e}")
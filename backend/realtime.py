@@ -0,0 +1,322 @@
+import asyncio
+import time
+import socketio
+from datetime import datetime, timezone
+from typing import Dict, Set, Optional, Tuple, List, Any
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
+from database import db
+from socketio.async_pubsub_manager import AsyncPubSubManager
+from socket_managers import create_client_manager
+
+# Event log for reconnect sync: how long events are kept and how many are replayed at most
+EVENT_LOG_TTL_SECONDS = 3 * 24 * 3600
+EVENT_REPLAY_LIMIT = 500
+# Typing state lapses this many seconds after the last keystroke event
+TYPING_TIMEOUT_SECONDS = 5
+
+# Socket.IO setup
+# With SOCKETIO_MANAGER=mongo|redis, room emits fan out to sockets on every worker
+sio = socketio.AsyncServer(
+    client_manager=create_client_manager(),
+    async_mode='asgi',
+    cors_allowed_origins='*',
+    logger=True,
+    engineio_logger=True
+)
+
+def user_room(user_id: str) -> str:
+    # Every socket a user authenticates joins this room, so emits reach all their tabs and devices
+    return f"user:{user_id}"
+
+def conversation_room(conversation_id: str) -> str:
+    # Every socket of every participant is in this room, so a message is one emit
+    return f"conversation:{conversation_id}"
+
+class PresenceRegistry:
+    """Tracks which sockets belong to which user in this process.
+
+    Sockets on other workers are not visible here; cross-worker delivery goes
+    through the per-user rooms and the client manager instead.
+
+    Both directions are kept so that resolving the sender of a socket event
+    and checking whether a user is online are dict lookups.
+    """
+
+    def __init__(self):
+        self._sids_by_user: Dict[str, Set[str]] = {}
+        self._user_by_sid: Dict[str, str] = {}
+        self._last_seen: Dict[str, str] = {}
+
+    def add(self, sid: str, user_id: str) -> bool:
+        """Register a socket; returns True if this is the user's first socket."""
+        previous = self._user_by_sid.get(sid)
+        if previous == user_id:
+            return False
+        if previous is not None:
+            self.remove(sid)
+        self._user_by_sid[sid] = user_id
+        sids = self._sids_by_user.setdefault(user_id, set())
+        sids.add(sid)
+        return len(sids) == 1
+
+    def remove(self, sid: str) -> Tuple[Optional[str], bool]:
+        """Unregister a socket; returns (user_id, went_offline)."""
+        user_id = self._user_by_sid.pop(sid, None)
+        if user_id is None:
+            return None, False
+        sids = self._sids_by_user.get(user_id, set())
+        sids.discard(sid)
+        if sids:
+            return user_id, False
+        self._sids_by_user.pop(user_id, None)
+        self._last_seen[user_id] = datetime.now(timezone.utc).isoformat()
+        return user_id, True
+
+    def user_for(self, sid: str) -> Optional[str]:
+        return self._user_by_sid.get(sid)
+
+    def sids_for(self, user_id: str) -> Set[str]:
+        return set(self._sids_by_user.get(user_id, ()))
+
+    def is_online(self, user_id: str) -> bool:
+        return user_id in self._sids_by_user
+
+    def last_seen(self, user_id: str) -> Optional[str]:
+        return self._last_seen.get(user_id)
+
+    def online_users(self) -> List[str]:
+        return list(self._sids_by_user)
+
+presence = PresenceRegistry()
+
+class TypingTracker:
+    """Turns a stream of keystroke events into typing start/stop transitions.
+
+    State is kept per (sender, room): the first event emits isTyping=True,
+    repeats only push the expiry back, and an explicit stop, a sent message or
+    the expiry sweep emits isTyping=False.
+    """
+
+    def __init__(self, timeout: float = TYPING_TIMEOUT_SECONDS):
+        self.timeout = timeout
+        self._expires: Dict[Tuple[str, str], float] = {}
+        self._payloads: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._sweeper: Optional[asyncio.Task] = None
+
+    async def start(self, sender_id: str, room: str, payload: Dict[str, Any]):
+        key = (sender_id, room)
+        is_new = key not in self._expires
+        self._expires[key] = time.monotonic() + self.timeout
+        if is_new:
+            self._payloads[key] = payload
+            self._ensure_sweeper()
+            await self._emit(key, payload, True)
+
+    async def stop(self, sender_id: str, room: str):
+        key = (sender_id, room)
+        if self._expires.pop(key, None) is not None:
+            await self._emit(key, self._payloads.pop(key), False)
+
+    async def stop_all(self, sender_id: str):
+        for key in [k for k in self._expires if k[0] == sender_id]:
+            await self.stop(*key)
+
+    async def _emit(self, key: Tuple[str, str], payload: Dict[str, Any], is_typing: bool):
+        sender_id, room = key
+        await sio.emit('user_typing', {**payload, 'isTyping': is_typing},
+                       room=room, skip_sid=list(presence.sids_for(sender_id)))
+
+    def _ensure_sweeper(self):
+        if self._sweeper is None or self._sweeper.done():
+            self._sweeper = asyncio.ensure_future(self._sweep())
+
+    async def _sweep(self):
+        while self._expires:
+            await asyncio.sleep(1)
+            now = time.monotonic()
+            for key in [k for k, expires in self._expires.items() if expires <= now]:
+                await self.stop(*key)
+
+typing_tracker = TypingTracker()
+
+async def emit_to_user(event: str, data: Any, user_id: str, **kwargs):
+    await sio.emit(event, data, room=user_room(user_id), **kwargs)
+
+
+# ====================
+# Socket directory / conversation rooms
+# ====================
+# Presence only sees this worker's sockets. To move a user's sockets held by
+# other workers in or out of a conversation room, their sids are also recorded
+# in `sockets`; enter_room/leave_room on a sid this worker doesn't hold is
+# published through the client manager to the worker that does. Entries of a
+# worker that died without cleaning up expire after SOCKET_DIRECTORY_TTL_SECONDS.
+
+SOCKET_DIRECTORY_TTL_SECONDS = 24 * 3600
+
+async def register_socket(sid: str, user_id: str):
+    await db.sockets.update_one(
+        {"_id": sid},
+        {"$set": {"userId": user_id, "connectedAt": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+
+async def unregister_socket(sid: str):
+    await db.sockets.delete_one({"_id": sid})
+
+async def _sids_of(user_ids: List[str]) -> Set[str]:
+    sids = set().union(*(presence.sids_for(user_id) for user_id in user_ids))
+    # Without a pub/sub manager there is only this worker, and foreign sids can't be reached
+    if isinstance(sio.manager, AsyncPubSubManager):
+        docs = await db.sockets.find({"userId": {"$in": list(user_ids)}}, {"_id": 1}).to_list(None)
+        sids.update(doc["_id"] for doc in docs)
+    return sids
+
+async def join_conversation_room(conversation_id: str, user_ids: List[str]):
+    for sid in await _sids_of(user_ids):
+        await sio.enter_room(sid, conversation_room(conversation_id))
+
+async def leave_conversation_room(conversation_id: str, user_ids: List[str]):
+    for sid in await _sids_of(user_ids):
+        await sio.leave_room(sid, conversation_room(conversation_id))
+
+# ====================
+# Event log / reconnect sync
+# ====================
+# Events a client must not miss are logged with a seq that is sent inside the
+# payload. Per-user events (notifications) go to `user_events`, numbered from
+# that user's own counter (`counters` _id "events:<userId>"). Conversation
+# messages are logged once per message in `conversation_events`, numbered per
+# conversation ("events:conversation:<id>"), whatever the number of members.
+# Clients remember the highest seq they saw per stream and pass them to
+# `authenticate` (`since`, and `conversations` as {conversationId: seq}) to have
+# the gaps replayed.
+
+def _counter_id(user_id: str) -> str:
+    return f"events:{user_id}"
+
+def _conversation_counter_id(conversation_id: str) -> str:
+    return f"events:conversation:{conversation_id}"
+
+async def ensure_indexes():
+    await db.user_events.create_index([("userId", 1), ("seq", 1)], unique=True)
+    await db.user_events.create_index("createdAt", expireAfterSeconds=EVENT_LOG_TTL_SECONDS)
+    await db.conversation_events.create_index([("conversationId", 1), ("seq", 1)], unique=True)
+    await db.conversation_events.create_index("createdAt", expireAfterSeconds=EVENT_LOG_TTL_SECONDS)
+    await db.sockets.create_index("userId")
+    await db.sockets.create_index("connectedAt", expireAfterSeconds=SOCKET_DIRECTORY_TTL_SECONDS)
+    # Indexes of the old single-counter layout
+    for name in ("userIds_1_seq_1", "seq_1"):
+        try:
+            await db.user_events.drop_index(name)
+        except OperationFailure:
+            pass
+
+async def _counter_value(counter_id: str) -> int:
+    counter = await db.counters.find_one({"_id": counter_id})
+    return counter["seq"] if counter else 0
+
+async def _next_seq(counter_id: str, count: int = 1) -> int:
+    # Reserves `count` seqs and returns the last one
+    counter = await db.counters.find_one_and_update(
+        {"_id": counter_id},
+        {"$inc": {"seq": count}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return counter["seq"]
+
+async def current_seq(user_id: str) -> int:
+    return await _counter_value(_counter_id(user_id))
+
+async def log_event(event: str, data: Dict[str, Any], user_id: str) -> int:
+    seq = await _next_seq(_counter_id(user_id))
+    await db.user_events.insert_one({
+        "userId": user_id,
+        "seq": seq,
+        "event": event,
+        "data": data,
+        "createdAt": datetime.now(timezone.utc)
+    })
+    return seq
+
+def _payload(data: Dict[str, Any]) -> Dict[str, Any]:
+    # Documents that went through insert_one carry an ObjectId _id
+    return {k: v for k, v in data.items() if k != "_id"}
+
+async def deliver_to_user(event: str, data: Dict[str, Any], user_id: str, **kwargs):
+    """Emit to a user's sockets and log the event for replay; the payload carries its `seq`."""
+    data = _payload(data)
+    seq = await log_event(event, data, user_id)
+    await sio.emit(event, {**data, "seq": seq}, room=user_room(user_id), **kwargs)
+
+async def deliver_to_users(event: str, deliveries: List[Tuple[str, Dict[str, Any]]]):
+    """deliver_to_user for a batch of (user_id, data) pairs.
+
+    One seq range is reserved per recipient, the whole batch is logged with a
+    single insert_many and the emits run concurrently.
+    """
+    by_user: Dict[str, List[Dict[str, Any]]] = {}
+    for user_id, data in deliveries:
+        by_user.setdefault(user_id, []).append(_payload(data))
+    if not by_user:
+        return
+    user_ids = list(by_user)
+    last_seqs = await asyncio.gather(*(_next_seq(_counter_id(u), len(by_user[u])) for u in user_ids))
+    now = datetime.now(timezone.utc)
+    records, emits = [], []
+    for user_id, last in zip(user_ids, last_seqs):
+        items = by_user[user_id]
+        for seq, data in enumerate(items, start=last - len(items) + 1):
+            records.append({"userId": user_id, "seq": seq, "event": event, "data": data, "createdAt": now})
+            emits.append(sio.emit(event, {**data, "seq": seq}, room=user_room(user_id)))
+    await db.user_events.insert_many(records, ordered=False)
+    await asyncio.gather(*emits)
+
+async def deliver_to_conversation(event: str, data: Dict[str, Any], conversation_id: str, **kwargs):
+    """One log record and one room emit per message; `seq` counts within the conversation."""
+    data = _payload(data)
+    seq = await _next_seq(_conversation_counter_id(conversation_id))
+    await db.conversation_events.insert_one({
+        "conversationId": conversation_id,
+        "seq": seq,
+        "event": event,
+        "data": data,
+        "createdAt": datetime.now(timezone.utc)
+    })
+    await sio.emit(event, {**data, "seq": seq}, room=conversation_room(conversation_id), **kwargs)
+
+async def _replay(collection, scope: Dict[str, Any], since: int, counter_id: str) -> Dict[str, Any]:
+    events = await collection.find(
+        {**scope, "seq": {"$gt": since}},
+        {"_id": 0, "seq": 1, "event": 1, "data": 1}
+    ).sort("seq", 1).limit(EVENT_REPLAY_LIMIT + 1).to_list(EVENT_REPLAY_LIMIT + 1)
+    latest = await _counter_value(counter_id)
+    if events:
+        # A stream's seqs are contiguous, so the gap is intact iff since+1 is still retained
+        complete = events[0]["seq"] == since + 1 and len(events) <= EVENT_REPLAY_LIMIT
+    else:
+        complete = since == latest
+    events = events[:EVENT_REPLAY_LIMIT]
+    return {
+        "events": events,
+        "seq": events[-1]["seq"] if events else latest,
+        "complete": complete
+    }
+
+async def replay_events(user_id: str, since: int) -> Dict[str, Any]:
+    """Events for a user after `since`, oldest first.
+
+    `complete` is False when the gap can't be replayed (too many events, older
+    ones already expired, or a `since` this user's sequence never reached); the
+    client should then reload from the API.
+    """
+    return await _replay(db.user_events, {"userId": user_id}, since, _counter_id(user_id))
+
+async def replay_conversation_events(conversation_id: str, since: int) -> Dict[str, Any]:
+    """Like replay_events, for one conversation's message stream."""
+    return await _replay(
+        db.conversation_events, {"conversationId": conversation_id}, since,
+        _conversation_counter_id(conversation_id)
+    )
@@ -1,12 +1,17 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from datetime import datetime, timezone, timedelta
 from database import db
-from email_service import send_streak_reminder
+from email_service import send_streak_reminder, deliver_outbox
+from digest import run_weekly_digest
+from notifications import archive_read_notifications
+from percolator import reconcile as reconcile_percolator
+from blobs import collect_garbage as collect_blob_garbage
+from job_coordinator import coordinated
 import asyncio
 
 scheduler = AsyncIOScheduler()
 
-async def check_streaks():
+async def check_streaks(lease=None):
     print("Checking streaks...")
     now = datetime.now(timezone.utc)
     today = now.date()
@@ -24,20 +29,42 @@ async def check_streaks():
         "emailSettings.streakReminder": True
     }).to_list(1000)
     
+    # Bail out if our lease was taken over while we were loading users
+    if lease and not await lease.is_valid():
+        return {"checked": 0, "reminded": 0, "fenced": True}
+
+    reminded = 0
     for user in users:
         last_login_str = user.get("lastLogin")
         if last_login_str:
             last_login_date = datetime.fromisoformat(last_login_str).date()
             if last_login_date < today:
+                # Claim today's reminder first so a retried or overlapping run can't send it twice
+                claimed = await db.users.update_one(
+                    {"id": user["id"], "streakReminderSentOn": {"$ne": today.isoformat()}},
+                    {"$set": {"streakReminderSentOn": today.isoformat()}}
+                )
+                if claimed.modified_count == 0:
+                    continue
                 # User hasn't logged in today yet
                 print(f"Sending reminder to {user['username']}")
                 await send_streak_reminder(user['email'], user['username'], user['streak'])
+                reminded += 1
+
+    return {"checked": len(users), "reminded": reminded}
 
 def start_scheduler():
     # Run check_streaks every day at 18:00 UTC (adjust as needed)
     # For testing, we can run it every minute or on startup
     # scheduler.add_job(check_streaks, 'cron', hour=18)
     
+    # Every worker schedules the jobs; the coordinator makes sure only one of them runs each tick
     # For demonstration/testing purposes, let's run it every hour
-    scheduler.add_job(check_streaks, 'interval', hours=1)
+    scheduler.add_job(coordinated("check_streaks", check_streaks), 'interval', hours=1, id="check_streaks", max_instances=1, coalesce=True)
+    scheduler.add_job(coordinated("weekly_digest", run_weekly_digest, lease_seconds=600), 'cron', day_of_week='mon', hour=8, id="weekly_digest", max_instances=1, coalesce=True)
+    scheduler.add_job(coordinated("deliver_outbox", deliver_outbox), 'interval', minutes=1, id="deliver_outbox", max_instances=1, coalesce=True)
+    scheduler.add_job(coordinated("archive_notifications", archive_read_notifications, lease_seconds=600), 'cron', hour=3, id="archive_notifications", max_instances=1, coalesce=True)
+    scheduler.add_job(coordinated("blob_gc", collect_blob_garbage, lease_seconds=600), 'cron', hour=4, id="blob_gc", max_instances=1, coalesce=True)
+    # In-memory indexes are per worker, so every worker reconciles its own
+    scheduler.add_job(reconcile_percolator, 'interval', minutes=10, id="reconcile_percolator", max_instances=1, coalesce=True)
     scheduler.start()
@@ -0,0 +1,30 @@
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Tuple, Type
+
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+# List endpoints return documents we wrote ourselves, so validating each one
+# through its response model again only costs CPU. These helpers shape them
+# like the model would (declared fields only, defaults filled in) and encode
+# the result with orjson. Handlers keep response_model for the OpenAPI schema.
+
+
+@lru_cache(maxsize=None)
+def _model_fields(model: Type[BaseModel]) -> Tuple[Tuple[str, Any], ...]:
+    fields = []
+    for name, field in model.model_fields.items():
+        # Required fields missing from a document come out as null instead of failing the request
+        default = None if field.is_required() else field.get_default(call_default_factory=True)
+        fields.append((name, default))
+    return tuple(fields)
+
+
+def project(model: Type[BaseModel], docs: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Trusted documents -> plain dicts with exactly the model's fields, without validation."""
+    fields = _model_fields(model)
+    return [{name: doc.get(name, default) for name, default in fields} for doc in docs]
+
+
+def trusted_response(model: Type[BaseModel], docs: Iterable[Dict[str, Any]], headers: Dict[str, str] = None) -> ORJSONResponse:
+    return ORJSONResponse(project(model, docs), headers=headers)
@@ -1,11 +1,11 @@
 from fastapi import FastAPI, APIRouter, HTTPException, Depends, File, UploadFile, WebSocket, WebSocketDisconnect, Query, BackgroundTasks, Request
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.datastructures import Headers
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
-from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
 import os
 import logging
@@ -17,12 +17,10 @@ from datetime import datetime, timezone, timedelta
 import jwt
 import bcrypt
 import socketio
-import httpx
 import json
 
-import cloudinary
-import cloudinary.uploader
 import base64
+import io
 # Try new google.genai package first, fallback to deprecated google.generativeai
 try:
     import google.genai as genai
@@ -45,8 +43,29 @@ ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env') # Kept original path for consistency
 
 from scheduler import start_scheduler
-from email_service import send_new_content_notification, send_welcome_email, send_new_follower_email
+from job_coordinator import ensure_indexes as ensure_job_indexes, get_job_status
+from email_service import send_welcome_email, send_new_follower_email, ensure_outbox_indexes
+from digest import ensure_indexes as ensure_digest_indexes
+import messaging
+from pagination import before_cursor_filter, next_cursor
 from database import db
+from realtime import sio, presence, typing_tracker, user_room, conversation_room, join_conversation_room, leave_conversation_room
+from realtime import ensure_indexes as ensure_realtime_indexes, deliver_to_conversation, replay_events, replay_conversation_events, current_seq
+from realtime import register_socket, unregister_socket
+from notifications import notify, ensure_indexes as ensure_notification_indexes, flush as flush_notifications
+import notifications as notification_service
+from uploads import UPLOAD_DIR, MAX_MESSAGE_FILE_SIZE, MAX_PROJECT_FILE_SIZE, MAX_IMAGE_FILE_SIZE, UploadFiles, UploadSizeLimit
+import blobs
+import images
+from github import github, parse_github_username
+from cache import cached, response_cache
+from serialization import trusted_response
+from listings import (
+    POST_FIELDS, POST_LIST_FIELDS, POST_VIEWER_FIELDS, QUESTION_FIELDS, QUESTION_LIST_FIELDS,
+    parse_fields, post_projection, question_projection, post_summary, question_summary
+)
+from http_cache import document_etag, conditional_response, PUBLIC_REVALIDATE, PRIVATE_REVALIDATE
+from percolator import tag_followers, saved_searches, percolate_post, percolate_question, ensure_indexes as ensure_percolator_indexes
 
 # Initialize MongoDB
 # client and db are now imported from backend.database
@@ -57,22 +76,29 @@ JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key')
 JWT_ALGORITHM = 'HS256'
 JWT_EXPIRATION_HOURS = 72
 
-# Cloudinary Configuration
-cloudinary.config(
-    cloud_name=os.environ.get('CLOUDINARY_CLOUD_NAME', 'democloud'),
-    api_key=os.environ.get('CLOUDINARY_API_KEY', ''),
-    api_secret=os.environ.get('CLOUDINARY_API_SECRET', '')
-)
-
 # Lifespan context manager for startup/shutdown events
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     logging.info("Application startup - MongoDB connected")
     await seed_admin_user()
+    await ensure_job_indexes()
+    await ensure_outbox_indexes()
+    await ensure_digest_indexes()
+    await messaging.ensure_indexes()
+    await ensure_realtime_indexes()
+    await ensure_notification_indexes()
+    await ensure_percolator_indexes()
+    await blobs.ensure_indexes()
+    await tag_followers.load()
+    await saved_searches.load()
+    await github.start()
     start_scheduler() # Initialize scheduler
     yield
     # Shutdown
+    await flush_notifications()
+    await github.close()
+    images.shutdown()
     logging.info("Application shutdown - closing MongoDB connection")
     client.close()
 
@@ -105,30 +131,18 @@ async def seed_admin_user():
             logging.info("Updated existing admin user role")
 
 # Create FastAPI app with lifespan
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 api_router = APIRouter(prefix="/api")
 
 # Security
 security = HTTPBearer()
 
 # Mount uploads directory
-UPLOAD_DIR = ROOT_DIR / "uploads"
-UPLOAD_DIR.mkdir(exist_ok=True)
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
+app.mount("/uploads", UploadFiles(directory=UPLOAD_DIR), name="uploads")
 
 # Socket.IO setup
-sio = socketio.AsyncServer(
-    async_mode='asgi',
-    cors_allowed_origins='*',
-    logger=True,
-    engineio_logger=True
-)
-
 socket_app = socketio.ASGIApp(sio, app)
 
-# Store active connections
-active_connections: Dict[str, str] = {}  # user_id: sid
-
 # ====================
 # Models
 # ====================
@@ -215,9 +229,33 @@ class Post(BaseModel):
     views: int = 0
     commentsCount: int = 0
     published: bool = True
+    readingTime: Optional[int] = None
     createdAt: str
     updatedAt: str
 
+class PostListItem(BaseModel):
+    """A post in list responses; which fields are present depends on `fields`."""
+    id: str
+    authorId: Optional[str] = None
+    title: Optional[str] = None
+    excerpt: Optional[str] = None
+    coverImage: Optional[str] = None
+    category: Optional[str] = None
+    tags: Optional[List[str]] = None
+    views: Optional[int] = None
+    commentsCount: Optional[int] = None
+    published: Optional[bool] = None
+    readingTime: Optional[int] = None
+    likesCount: Optional[int] = None
+    bookmarksCount: Optional[int] = None
+    likedByMe: Optional[bool] = None
+    bookmarkedByMe: Optional[bool] = None
+    content: Optional[str] = None
+    likes: Optional[List[str]] = None
+    bookmarks: Optional[List[str]] = None
+    createdAt: Optional[str] = None
+    updatedAt: Optional[str] = None
+
 class Challenge(BaseModel):
     id: str
     title: str
@@ -303,6 +341,22 @@ class Question(BaseModel):
     createdAt: str
     updatedAt: str
 
+class QuestionListItem(BaseModel):
+    """A question in list responses; which fields are present depends on `fields`."""
+    id: str
+    userId: Optional[str] = None
+    title: Optional[str] = None
+    excerpt: Optional[str] = None
+    tags: Optional[List[str]] = None
+    status: Optional[str] = None
+    views: Optional[int] = None
+    upvotesCount: Optional[int] = None
+    upvotedByMe: Optional[bool] = None
+    description: Optional[str] = None
+    upvotes: Optional[List[str]] = None
+    createdAt: Optional[str] = None
+    updatedAt: Optional[str] = None
+
 class AnswerBase(BaseModel):
     content: str
 
@@ -373,6 +427,8 @@ class MessageAttachment(BaseModel):
     url: str
     size: int
     type: str  # mime type
+    sha256: Optional[str] = None  # blob store hash; derived on the server from url when a message is sent
+    variants: Optional[Dict[str, str]] = None  # resized WebP urls for images (thumb, display)
 
 class MessageCreate(BaseModel):
     conversationId: Optional[str] = None  # New: conversation-based
@@ -403,6 +459,7 @@ class Notification(BaseModel):
     message: str
     link: Optional[str] = None
     read: bool = False
+    actorCount: int = 1  # > 1 for grouped notifications
     createdAt: str
 
 class ReportCreate(BaseModel):
@@ -439,6 +496,9 @@ class UserSettings(BaseModel):
     notifications: Optional[Dict[str, Any]] = None
     privacy: Optional[Dict[str, Any]] = None
 
+class AvatarUpload(BaseModel):
+    avatar: str  # base64, optionally as a data: URL
+
 class ChangePassword(BaseModel):
     currentPassword: str
     newPassword: str
@@ -631,20 +691,11 @@ async def award_trophy(user_id: str, trophy_type: str):
     await db.trophies.insert_one(trophy)
     
     # Create notification
-    notification = {
-        "id": str(uuid.uuid4()),
-        "userId": user_id,
+    await notify([user_id], {
         "type": "trophy_earned",
         "message": f"🎉 You earned the {trophy_def['title']} trophy!",
-        "link": f"/profile/{user_id}",
-        "read": False,
-        "createdAt": datetime.now(timezone.utc).isoformat()
-    }
-    await db.notifications.insert_one(notification)
-    
-    # Emit socket event
-    if user_id in active_connections:
-        await sio.emit('new_notification', notification, room=active_connections[user_id])
+        "link": f"/profile/{user_id}"
+    })
 
 async def check_and_award_badges(user_id: str, action: str):
     """
@@ -880,7 +931,7 @@ async def get_me(user_id: str = Depends(get_current_user)):
 # ====================
 
 @api_router.get("/users/{username}")
-async def get_user_profile(username: str, request: Request):
+async def get_user_profile(username: str, request: Request, response: Response):
     user = await db.users.find_one({"username": username}, {"_id": 0, "passwordHash": 0})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -901,6 +952,10 @@ async def get_user_profile(username: str, request: Request):
         # Update the returned user object to reflect the increment (optimistic)
         user['profileViews'] = user.get('profileViews', 0) + 1
     
+    # Profiles include the email, so only the client itself may cache them
+    not_modified = conditional_response(request, response, document_etag(user, exclude=("profileViews",)), PRIVATE_REVALIDATE)
+    if not_modified:
+        return not_modified
     return user
 
 @api_router.get("/users/id/{user_id}")
@@ -930,39 +985,67 @@ async def update_user(update_data: UserUpdate, user_id: str = Depends(get_curren
     update_dict["updatedAt"] = datetime.now(timezone.utc).isoformat()
     
     await db.users.update_one({"id": user_id}, {"$set": update_dict})
+    if "followingTags" in update_dict:
+        tag_followers.set_tags(user_id, update_dict["followingTags"] or [])
     user = await db.users.find_one({"id": user_id}, {"_id": 0, "passwordHash": 0})
     return user
 
 @api_router.post("/users/avatar")
-async def upload_avatar(avatar: str, user_id: str = Depends(get_current_user)):
+async def upload_avatar(avatar_data: AvatarUpload, user_id: str = Depends(get_current_user)):
+    # avatar is base64 encoded, e.g. "data:image/png;base64,...."
+    header, _, encoded = avatar_data.avatar.rpartition(",")
+    content_type = header[5:].split(";")[0] if header.startswith("data:") else "image/png"
     try:
-        # avatar is base64 encoded
-        result = cloudinary.uploader.upload(
-            avatar,
-            folder="devconnect/avatars",
-            public_id=user_id,
-            overwrite=True
-        )
-        avatar_url = result["secure_url"]
-        
-        await db.users.update_one(
-            {"id": user_id},
-            {"$set": {"avatar": avatar_url, "updatedAt": datetime.now(timezone.utc).isoformat()}}
-        )
-        
-        return {"avatar": avatar_url}
-    except Exception as e:
-        # Fallback: use local storage or default
-        return {"avatar": f"https://api.dicebear.com/7.x/avataaars/svg?seed={user_id}"}
-
-@api_router.get("/users/{username}/posts", response_model=List[Post])
-async def get_user_posts(username: str):
+        content = base64.b64decode(encoded, validate=True)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid image")
+    if len(content) > MAX_IMAGE_FILE_SIZE:
+        raise HTTPException(status_code=413, detail=f"File too large (max {MAX_IMAGE_FILE_SIZE // (1024 * 1024)}MB)")
+    
+    # Resized to WebP in the image worker pool; EXIF is stripped
+    upload = UploadFile(file=io.BytesIO(content), filename="avatar", headers=Headers({"content-type": content_type}))
+    blob = await blobs.store_upload(upload, MAX_IMAGE_FILE_SIZE, images.AVATAR_VARIANTS)
+    if not blob["variantUrls"]:
+        raise HTTPException(status_code=400, detail="Invalid image")
+    variants = blob["variantUrls"]
+    
+    previous = await db.users.find_one_and_update(
+        {"id": user_id},
+        {"$set": {
+            "avatar": variants["md"],
+            "avatarVariants": variants,
+            "avatarSha256": blob["sha256"],
+            "updatedAt": datetime.now(timezone.utc).isoformat()
+        }},
+        projection={"_id": 0, "avatarSha256": 1}
+    )
+    await blobs.add_refs([blob["sha256"]])
+    if previous:
+        await blobs.release_refs([previous.get("avatarSha256")])
+    
+    return {"avatar": variants["md"], "variants": variants}
+
+@api_router.post("/images")
+async def upload_image(file: UploadFile = File(...), user_id: str = Depends(get_current_user)):
+    """Upload an image (e.g. a post cover) and get resized WebP variants back."""
+    blob = await blobs.store_upload(file, MAX_IMAGE_FILE_SIZE, images.COVER_VARIANTS)
+    if not blob["variantUrls"]:
+        raise HTTPException(status_code=400, detail="Invalid image")
+    # Starts unreferenced like any upload; the post using it as its cover takes the reference
+    variants = blob["variantUrls"]
+    return {"url": variants["display"], "original": blob["url"], "variants": variants, "sha256": blob["sha256"]}
+
+@api_router.get("/users/{username}/posts", response_model=List[PostListItem])
+async def get_user_posts(username: str, fields: Optional[str] = None, viewer_id: Optional[str] = Depends(get_current_user_optional)):
+    selected = parse_fields(fields, POST_FIELDS, POST_LIST_FIELDS)
     user = await db.users.find_one({"username": username})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    posts = await db.posts.find({"authorId": user["id"], "published": True}, {"_id": 0}).sort("createdAt", -1).to_list(100)
-    return posts
+    posts = await db.posts.find(
+        {"authorId": user["id"], "published": True}, post_projection(selected, viewer_id)
+    ).sort("createdAt", -1).to_list(100)
+    return ORJSONResponse(posts)
 
 @api_router.get("/users/{username}/questions", response_model=List[Question])
 async def get_user_questions(username: str):
@@ -971,7 +1054,7 @@ async def get_user_questions(username: str):
         raise HTTPException(status_code=404, detail="User not found")
         
     questions = await db.questions.find({"userId": user["id"]}, {"_id": 0}).sort("createdAt", -1).to_list(100)
-    return questions
+    return trusted_response(Question, questions)
 
 @api_router.get("/users/{username}/answers", response_model=List[Answer])
 async def get_user_answers(username: str):
@@ -980,7 +1063,7 @@ async def get_user_answers(username: str):
         raise HTTPException(status_code=404, detail="User not found")
         
     answers = await db.answers.find({"userId": user["id"]}, {"_id": 0}).sort("createdAt", -1).to_list(100)
-    return answers
+    return trusted_response(Answer, answers)
 
 @api_router.get("/users/{username}/stats")
 async def get_user_stats(username: str):
@@ -1025,20 +1108,14 @@ async def follow_user(target_user_id: str, background_tasks: BackgroundTasks, cu
     )
     
     # Create notification
-    notification = {
-        "id": str(uuid.uuid4()),
-        "userId": target_user_id,
+    await notify([target_user_id], {
         "type": "new_follower",
         "message": "You have a new follower!",
         "link": f"/profile/{current_user_id}",
-        "read": False,
-        "createdAt": datetime.now(timezone.utc).isoformat()
-    }
-    await db.notifications.insert_one(notification)
-    
-    # Emit via socket
-    if target_user_id in active_connections:
-        await sio.emit('new_notification', notification, room=active_connections[target_user_id])
+        "actorId": current_user_id,
+        "groupKey": "new_follower",
+        "template": "{actors} started following you"
+    })
     
     # Send email notification
     current_user = await db.users.find_one({"id": current_user_id})
@@ -1090,47 +1167,15 @@ async def get_user_trophies(username: str):
 
 @api_router.get("/users/{username}/github/repos")
 async def get_github_repos(username: str):
-    user = await db.users.find_one({"username": username})
+    user = await db.users.find_one({"username": username}, {"_id": 0, "githubUrl": 1})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    github_url = user.get("githubUrl")
-    if not github_url:
-        return []
-        
-    # Extract username from URL (e.g., https://github.com/shadow-monarch -> shadow-monarch)
-    # Handle various formats: https://github.com/user, http://github.com/user, github.com/user, user
-    github_username = github_url.rstrip("/").split("/")[-1]
-    
+    github_username = parse_github_username(user.get("githubUrl"))
     if not github_username:
         return []
 
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"https://api.github.com/users/{github_username}/repos?sort=updated&per_page=6",
-                headers={"User-Agent": "DevConnect-App"}
-            )
-            
-            if response.status_code == 200:
-                repos = response.json()
-                return [
-                    {
-                        "name": repo["name"],
-                        "description": repo["description"],
-                        "language": repo["language"],
-                        "stars": repo["stargazers_count"],
-                        "url": repo["html_url"],
-                        "updatedAt": repo["updated_at"]
-                    }
-                    for repo in repos
-                ]
-            else:
-                logging.error(f"GitHub API error: {response.status_code} - {response.text}")
-                return []
-    except Exception as e:
-        logging.error(f"Failed to fetch GitHub repos: {str(e)}")
-        return []
+    return await github.get_repos(github_username)
 
 @api_router.get("/users/me/settings")
 async def get_user_settings(user_id: str = Depends(get_current_user)):
@@ -1223,17 +1268,22 @@ async def delete_account(delete_data: DeleteAccount, user_id: str = Depends(get_
         raise HTTPException(status_code=400, detail="Please type DELETE to confirm")
     
     # Delete all user-related data
+    await blobs.release_post_covers({"authorId": user_id})
     await db.posts.delete_many({"authorId": user_id})
     await db.questions.delete_many({"userId": user_id})
     await db.answers.delete_many({"userId": user_id})
     await db.comments.delete_many({"userId": user_id})
     await db.trophies.delete_many({"userId": user_id})
     await db.notifications.delete_many({"userId": user_id})
+    await db.notification_state.delete_one({"_id": user_id})
+    tag_followers.remove_user(user_id)
+    await blobs.release_message_attachments({"$or": [{"senderId": user_id}, {"receiverId": user_id}]})
     await db.messages.delete_many({"$or": [{"senderId": user_id}, {"receiverId": user_id}]})
     await db.activities.delete_many({"userId": user_id})
     
     # Finally, delete the user
     await db.users.delete_one({"id": user_id})
+    await blobs.release_refs([user.get("avatarSha256")])
     
     return {"message": "Account deleted successfully"}
 
@@ -1310,12 +1360,9 @@ async def enhance_question(data: QuestionEnhanceRequest, user_id: str = Depends(
 # Routes - Challenges
 # ====================
 
-@api_router.get("/challenges/daily")
-async def get_daily_challenge(user_id: Optional[str] = Depends(get_current_user_optional)):
-    today = datetime.now().strftime("%Y-%m-%d")
-    
-    # Try to find today's challenge
-    challenge = await db.challenges.find_one({"date": today}, {"_id": 0})
+async def load_daily_challenge(today: str) -> Dict[str, Any]:
+    # Try to find today's challenge; solvedBy is left out, the solved flag is per request
+    challenge = await db.challenges.find_one({"date": today}, {"_id": 0, "solvedBy": 0})
     
     # If no challenge for today, create a mock one (for MVP)
     if not challenge:
@@ -1334,15 +1381,18 @@ async def get_daily_challenge(user_id: Optional[str] = Depends(get_current_user_
             "solvedBy": []
         }
         await db.challenges.insert_one(challenge)
-        del challenge["_id"]
-    
-    # Check if user solved it
-    challenge["solved"] = False
-    if user_id and user_id in challenge.get("solvedBy", []):
-        challenge["solved"] = True
-        
+        del challenge["_id"], challenge["solvedBy"]
     return challenge
 
+@api_router.get("/challenges/daily")
+async def get_daily_challenge(user_id: Optional[str] = Depends(get_current_user_optional)):
+    today = datetime.now().strftime("%Y-%m-%d")
+    challenge = await response_cache.get("challenges", today, lambda: load_daily_challenge(today), ttl=60, stale=300)
+    
+    # Check if user solved it; read from the database, since the cache is per worker
+    solved = bool(user_id) and await db.challenges.find_one({"id": challenge["id"], "solvedBy": user_id}, {"_id": 1}) is not None
+    return {**challenge, "solved": solved}
+
 class ChallengeSubmission(BaseModel):
     code: str
 
@@ -1436,6 +1486,7 @@ async def vote_solution(solution_id: str, user_id: str = Depends(get_current_use
         return {"message": "Vote added", "votes": len(solution["votes"]) + 1}
 
 @api_router.get("/projects")
+@cached("projects", ttl=30, stale=60)
 async def get_projects():
     projects = await db.projects.find({}, {"_id": 0}).sort("createdAt", -1).to_list(100)
     return projects
@@ -1458,6 +1509,7 @@ async def create_project(project: ProjectCreate, user_id: str = Depends(get_curr
     new_project["tasks"] = [] # Initialize empty tasks list
     
     await db.projects.insert_one(new_project)
+    response_cache.invalidate("projects")
     if "_id" in new_project:
         del new_project["_id"]
     return new_project
@@ -1490,6 +1542,7 @@ async def join_project(project_id: str, user_id: str = Depends(get_current_user)
     await db.projects.update_one({"id": project_id}, {"$addToSet": {"members": user_id}})
     # Default role is member, stored in roles dict
     await db.projects.update_one({"id": project_id}, {"$set": {f"roles.{user_id}": "member"}})
+    response_cache.invalidate("projects")
     return {"message": "Joined project successfully"}
 
 @api_router.post("/projects/{project_id}/tasks")
@@ -1523,23 +1576,15 @@ async def add_project_task(project_id: str, task: Dict[str, Any], user_id: str =
     }
     
     await db.projects.update_one({"id": project_id}, {"$push": {"tasks": new_task}})
+    response_cache.invalidate("projects")
     
     # Send notification to assignee if assigned
     if new_task.get("assigneeId") and new_task["assigneeId"] != user_id:
-        notification = {
-            "id": str(uuid.uuid4()),
-            "userId": new_task["assigneeId"],
+        await notify([new_task["assigneeId"]], {
             "type": "task_assigned",
             "message": f"You were assigned to task: {new_task['title']}",
-            "link": f"/projects/{project_id}",
-            "read": False,
-            "createdAt": datetime.now(timezone.utc).isoformat()
-        }
-        await db.notifications.insert_one(notification)
-        
-        # Emit via socket
-        if new_task["assigneeId"] in active_connections:
-            await sio.emit('new_notification', notification, room=active_connections[new_task["assigneeId"]])
+            "link": f"/projects/{project_id}"
+        })
     
     return new_task
 
@@ -1559,6 +1604,7 @@ async def promote_member(project_id: str, body: Dict[str, str], user_id: str = D
         raise HTTPException(status_code=400, detail="Invalid member to promote")
         
     await db.projects.update_one({"id": project_id}, {"$set": {f"roles.{target_user_id}": "co-admin"}})
+    response_cache.invalidate("projects")
     return {"message": "Member promoted to co-admin"}
 
 @api_router.patch("/projects/{project_id}/tasks/{task_id}/status")
@@ -1607,24 +1653,17 @@ async def update_task_status(
             }
         }
     )
+    response_cache.invalidate("projects")
     
     # Send notification to assignee if not the one updating
     assignee_id = task.get("assigneeId")
     if assignee_id and assignee_id != user_id:
         user_data = await db.users.find_one({"id": user_id})
-        notification = {
-            "id": str(uuid.uuid4()),
-            "userId": assignee_id,
+        await notify([assignee_id], {
             "type": "task_updated",
             "message": f"{user_data.get('name', 'Someone')} changed '{task['title']}' status to {new_status}",
-            "link": f"/projects/{project_id}",
-            "read": False,
-            "createdAt": datetime.now(timezone.utc).isoformat()
-        }
-        await db.notifications.insert_one(notification)
-        
-        if assignee_id in active_connections:
-            await sio.emit('new_notification', notification, room=active_connections[assignee_id])
+            "link": f"/projects/{project_id}"
+        })
     
     return {"message": "Task status updated", "status": new_status}
 
@@ -1653,6 +1692,7 @@ async def delete_task(
         {"id": project_id},
         {"$pull": {"tasks": {"id": task_id}}}
     )
+    response_cache.invalidate("projects")
     
     return {"message": "Task deleted successfully"}
 
@@ -1672,6 +1712,8 @@ async def delete_project(
     
     # Delete the project
     await db.projects.delete_one({"id": project_id})
+    response_cache.invalidate("projects")
+    await blobs.release_refs(f.get("sha256") for f in project.get("files", []))
     
     return {"message": "Project deleted successfully"}
 
@@ -1681,7 +1723,7 @@ async def upload_project_file(
     file: UploadFile = File(...), 
     user_id: str = Depends(get_current_user)
 ):
-    project = await db.projects.find_one({"id": project_id})
+    project = await db.projects.find_one({"id": project_id}, {"_id": 0, "members": 1})
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
         
@@ -1690,25 +1732,15 @@ async def upload_project_file(
 
     # Upload to local storage
     try:
-        # Read file content
-        content = await file.read()
-        
-        # Create unique filename
-        filename = f"{uuid.uuid4()}_{file.filename}"
-        file_path = UPLOAD_DIR / filename
-        
-        with open(file_path, "wb") as f:
-            f.write(content)
-        
-        # Generate URL (assuming localhost for dev, needs env var for prod)
-        # For now, we return a relative path or full path based on request
-        # But since we mounted /uploads, we can use that.
-        file_url = f"/uploads/{filename}"
+        # Streamed into the content-addressed store; identical files share one blob
+        blob = await blobs.store_upload(file, MAX_PROJECT_FILE_SIZE)
         
         file_data = {
             "id": str(uuid.uuid4()),
             "name": file.filename,
-            "url": file_url,
+            "url": blob["url"],
+            "size": blob["size"],
+            "sha256": blob["sha256"],
             "type": file.content_type,
             "uploadedBy": user_id,
             "uploadedAt": datetime.now(timezone.utc).isoformat()
@@ -1718,14 +1750,19 @@ async def upload_project_file(
             {"id": project_id}, 
             {"$push": {"files": file_data}}
         )
+        await blobs.add_refs([blob["sha256"]])
+        response_cache.invalidate("projects")
         
         return file_data
         
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"File upload failed: {str(e)}")
         raise HTTPException(status_code=500, detail="File upload failed")
 
 @api_router.get("/tutorials")
+@cached("tutorials", ttl=300, stale=600)
 async def get_tutorials():
     tutorials = await db.tutorials.find().to_list(100)
     # If empty, seed some data
@@ -1779,8 +1816,27 @@ async def get_tutorial(tutorial_id: str):
 # Routes - Posts
 # ====================
 
-@api_router.get("/posts/trending", response_model=List[Post])
-async def get_trending_posts(limit: int = 20):
+@api_router.get("/posts/trending", response_model=List[PostListItem])
+async def get_trending_posts(limit: int = 20, fields: Optional[str] = None, viewer_id: Optional[str] = Depends(get_current_user_optional)):
+    selected = parse_fields(fields, POST_FIELDS, POST_LIST_FIELDS)
+    # The cached list is shared by every viewer; the viewer's own flags are looked up per request
+    viewer_fields = [f for f in selected if f in POST_VIEWER_FIELDS]
+    shared_fields = tuple(f for f in selected if f not in POST_VIEWER_FIELDS)
+    posts = await load_trending_posts(limit=limit, fields=shared_fields)
+    if viewer_fields:
+        posts = await add_viewer_flags(posts, viewer_fields, viewer_id)
+    return ORJSONResponse(posts)
+
+async def add_viewer_flags(posts: List[Dict[str, Any]], flags: List[str], viewer_id: Optional[str]) -> List[Dict[str, Any]]:
+    # Copies, since the cached documents are shared
+    found: Dict[str, Dict[str, Any]] = {}
+    if viewer_id and posts:
+        cursor = db.posts.find({"id": {"$in": [p["id"] for p in posts]}}, post_projection(["id", *flags], viewer_id))
+        found = {doc.pop("id"): doc async for doc in cursor}
+    return [{**post, **{f: False for f in flags}, **found.get(post["id"], {})} for post in posts]
+
+@cached("trending_posts", ttl=60, stale=120)
+async def load_trending_posts(limit: int, fields: tuple) -> List[Dict[str, Any]]:
     # Simple trending algorithm: likes + comments
     # In a real app, this would be more complex (recency * popularity)
     pipeline = [
@@ -1789,14 +1845,15 @@ async def get_trending_posts(limit: int = 20):
             "popularity": {"$add": [{"$size": "$likes"}, "$commentsCount"]}
         }},
         {"$sort": {"popularity": -1, "createdAt": -1}},
-        {"$limit": limit}
+        {"$limit": limit},
+        {"$project": post_projection(fields)}
     ]
     
-    posts = await db.posts.aggregate(pipeline).to_list(limit)
-    return posts
+    return await db.posts.aggregate(pipeline).to_list(limit)
 
-@api_router.get("/posts/following", response_model=List[Post])
-async def get_following_posts(limit: int = 20, current_user_id: str = Depends(get_current_user)):
+@api_router.get("/posts/following", response_model=List[PostListItem])
+async def get_following_posts(limit: int = 20, fields: Optional[str] = None, current_user_id: str = Depends(get_current_user)):
+    selected = parse_fields(fields, POST_FIELDS, POST_LIST_FIELDS)
     user = await db.users.find_one({"id": current_user_id})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -1804,13 +1861,14 @@ async def get_following_posts(limit: int = 20, current_user_id: str = Depends(ge
     following_ids = user.get("following", [])
     
     cursor = db.posts.find(
-        {"authorId": {"$in": following_ids}, "published": True}
+        {"authorId": {"$in": following_ids}, "published": True},
+        post_projection(selected, current_user_id)
     ).sort("createdAt", -1).limit(limit)
     
     posts = await cursor.to_list(length=limit)
-    return posts
+    return ORJSONResponse(posts)
 
-@api_router.get("/posts", response_model=List[Post])
+@api_router.get("/posts", response_model=List[PostListItem])
 async def get_posts(
     skip: int = 0, 
     limit: int = 20, 
@@ -1820,8 +1878,11 @@ async def get_posts(
     tags: Optional[List[str]] = Query(None),
     sort: Optional[str] = "newest",
     timeframe: Optional[str] = "all",
-    min_likes: Optional[int] = 0
+    min_likes: Optional[int] = 0,
+    fields: Optional[str] = None,
+    viewer_id: Optional[str] = Depends(get_current_user_optional)
 ):
+    selected = parse_fields(fields, POST_FIELDS, POST_LIST_FIELDS)
     query = {"published": True}
     
     if category:
@@ -1885,19 +1946,20 @@ async def get_posts(
             {"$sort": {"likesCount": -1}},
             {"$skip": skip},
             {"$limit": limit},
-            {"$project": {"likesCount": 0}} # Remove computed field
+            {"$project": post_projection(selected, viewer_id)}
         ]
         posts = await db.posts.aggregate(pipeline).to_list(limit)
     else:
-        posts = await db.posts.find(query, {"_id": 0}).sort(sort_criteria).skip(skip).limit(limit).to_list(limit)
+        posts = await db.posts.find(query, post_projection(selected, viewer_id)).sort(sort_criteria).skip(skip).limit(limit).to_list(limit)
     
     # Add comment count to each post (if not already fetched via aggregation)
-    for post in posts:
-        if "commentsCount" not in post:
-            comment_count = await db.comments.count_documents({"postId": post["id"]})
-            post["commentsCount"] = comment_count
+    if "commentsCount" in selected:
+        for post in posts:
+            if "commentsCount" not in post:
+                comment_count = await db.comments.count_documents({"postId": post["id"]})
+                post["commentsCount"] = comment_count
     
-    return posts
+    return ORJSONResponse(posts)
 
 # Saved Searches Routes
 @api_router.post("/searches", response_model=SavedSearch)
@@ -1910,6 +1972,8 @@ async def create_saved_search(search_data: SavedSearchCreate, user_id: str = Dep
         "createdAt": datetime.now(timezone.utc).isoformat()
     }
     await db.saved_searches.insert_one(saved_search)
+    # New posts and questions are matched against it from now on
+    saved_searches.add(saved_search)
     return saved_search
 
 @api_router.get("/searches", response_model=List[SavedSearch])
@@ -1922,10 +1986,12 @@ async def delete_saved_search(search_id: str, user_id: str = Depends(get_current
     result = await db.saved_searches.delete_one({"id": search_id, "userId": user_id})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Saved search not found")
+    saved_searches.remove(search_id)
     return {"message": "Saved search deleted"}
 
-@api_router.get("/posts/feed", response_model=List[Post])
-async def get_personalized_feed(limit: int = 20, user_id: str = Depends(get_current_user)):
+@api_router.get("/posts/feed", response_model=List[PostListItem])
+async def get_personalized_feed(limit: int = 20, fields: Optional[str] = None, user_id: str = Depends(get_current_user)):
+    selected = parse_fields(fields, POST_FIELDS, POST_LIST_FIELDS)
     user = await db.users.find_one({"id": user_id})
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -1951,7 +2017,7 @@ async def get_personalized_feed(limit: int = 20, user_id: str = Depends(get_curr
     if not following_users and not following_tags:
         query = {"published": True}
     
-    posts = await db.posts.find(query, {"_id": 0}).sort("createdAt", -1).limit(limit).to_list(limit)
+    posts = await db.posts.find(query, post_projection(selected, user_id)).sort("createdAt", -1).limit(limit).to_list(limit)
     
     # If we didn't get enough posts, fill with general recent posts
     if len(posts) < limit:
@@ -1963,15 +2029,16 @@ async def get_personalized_feed(limit: int = 20, user_id: str = Depends(get_curr
             "id": {"$nin": existing_ids}
         }
         
-        fallback_posts = await db.posts.find(fallback_query, {"_id": 0}).sort("createdAt", -1).limit(remaining).to_list(remaining)
+        fallback_posts = await db.posts.find(fallback_query, post_projection(selected, user_id)).sort("createdAt", -1).limit(remaining).to_list(remaining)
         posts.extend(fallback_posts)
     
     # Add comment count
-    for post in posts:
-        comment_count = await db.comments.count_documents({"postId": post["id"]})
-        post["commentsCount"] = comment_count
+    if "commentsCount" in selected:
+        for post in posts:
+            comment_count = await db.comments.count_documents({"postId": post["id"]})
+            post["commentsCount"] = comment_count
         
-    return posts
+    return ORJSONResponse(posts)
 
 
 @api_router.get("/posts/bookmarked", response_model=List[Post])
@@ -1983,7 +2050,7 @@ async def get_bookmarked_posts(user_id: str = Depends(get_current_user)):
         comment_count = await db.comments.count_documents({"postId": post["id"]})
         post["commentsCount"] = comment_count
         
-    return posts
+    return trusted_response(Post, posts)
 
 
 @api_router.get("/search/autocomplete")
@@ -2029,7 +2096,7 @@ async def get_drafts(user_id: str = Depends(get_current_user)):
         {"authorId": user_id, "published": False}, 
         {"_id": 0}
     ).sort("updatedAt", -1).to_list(100)
-    return drafts
+    return trusted_response(Post, drafts)
 
 @api_router.get("/posts/trending", response_model=List[Post])
 async def get_trending_posts():
@@ -2051,10 +2118,10 @@ async def get_trending_posts():
         comment_count = await db.comments.count_documents({"postId": post["id"]})
         post["commentsCount"] = comment_count
         
-    return posts
+    return trusted_response(Post, posts)
 
 @api_router.post("/posts", response_model=Post)
-async def create_post(post_data: PostCreate, user_id: str = Depends(get_current_user)):
+async def create_post(post_data: PostCreate, background_tasks: BackgroundTasks, user_id: str = Depends(get_current_user)):
     post = post_data.model_dump()
     post["id"] = str(uuid.uuid4())
     post["authorId"] = user_id
@@ -2064,37 +2131,26 @@ async def create_post(post_data: PostCreate, user_id: str = Depends(get_current_
     post["published"] = post_data.published if post_data.published is not None else True
     post["createdAt"] = datetime.now(timezone.utc).isoformat()
     post["updatedAt"] = datetime.now(timezone.utc).isoformat()
+    post.update(post_summary(post))
+    post["coverSha256"] = await blobs.image_sha256(post.get("coverImage"))
     
     await db.posts.insert_one(post)
+    await blobs.add_refs([post["coverSha256"]])
     await update_user_points(user_id, 5, "post_created")
     
     # Check for badges
     await check_and_award_badges(user_id, "create_post")
     
-    # Trigger email notifications (background task)
-    # Find users who follow these tags
-    followers = await db.users.find({
-        "followingTags": {"$in": post["tags"]},
-        "emailSettings.newContent": True
-    }).to_list(100)
-    
-    for follower in followers:
-        if follower["id"] != user_id: # Don't notify self
-            # In a real app, use BackgroundTasks for this
-            asyncio.create_task(send_new_content_notification(
-                follower["email"], 
-                follower["username"], 
-                post["title"], 
-                post["tags"], 
-                post["id"]
-            ))
-    
     post_copy = post.copy()
     del post_copy["_id"]
+    response_cache.invalidate("trending_posts", "trending_tags")
+    
+    # Tag followers are matched from the in-memory index and notified after the response
+    background_tasks.add_task(percolate_post, post_copy)
     return post_copy
 
 @api_router.get("/posts/{post_id}", response_model=Post)
-async def get_post(post_id: str):
+async def get_post(post_id: str, request: Request, response: Response):
     post = await db.posts.find_one({"id": post_id}, {"_id": 0})
     if not post:
         raise HTTPException(status_code=404, detail="Post not found")
@@ -2103,6 +2159,10 @@ async def get_post(post_id: str):
     await db.posts.update_one({"id": post_id}, {"$inc": {"views": 1}})
     post["views"] += 1
     
+    cache_control = PUBLIC_REVALIDATE if post.get("published", True) else PRIVATE_REVALIDATE
+    not_modified = conditional_response(request, response, document_etag(post, exclude=("views",)), cache_control)
+    if not_modified:
+        return not_modified
     return post
 
 @api_router.put("/posts/{post_id}", response_model=Post)
@@ -2115,8 +2175,14 @@ async def update_post(post_id: str, post_data: PostCreate, user_id: str = Depend
     
     update_dict = post_data.model_dump()
     update_dict["updatedAt"] = datetime.now(timezone.utc).isoformat()
+    update_dict.update(post_summary(update_dict))
+    update_dict["coverSha256"] = await blobs.image_sha256(update_dict.get("coverImage"))
     
     await db.posts.update_one({"id": post_id}, {"$set": update_dict})
+    if update_dict["coverSha256"] != post.get("coverSha256"):
+        await blobs.add_refs([update_dict["coverSha256"]])
+        await blobs.release_refs([post.get("coverSha256")])
+    response_cache.invalidate("trending_posts", "trending_tags")
     updated_post = await db.posts.find_one({"id": post_id}, {"_id": 0})
     return updated_post
 
@@ -2129,6 +2195,8 @@ async def delete_post(post_id: str, user_id: str = Depends(get_current_user)):
         raise HTTPException(status_code=403, detail="Not authorized")
     
     await db.posts.delete_one({"id": post_id})
+    await blobs.release_refs([post.get("coverSha256")])
+    response_cache.invalidate("trending_posts", "trending_tags")
     return {"message": "Post deleted"}
 
 @api_router.post("/posts/{post_id}/like")
@@ -2169,19 +2237,27 @@ async def toggle_bookmark_post(post_id: str, user_id: str = Depends(get_current_
 # Routes - Questions
 # ====================
 
-@api_router.get("/questions", response_model=List[Question])
-async def get_questions(skip: int = 0, limit: int = 20, status: Optional[str] = None, tag: Optional[str] = None):
+@api_router.get("/questions", response_model=List[QuestionListItem])
+async def get_questions(
+    skip: int = 0,
+    limit: int = 20,
+    status: Optional[str] = None,
+    tag: Optional[str] = None,
+    fields: Optional[str] = None,
+    viewer_id: Optional[str] = Depends(get_current_user_optional)
+):
+    selected = parse_fields(fields, QUESTION_FIELDS, QUESTION_LIST_FIELDS)
     query = {}
     if status:
         query["status"] = status
     if tag:
         query["tags"] = tag
     
-    questions = await db.questions.find(query, {"_id": 0}).sort("createdAt", -1).skip(skip).limit(limit).to_list(limit)
-    return questions
+    questions = await db.questions.find(query, question_projection(selected, viewer_id)).sort("createdAt", -1).skip(skip).limit(limit).to_list(limit)
+    return ORJSONResponse(questions)
 
 @api_router.post("/questions", response_model=Question)
-async def create_question(question_data: QuestionCreate, user_id: str = Depends(get_current_user)):
+async def create_question(question_data: QuestionCreate, background_tasks: BackgroundTasks, user_id: str = Depends(get_current_user)):
     # Deduct 1 point for asking question
     user = await db.users.find_one({"id": user_id})
     if user and user.get("points", 0) < 1:
@@ -2194,16 +2270,20 @@ async def create_question(question_data: QuestionCreate, user_id: str = Depends(
     question["views"] = 0
     question["createdAt"] = datetime.now(timezone.utc).isoformat()
     question["updatedAt"] = datetime.now(timezone.utc).isoformat()
+    question.update(question_summary(question))
     
     await db.questions.insert_one(question)
     await update_user_points(user_id, -1, "question_asked")
     
     question_copy = question.copy()
     del question_copy["_id"]
+    
+    # Saved searches are matched after the response
+    background_tasks.add_task(percolate_question, question_copy)
     return question_copy
 
 @api_router.get("/questions/{question_id}", response_model=Question)
-async def get_question(question_id: str):
+async def get_question(question_id: str, request: Request, response: Response):
     question = await db.questions.find_one({"id": question_id}, {"_id": 0})
     if not question:
         raise HTTPException(status_code=404, detail="Question not found")
@@ -2212,6 +2292,9 @@ async def get_question(question_id: str):
     await db.questions.update_one({"id": question_id}, {"$inc": {"views": 1}})
     question["views"] += 1
     
+    not_modified = conditional_response(request, response, document_etag(question, exclude=("views",)))
+    if not_modified:
+        return not_modified
     return question
 
 @api_router.post("/questions/{question_id}/upvote", response_model=Question)
@@ -2240,21 +2323,15 @@ async def toggle_question_upvote(question_id: str, user_id: str = Depends(get_cu
         if question["userId"] != user_id:
             await update_user_points(question["userId"], 5, "question_upvoted")
             
-            # Notify author
-            notification = {
-                "id": str(uuid.uuid4()),
-                "userId": question["userId"],
+            # Notify author; repeat upvotes collapse into one notification
+            await notify([question["userId"]], {
                 "type": "question_upvote",
                 "message": "Someone upvoted your question!",
                 "link": f"/questions/{question_id}",
-                "read": False,
-                "createdAt": datetime.now(timezone.utc).isoformat()
-            }
-            await db.notifications.insert_one(notification)
-            
-            # Emit socket event
-            if question["userId"] in active_connections:
-                await sio.emit('new_notification', notification, room=active_connections[question["userId"]])
+                "actorId": user_id,
+                "groupKey": f"question_upvote:{question_id}",
+                "template": "{actors} upvoted your question!"
+            })
     
     # Return updated question
     question["upvotes"] = upvotes
@@ -2270,7 +2347,7 @@ async def toggle_question_upvote(question_id: str, user_id: str = Depends(get_cu
 @api_router.get("/questions/{question_id}/answers", response_model=List[Answer])
 async def get_answers(question_id: str):
     answers = await db.answers.find({"questionId": question_id}, {"_id": 0}).sort("createdAt", -1).to_list(1000)
-    return answers
+    return trusted_response(Answer, answers)
 
 @api_router.post("/answers", response_model=Answer)
 async def create_answer(answer_data: AnswerCreate, user_id: str = Depends(get_current_user)):
@@ -2288,20 +2365,14 @@ async def create_answer(answer_data: AnswerCreate, user_id: str = Depends(get_cu
     # Create notification for question author
     question = await db.questions.find_one({"id": answer_data.questionId})
     if question and question["userId"] != user_id:
-        notification = {
-            "id": str(uuid.uuid4()),
-            "userId": question["userId"],
+        await notify([question["userId"]], {
             "type": "new_answer",
             "message": f"New answer on your question: {question['title']}",
             "link": f"/questions/{answer_data.questionId}",
-            "read": False,
-            "createdAt": datetime.now(timezone.utc).isoformat()
-        }
-        await db.notifications.insert_one(notification)
-        
-        # Emit via socket
-        if question["userId"] in active_connections:
-            await sio.emit('new_notification', notification, room=active_connections[question["userId"]])
+            "actorId": user_id,
+            "groupKey": f"new_answer:{answer_data.questionId}",
+            "template": f"{{actors}} answered your question: {question['title']}"
+        })
             
     # Award 15 points for answering
     await update_user_points(user_id, 15, "answer_given")
@@ -2371,8 +2442,7 @@ async def create_comment(comment_data: CommentCreate, user_id: str = Depends(get
 @api_router.get("/posts/{post_id}/comments", response_model=List[Comment])
 async def get_post_comments(post_id: str):
     comments = await db.comments.find({"postId": post_id}, {"_id": 0}).sort("createdAt", -1).to_list(1000)
-    comments = await db.comments.find({"postId": post_id}, {"_id": 0}).sort("createdAt", -1).to_list(1000)
-    return comments
+    return trusted_response(Comment, comments)
 
 @api_router.delete("/comments/{comment_id}")
 async def delete_comment(comment_id: str, user_id: str = Depends(get_current_user)):
@@ -2411,6 +2481,7 @@ async def delete_question(question_id: str, user_id: str = Depends(get_current_u
 # ====================
 
 @api_router.get("/leaderboard")
+@cached("leaderboard", ttl=60, stale=120)
 async def get_leaderboard(period: str = "all", limit: int = 100):
     if period == "week":
         cutoff = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
@@ -2428,18 +2499,35 @@ async def get_leaderboard(period: str = "all", limit: int = 100):
 # Routes - Conversations & Messages
 # ====================
 
+@api_router.get("/presence")
+async def get_presence(userIds: str, user_id: str = Depends(get_current_user)):
+    ids = [i for i in userIds.split(",") if i][:200]
+    
+    # Online state comes from the in-memory registry; last-seen for offline users from the DB
+    offline_ids = [i for i in ids if not presence.is_online(i)]
+    last_seen = {}
+    if offline_ids:
+        docs = await db.users.find({"id": {"$in": offline_ids}}, {"_id": 0, "id": 1, "lastSeen": 1}).to_list(len(offline_ids))
+        last_seen = {d["id"]: d.get("lastSeen") for d in docs}
+    
+    return {
+        i: {
+            "online": presence.is_online(i),
+            "lastSeen": None if presence.is_online(i) else (presence.last_seen(i) or last_seen.get(i))
+        }
+        for i in ids
+    }
+
 @api_router.post("/conversations", response_model=Conversation)
 async def create_conversation(conv_data: ConversationCreate, user_id: str = Depends(get_current_user)):
-    # Check if 1:1 conversation already exists
+    # 1:1 conversations are looked up (or created) by their canonical pair key
     if not conv_data.isGroup and len(conv_data.participants) == 2:
-        existing = await db.conversations.find_one({
-            "isGroup": False,
-            "participants": {"$all": conv_data.participants}
-        })
-        if existing:
-            existing["_id"] = str(existing["_id"])
-            del existing["_id"]
-            return existing
+        conversation, created = await messaging.get_or_create_direct_conversation(
+            conv_data.participants[0], conv_data.participants[1], user_id
+        )
+        if created:
+            await join_conversation_room(conversation["id"], conversation["participants"])
+        return conversation
     
     conversation = conv_data.model_dump()
     conversation["id"] = str(uuid.uuid4())
@@ -2453,68 +2541,47 @@ async def create_conversation(conv_data: ConversationCreate, user_id: str = Depe
             conversation["name"] = "New Group"
     
     await db.conversations.insert_one(conversation)
+    await messaging.add_members(conversation["id"], conversation["participants"])
+    await join_conversation_room(conversation["id"], conversation["participants"])
     
     conversation_copy = conversation.copy()
     del conversation_copy["_id"]
     return conversation_copy
 
 @api_router.get("/conversations")
-async def get_conversations(user_id: str = Depends(get_current_user)):
-    # Get all conversations where user is a participant
+async def get_conversations(
+    response: Response,
+    limit: int = 50,
+    before: Optional[str] = None,
+    user_id: str = Depends(get_current_user)
+):
+    limit = max(1, min(limit, 100))
+    
+    # One range scan on (participants, updatedAt, id); lastMessage is kept on the conversation by send_message
     conversations = await db.conversations.find(
-        {"participants": user_id},
+        {"participants": user_id, **before_cursor_filter(before, "updatedAt")},
         {"_id": 0}
-    ).sort("updatedAt", -1).to_list(1000)
+    ).sort([("updatedAt", -1), ("id", -1)]).limit(limit).to_list(limit)
+    cursor = next_cursor(conversations, "updatedAt", limit)
+    if cursor:
+        response.headers["X-Next-Cursor"] = cursor
+    unread_counts = await messaging.get_unread_counts(user_id)
+    
+    # Participant details for the whole page in one query
+    participant_ids = list({p_id for conv in conversations for p_id in conv["participants"]})
+    users = await db.users.find({"id": {"$in": participant_ids}}, {"_id": 0, "passwordHash": 0}).to_list(len(participant_ids))
+    users_by_id = {u["id"]: u for u in users}
     
-    # Enrich with participant details and last message
     for conv in conversations:
-        # Get last message
-        last_msg = await db.messages.find_one(
-            {"conversationId": conv["id"]},
-            {"_id": 0},
-            sort=[("createdAt", -1)]
-        )
-        conv["lastMessage"] = last_msg
-        
-        # Get participant details
-        participant_details = []
-        for p_id in conv["participants"]:
-            user_doc = await db.users.find_one({"id": p_id}, {"_id": 0, "passwordHash": 0})
-            if user_doc:
-                participant_details.append(user_doc)
-        conv["participantDetails"] = participant_details
-    
-    # Also handle legacy 1:1 messages (backward compatibility)
-    legacy_messages = await db.messages.find(
-        {
-            "$or": [{"senderId": user_id}, {"receiverId": user_id}],
-            "conversationId": None  # Only get messages without conversationId
-        },
-        {"_id": 0}
-    ).sort("createdAt", -1).to_list(1000)
-    
-    # Group legacy messages by conversation partner
-    legacy_convs = {}
-    for msg in legacy_messages:
-        other_id = msg["receiverId"] if msg["senderId"] == user_id else msg["senderId"]
-        if other_id not in legacy_convs:
-            # Get other user details
-            other_user = await db.users.find_one({"id": other_id}, {"_id": 0, "passwordHash": 0})
-            if other_user:
-                legacy_convs[other_id] = {
-                    "id": f"legacy-{other_id}",
-                    "participants": [user_id, other_id],
-                    "participantDetails": [other_user],
-                    "isGroup": False,
-                    "createdBy": "",
-                    "createdAt": msg["createdAt"],
-                    "updatedAt": msg["createdAt"],
-                    "lastMessage": msg
-                }
-    
-    # Combine and return
-    all_conversations = conversations + list(legacy_convs.values())
-    return all_conversations
+        conv["unreadCount"] = unread_counts.get(conv["id"], 0)
+        conv["participantDetails"] = [users_by_id[p_id] for p_id in conv["participants"] if p_id in users_by_id]
+    
+    return conversations
+
+@api_router.get("/conversations/unread")
+async def get_unread_conversations(user_id: str = Depends(get_current_user)):
+    counts = await messaging.get_unread_counts(user_id)
+    return {"total": sum(counts.values()), "conversations": counts}
 
 @api_router.get("/conversations/{conversation_id}")
 async def get_conversation(conversation_id: str, user_id: str = Depends(get_current_user)):
@@ -2584,6 +2651,8 @@ async def add_conversation_member(
             "$set": {"updatedAt": datetime.now(timezone.utc).isoformat()}
         }
     )
+    await messaging.add_members(conversation_id, [member_id])
+    await join_conversation_room(conversation_id, [member_id])
     return {"message": "Member added"}
 
 @api_router.delete("/conversations/{conversation_id}/members/{member_id}")
@@ -2607,11 +2676,15 @@ async def remove_conversation_member(
             "$set": {"updatedAt": datetime.now(timezone.utc).isoformat()}
         }
     )
+    await messaging.remove_member(conversation_id, member_id)
+    await leave_conversation_room(conversation_id, [member_id])
     
     # If no participants left, delete conversation
     updated_conv = await db.conversations.find_one({"id": conversation_id})
     if not updated_conv["participants"]:
         await db.conversations.delete_one({"id": conversation_id})
+        await messaging.delete_members(conversation_id)
+        await sio.close_room(conversation_room(conversation_id))
     
     return {"message": "Member removed"}
 
@@ -2625,89 +2698,89 @@ async def delete_conversation(conversation_id: str, user_id: str = Depends(get_c
         raise HTTPException(status_code=403, detail="Only creator can delete conversation")
     
     await db.conversations.delete_one({"id": conversation_id})
+    await blobs.release_message_attachments({"conversationId": conversation_id})
     await db.messages.delete_many({"conversationId": conversation_id})
+    await messaging.delete_members(conversation_id)
+    await sio.close_room(conversation_room(conversation_id))
     return {"message": "Conversation deleted"}
 
 @api_router.get("/conversations/{conversation_id}/messages")
-async def get_conversation_messages(conversation_id: str, user_id: str = Depends(get_current_user)):
-    # Handle legacy format
-    if conversation_id.startswith("legacy-"):
-        other_user_id = conversation_id.replace("legacy-", "")
-        messages = await db.messages.find(
-            {"$or": [
-                {"senderId": user_id, "receiverId": other_user_id},
-                {"senderId": other_user_id, "receiverId": user_id}
-            ]},
-            {"_id": 0}
-        ).sort("createdAt", 1).to_list(1000)
-        
-        # Mark as read
-        await db.messages.update_many(
-            {"senderId": other_user_id, "receiverId": user_id, "read": False},
-            {"$set": {"read": True}}
-        )
-        return messages
-    
+async def get_conversation_messages(
+    conversation_id: str,
+    response: Response,
+    limit: int = messaging.MESSAGE_PAGE_SIZE,
+    before: Optional[str] = None,
+    user_id: str = Depends(get_current_user)
+):
+    # Newest page first; older pages are fetched with ?before=<X-Next-Cursor>
     # Check access
-    conversation = await db.conversations.find_one({"id": conversation_id})
+    conversation = await db.conversations.find_one({"id": conversation_id}, {"_id": 0, "participants": 1, "isGroup": 1})
     if not conversation:
         raise HTTPException(status_code=404, detail="Conversation not found")
     
     if user_id not in conversation["participants"]:
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    messages = await db.messages.find(
-        {"conversationId": conversation_id},
-        {"_id": 0}
-    ).sort("createdAt", 1).to_list(1000)
+    messages, older = await messaging.get_message_page({"conversationId": conversation_id}, limit, before)
+    if older:
+        response.headers["X-Next-Cursor"] = older
     
     # Enrich with sender details for groups
-    if conversation.get("isGroup"):
+    if conversation.get("isGroup") and messages:
+        sender_ids = list({msg["senderId"] for msg in messages})
+        senders = await db.users.find(
+            {"id": {"$in": sender_ids}},
+            {"_id": 0, "id": 1, "name": 1, "username": 1, "avatar": 1}
+        ).to_list(len(sender_ids))
+        senders_by_id = {s["id"]: s for s in senders}
         for msg in messages:
-            sender = await db.users.find_one({"id": msg["senderId"]}, {"_id": 0, "id": 1, "name": 1, "username": 1, "avatar": 1})
-            if sender:
-                msg["senderDetails"] = sender
-    
-    # Mark as read
-    await db.messages.update_many(
-        {"conversationId": conversation_id, "senderId": {"$ne": user_id}, "read": False},
-        {"$set": {"read": True}}
-    )
+            if msg["senderId"] in senders_by_id:
+                msg["senderDetails"] = senders_by_id[msg["senderId"]]
+    
+    # Move this reader's pointer instead of flipping `read` on every message;
+    # only the newest page can advance it
+    if not before:
+        await messaging.mark_read(conversation_id, user_id, messages[-1] if messages else None)
+    await messaging.annotate_read_state(conversation_id, user_id, messages)
     
     return messages
 
+@api_router.post("/conversations/{conversation_id}/read")
+async def mark_conversation_read(conversation_id: str, user_id: str = Depends(get_current_user)):
+    conversation = await db.conversations.find_one({"id": conversation_id, "participants": user_id}, {"_id": 1})
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    
+    last_message = await db.messages.find_one(
+        {"conversationId": conversation_id},
+        {"_id": 0, "id": 1, "createdAt": 1},
+        sort=[("createdAt", -1)]
+    )
+    await messaging.mark_read(conversation_id, user_id, last_message)
+    return {"message": "Conversation marked as read"}
+
 @api_router.post("/messages/upload", response_model=MessageAttachment)
 async def upload_message_file(file: UploadFile = File(...), user_id: str = Depends(get_current_user)):
-    # Validate file
-    MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-    file_content = await file.read()
-    if len(file_content) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail="File too large (max 10MB)")
+    # The request body is capped by UploadSizeLimit before the multipart is parsed
     
     try:
-        # Generate unique filename
-        import hashlib
-        from datetime import datetime
-        timestamp = datetime.now(timezone.utc).strftime("%Y%m%d_%H%M%S")
-        file_hash = hashlib.md5(file_content).hexdigest()[:8]
-        safe_filename = f"{timestamp}_{file_hash}_{file.filename}"
-        
-        # Save to local uploads directory
-        file_path = UPLOAD_DIR / safe_filename
-        with open(file_path, "wb") as f:
-            f.write(file_content)
+        # Stream into the content-addressed store; re-sent files reuse the stored blob.
+        # Images also get small WebP variants so chat lists don't load the original
+        blob = await blobs.store_upload(file, MAX_MESSAGE_FILE_SIZE, images.ATTACHMENT_VARIANTS)
         
-        # Generate full URL for the file (use network IP for cross-device access)
-        file_url = f"http://localhost:8000/uploads/{safe_filename}"
-        
-        logging.info(f"File uploaded successfully: {safe_filename}")
+        logging.info(f"File uploaded successfully: {blob['key']}")
         
+        # The blob is referenced once a message carrying this attachment is sent
         return MessageAttachment(
             filename=file.filename or "unknown",
-            url=file_url,
-            size=len(file_content),
-            type=file.content_type or "application/octet-stream"
+            url=blob["url"],
+            size=blob["size"],
+            type=file.content_type or "application/octet-stream",
+            sha256=blob["sha256"],
+            variants=blob["variantUrls"] or None
         )
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Upload error: {type(e).__name__}: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
@@ -2715,7 +2788,7 @@ async def upload_message_file(file: UploadFile = File(...), user_id: str = Depen
 @api_router.post("/messages", response_model=Message)
 async def send_message(message_data: MessageCreate, user_id: str = Depends(get_current_user)):
     message = message_data.model_dump()
-    message["id"] = str(uuid.uuid4())
+    message["id"] = messaging.new_message_id()
     message["senderId"] = user_id
     message["read"] = False
     message["createdAt"] = datetime.now(timezone.utc).isoformat()
@@ -2723,93 +2796,87 @@ async def send_message(message_data: MessageCreate, user_id: str = Depends(get_c
     # Handle backward compatibility with receiverId
     if not message.get("conversationId") and message.get("receiverId"):
         # Create or find 1:1 conversation
-        participants = sorted([user_id, message["receiverId"]])
-        conversation = await db.conversations.find_one({
-            "isGroup": False,
-            "participants": {"$all": participants}
-        })
-        
-        if not conversation:
-            # Create new 1:1 conversation
-            conversation = {
-                "id": str(uuid.uuid4()),
-                "participants": participants,
-                "isGroup": False,
-                "admins": [],
-                "createdBy": user_id,
-                "createdAt": datetime.now(timezone.utc).isoformat(),
-                "updatedAt": datetime.now(timezone.utc).isoformat()
-            }
-            await db.conversations.insert_one(conversation)
+        conversation, created = await messaging.get_or_create_direct_conversation(user_id, message["receiverId"], user_id)
+        if created:
+            await join_conversation_room(conversation["id"], conversation["participants"])
         
         message["conversationId"] = conversation["id"]
     
-    # Validate conversation access
-    if message.get("conversationId"):
-        conversation = await db.conversations.find_one({"id": message["conversationId"]})
-        if not conversation:
+    if not message.get("conversationId"):
+        raise HTTPException(status_code=400, detail="conversationId or receiverId is required")
+    
+    await blobs.verify_attachments(message.get("attachments") or [])
+    
+    # Validate conversation access and update its lastMessage/updatedAt in the same write
+    conversation = await messaging.touch_conversation(message["conversationId"], user_id, message)
+    if not conversation:
+        if not await db.conversations.find_one({"id": message["conversationId"]}, {"_id": 1}):
             raise HTTPException(status_code=404, detail="Conversation not found")
-        if user_id not in conversation["participants"]:
-            raise HTTPException(status_code=403, detail="Not authorized")
-        
-        # Update conversation's last activity
-        await db.conversations.update_one(
-            {"id": message["conversationId"]},
-            {"$set": {"updatedAt": datetime.now(timezone.utc).isoformat()}}
-        )
+        raise HTTPException(status_code=403, detail="Not authorized")
     
     await db.messages.insert_one(message)
     
-    # Emit via socket to all conversation participants
-    if message.get("conversationId"):
-        conv = await db.conversations.find_one({"id": message["conversationId"]})
-        if conv:
-            for participant_id in conv["participants"]:
-                if participant_id != user_id and participant_id in active_connections:
-                    await sio.emit('new_message', message, room=active_connections[participant_id])
-    elif message.get("receiverId"):
-        # Legacy support
-        if message["receiverId"] in active_connections:
-            await sio.emit('new_message', message, room=active_connections[message["receiverId"]])
-    
     message_copy = message.copy()
     del message_copy["_id"]
+    
+    await messaging.record_message(message["conversationId"], message_copy)
+    await blobs.add_refs(a.get("sha256") for a in message_copy.get("attachments") or [])
+    await typing_tracker.stop(user_id, conversation_room(message["conversationId"]))
+    
+    # One emit to the conversation room; the sender's own sockets are skipped
+    await deliver_to_conversation('new_message', message_copy, message["conversationId"], skip_sid=list(presence.sids_for(user_id)))
+    
     return message_copy
 
 # Keep old endpoint for backward compatibility
 @api_router.get("/messages/{other_user_id}")
-async def get_messages(other_user_id: str, user_id: str = Depends(get_current_user)):
-    messages = await db.messages.find(
-        {"$or": [
-            {"senderId": user_id, "receiverId": other_user_id},
-            {"senderId": other_user_id, "receiverId": user_id}
-        ]},
-        {"_id": 0}
-    ).sort("createdAt", 1).to_list(1000)
-    
-    # Mark as read
-    await db.messages.update_many(
-        {"senderId": other_user_id, "receiverId": user_id, "read": False},
-        {"$set": {"read": True}}
+async def get_messages(
+    other_user_id: str,
+    response: Response,
+    limit: int = messaging.MESSAGE_PAGE_SIZE,
+    before: Optional[str] = None,
+    user_id: str = Depends(get_current_user)
+):
+    # Served from the pair's 1:1 conversation
+    conversation = await db.conversations.find_one(
+        {"pairKey": messaging.pair_key(user_id, other_user_id)}, {"_id": 0, "id": 1}
     )
+    if not conversation:
+        return []
+    return await get_conversation_messages(conversation["id"], response, limit, before, user_id)
 
 # ====================
 # Routes - Notifications
 # ====================
 
 @api_router.get("/notifications", response_model=List[Notification])
-async def get_notifications(user_id: str = Depends(get_current_user)):
-    notifications = await db.notifications.find({"userId": user_id}, {"_id": 0}).sort("createdAt", -1).limit(50).to_list(50)
-    return notifications
+async def get_notifications(
+    limit: int = 50,
+    before: Optional[str] = None,
+    user_id: str = Depends(get_current_user)
+):
+    limit = max(1, min(limit, 100))
+    notifications = await db.notifications.find(
+        {"userId": user_id, **before_cursor_filter(before, "createdAt")},
+        {"_id": 0}
+    ).sort([("createdAt", -1), ("id", -1)]).limit(limit).to_list(limit)
+    cursor = next_cursor(notifications, "createdAt", limit)
+    notification_service.apply_read_pointer(notifications, await notification_service.get_read_state(user_id))
+    return trusted_response(Notification, notifications, headers={"X-Next-Cursor": cursor} if cursor else None)
+
+@api_router.get("/notifications/unread-count")
+async def get_unread_notification_count(user_id: str = Depends(get_current_user)):
+    return {"count": await notification_service.get_unread_count(user_id)}
 
 @api_router.put("/notifications/{notification_id}/read")
 async def mark_notification_read(notification_id: str, user_id: str = Depends(get_current_user)):
-    await db.notifications.update_one({"id": notification_id, "userId": user_id}, {"$set": {"read": True}})
+    await notification_service.mark_read(user_id, notification_id)
     return {"message": "Notification marked as read"}
 
 @api_router.put("/notifications/read-all")
 async def mark_all_notifications_read(user_id: str = Depends(get_current_user)):
-    await db.notifications.update_many({"userId": user_id, "read": False}, {"$set": {"read": True}})
+    # Moves the read pointer; no per-document writes
+    await notification_service.mark_all_read(user_id)
     return {"message": "All notifications marked as read"}
 
 # ====================
@@ -2839,8 +2906,16 @@ async def search(
     sort: str = "relevance",
     time: str = "all",
     tags: Optional[str] = None,
-    status: str = "all"
+    status: str = "all",
+    fields: Optional[str] = None,
+    viewer_id: Optional[str] = Depends(get_current_user_optional)
 ):
+    # One fields list covers both result types; each keeps the names it knows
+    post_fields, question_fields = list(POST_LIST_FIELDS), list(QUESTION_LIST_FIELDS)
+    if fields:
+        requested = parse_fields(fields, POST_FIELDS | QUESTION_FIELDS, ())
+        post_fields = [f for f in requested if f in POST_FIELDS]
+        question_fields = [f for f in requested if f in QUESTION_FIELDS]
     results = {}
     
     # Calculate date filter
@@ -2890,7 +2965,7 @@ async def search(
         if sort == "popular":
             post_sort = [("likes", -1), ("views", -1)]
 
-        posts = await db.posts.find(query, {"_id": 0}).sort(post_sort).limit(limit).to_list(limit)
+        posts = await db.posts.find(query, post_projection(post_fields, viewer_id)).sort(post_sort).limit(limit).to_list(limit)
         results["posts"] = posts
     
     # --- QUESTIONS ---
@@ -2924,7 +2999,7 @@ async def search(
              query["status"] = {"$ne": "answered"}
              question_sort = [("createdAt", -1)]
 
-        questions = await db.questions.find(query, {"_id": 0}).sort(question_sort).limit(limit).to_list(limit)
+        questions = await db.questions.find(query, question_projection(question_fields, viewer_id)).sort(question_sort).limit(limit).to_list(limit)
         results["questions"] = questions
     
     # --- USERS ---
@@ -3081,6 +3156,7 @@ async def create_question(question_data: QuestionCreate, user_id: str = Depends(
         "createdAt": datetime.now(timezone.utc).isoformat(),
         "updatedAt": datetime.now(timezone.utc).isoformat()
     }
+    new_question.update(question_summary(new_question))
     
     await db.questions.insert_one(new_question)
     
@@ -3158,18 +3234,14 @@ async def create_answer(answer_data: AnswerCreate, user_id: str = Depends(get_cu
     
     # Notify question author
     if question["userId"] != user_id:
-        notification = {
-            "id": str(uuid.uuid4()),
-            "userId": question["userId"],
+        await notify([question["userId"]], {
             "type": "new_answer",
             "message": f"New answer on your question: {question['title']}",
             "link": f"/questions/{question['id']}",
-            "read": False,
-            "createdAt": datetime.now(timezone.utc).isoformat()
-        }
-        await db.notifications.insert_one(notification)
-        if question["userId"] in active_connections:
-            await sio.emit('new_notification', notification, room=active_connections[question["userId"]])
+            "actorId": user_id,
+            "groupKey": f"new_answer:{question['id']}",
+            "template": f"{{actors}} answered your question: {question['title']}"
+        })
     
     return new_answer
 
@@ -3249,18 +3321,14 @@ async def create_comment(comment_data: CommentCreate, user_id: str = Depends(get
     if comment_data.parentId:
         parent = await db.comments.find_one({"id": comment_data.parentId})
         if parent and parent["userId"] != user_id:
-             notification = {
-                "id": str(uuid.uuid4()),
-                "userId": parent["userId"],
+             await notify([parent["userId"]], {
                 "type": "new_reply",
                 "message": f"Someone replied to your comment",
                 "link": f"/questions/TODO", # Ideally link to specific anchor
-                "read": False,
-                "createdAt": datetime.now(timezone.utc).isoformat()
-            }
-             await db.notifications.insert_one(notification)
-             if parent["userId"] in active_connections:
-                await sio.emit('new_notification', notification, room=active_connections[parent["userId"]])
+                "actorId": user_id,
+                "groupKey": f"new_reply:{comment_data.parentId}",
+                "template": "{actors} replied to your comment"
+            })
 
     return new_comment
 
@@ -3282,6 +3350,7 @@ async def upvote_comment(comment_id: str, user_id: str = Depends(get_current_use
 # ====================
 
 @api_router.get("/tags/trending")
+@cached("trending_tags", ttl=300, stale=600)
 async def get_trending_tags(limit: int = 10):
     # Aggregate tags from posts in the last 7 days
     cutoff = (datetime.now(timezone.utc) - timedelta(days=7)).isoformat()
@@ -3307,6 +3376,7 @@ async def follow_tag(tag: str, user_id: str = Depends(get_current_user)):
         {"id": user_id},
         {"$addToSet": {"followingTags": tag}}
     )
+    tag_followers.follow(user_id, tag)
     return {"message": f"Followed tag #{tag}"}
 
 @api_router.delete("/tags/{tag}/follow")
@@ -3319,6 +3389,7 @@ async def unfollow_tag(tag: str, user_id: str = Depends(get_current_user)):
         {"id": user_id},
         {"$pull": {"followingTags": tag}}
     )
+    tag_followers.unfollow(user_id, tag)
     return {"message": f"Unfollowed #{tag}"}
 
 @api_router.get("/tags/{tag}/info")
@@ -3340,6 +3411,7 @@ async def get_tag_info(tag: str):
     }
 
 @api_router.get("/badges")
+@cached("badges", ttl=3600)
 async def get_badges():
     return BADGES
 
@@ -3374,19 +3446,41 @@ async def connect(sid, environ):
 @sio.event
 async def disconnect(sid):
     logger.info(f"Client disconnected: {sid}")
-    # Remove from active connections
-    for user_id, conn_sid in list(active_connections.items()):
-        if conn_sid == sid:
-            del active_connections[user_id]
-            break
+    user_id, went_offline = presence.remove(sid)
+    await unregister_socket(sid)
+    if went_offline:
+        await typing_tracker.stop_all(user_id)
+        await db.users.update_one({"id": user_id}, {"$set": {"lastSeen": presence.last_seen(user_id)}})
 
 @sio.event
 async def authenticate(sid, data):
     try:
         token = data.get('token')
         user_id = decode_jwt_token(token)
-        active_connections[user_id] = sid
-        await sio.emit('authenticated', {'userId': user_id}, room=sid)
+        presence.add(sid, user_id)
+        await register_socket(sid, user_id)
+        await sio.enter_room(sid, user_room(user_id))
+        conversations = await db.conversations.find({"participants": user_id}, {"_id": 0, "id": 1}).to_list(None)
+        for conv in conversations:
+            await sio.enter_room(sid, conversation_room(conv["id"]))
+        # Rooms are joined before the replay queries, so nothing falls in between;
+        # clients drop live events whose seq they already got from the sync
+        since = data.get('since')
+        # {conversationId: seq} for the conversations the client has loaded
+        conversation_since = data.get('conversations') or {}
+        if since is None and not conversation_since:
+            await sio.emit('authenticated', {'userId': user_id, 'seq': await current_seq(user_id)}, room=sid)
+        else:
+            sync = await replay_events(user_id, int(since)) if since is not None else {
+                'events': [], 'seq': await current_seq(user_id), 'complete': True
+            }
+            member_of = {conv["id"] for conv in conversations}
+            sync['conversations'] = {
+                conversation_id: await replay_conversation_events(conversation_id, int(seq))
+                for conversation_id, seq in conversation_since.items() if conversation_id in member_of
+            }
+            await sio.emit('authenticated', {'userId': user_id, 'seq': sync['seq']}, room=sid)
+            await sio.emit('sync', sync, room=sid)
         logger.info(f"User {user_id} authenticated on socket {sid}")
     except Exception as e:
         await sio.emit('error', {'message': 'Authentication failed'}, room=sid)
@@ -3394,32 +3488,43 @@ async def authenticate(sid, data):
 @sio.event
 async def send_message(sid, data):
     try:
-        # data: {to: userId, content: str}
-        sender_id = None
-        for user_id, conn_sid in active_connections.items():
-            if conn_sid == sid:
-                sender_id = user_id
-                break
-        
+        # data: {conversationId | to: userId, content: str, attachments?: list}
+        sender_id = presence.user_for(sid)
         if not sender_id:
             return
         
+        conversation_id = data.get('conversationId')
+        receiver_id = data.get('to')
+        if not conversation_id and receiver_id:
+            # Direct messages by user id go to the pair's 1:1 conversation
+            conversation, created = await messaging.get_or_create_direct_conversation(sender_id, receiver_id, sender_id)
+            conversation_id = conversation["id"]
+            if created:
+                await join_conversation_room(conversation_id, conversation["participants"])
+        if not conversation_id:
+            return
+        
         message = {
-            "id": str(uuid.uuid4()),
+            "id": messaging.new_message_id(),
             "senderId": sender_id,
-            "receiverId": data['to'],
+            "conversationId": conversation_id,
+            "receiverId": receiver_id,
             "content": data['content'],
+            "attachments": [a for a in data.get('attachments') or [] if isinstance(a, dict)],
             "read": False,
             "createdAt": datetime.now(timezone.utc).isoformat()
         }
-        
+        await blobs.verify_attachments(message["attachments"])
+        conversation = await messaging.touch_conversation(conversation_id, sender_id, message)
+        if not conversation:
+            await sio.emit('error', {'message': 'Conversation not found'}, room=sid)
+            return
         await db.messages.insert_one(message)
-        
-        # Emit to receiver
-        if data['to'] in active_connections:
-            await sio.emit('receive_message', message, room=active_connections[data['to']])
-        
-        # Emit back to sender for confirmation
+        message.pop("_id", None)
+        await messaging.record_message(conversation_id, message)
+        await blobs.add_refs(a.get("sha256") for a in message.get("attachments") or [])
+        await typing_tracker.stop(sender_id, conversation_room(conversation_id))
+        await deliver_to_conversation('new_message', message, conversation_id, skip_sid=sid)
         await sio.emit('message_sent', message, room=sid)
     except Exception as e:
         logger.error(f"Error sending message: {e}")
@@ -3427,17 +3532,28 @@ async def send_message(sid, data):
 @sio.event
 async def typing(sid, data):
     try:
-        sender_id = None
-        for user_id, conn_sid in active_connections.items():
-            if conn_sid == sid:
-                sender_id = user_id
-                break
-        
+        sender_id = presence.user_for(sid)
         if not sender_id:
             return
         
-        if data['to'] in active_connections:
-            await sio.emit('user_typing', {'from': sender_id}, room=active_connections[data['to']])
+        # data: {conversationId | to: userId, isTyping?: bool}; only start/stop transitions are forwarded
+        conversation_id = data.get('conversationId')
+        if conversation_id:
+            # Only sockets already in the room may broadcast to it
+            room = conversation_room(conversation_id)
+            if room not in sio.rooms(sid):
+                return
+            payload = {'from': sender_id, 'conversationId': conversation_id}
+        elif data.get('to'):
+            room = user_room(data['to'])
+            payload = {'from': sender_id}
+        else:
+            return
+        
+        if data.get('isTyping', True):
+            await typing_tracker.start(sender_id, room, payload)
+        else:
+            await typing_tracker.stop(sender_id, room)
     except Exception as e:
         logger.error(f"Error in typing event: {e}")
 
@@ -3455,20 +3571,34 @@ async def get_all_users(admin: dict = Depends(get_current_admin_user)):
 @api_router.delete("/admin/users/{user_id}")
 async def admin_delete_user(user_id: str, admin: dict = Depends(get_current_admin_user)):
     # Delete user's posts, comments, answers, etc.
+    await blobs.release_post_covers({"authorId": user_id})
     await db.posts.delete_many({"authorId": user_id})
     await db.comments.delete_many({"userId": user_id})
     await db.questions.delete_many({"userId": user_id})
     await db.answers.delete_many({"userId": user_id})
-    await db.users.delete_one({"id": user_id})
+    user = await db.users.find_one_and_delete({"id": user_id}, projection={"_id": 0, "avatarSha256": 1})
+    if user:
+        await blobs.release_refs([user.get("avatarSha256")])
     return {"message": "User deleted successfully"}
 
 @api_router.delete("/admin/posts/{post_id}")
 async def admin_delete_post(post_id: str, admin: dict = Depends(get_current_admin_user)):
-    await db.posts.delete_one({"id": post_id})
+    post = await db.posts.find_one_and_delete({"id": post_id}, projection={"_id": 0, "coverSha256": 1})
+    if post:
+        await blobs.release_refs([post.get("coverSha256")])
     # Also delete comments for this post
     await db.comments.delete_many({"postId": post_id})
+    response_cache.invalidate("trending_posts", "trending_tags")
     return {"message": "Post deleted successfully"}
 
+@api_router.get("/admin/jobs")
+async def get_scheduled_jobs(admin: dict = Depends(get_current_admin_user)):
+    return await get_job_status()
+
+@api_router.get("/admin/cache")
+async def get_cache_metrics(admin: dict = Depends(get_current_admin_user)):
+    return response_cache.metrics()
+
 app.include_router(api_router)
 
 @app.exception_handler(RequestValidationError)
@@ -3479,6 +3609,19 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         content={"detail": exc.errors()},
     )
 
+# Upload bodies are cut off at the route's limit while they stream in (added before
+# CORS so the 413 still carries CORS headers)
+app.add_middleware(
+    UploadSizeLimit,
+    limits={
+        r"/api/messages/upload": MAX_MESSAGE_FILE_SIZE,
+        r"/api/projects/[^/]+/files": MAX_PROJECT_FILE_SIZE,
+        r"/api/images": MAX_IMAGE_FILE_SIZE,
+        # base64 in a JSON body is 4/3 the image size
+        r"/api/users/avatar": MAX_IMAGE_FILE_SIZE * 4 // 3,
+    }
+)
+
 # CORS
 app.add_middleware(
     CORSMiddleware,
@@ -3486,6 +3629,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Logging
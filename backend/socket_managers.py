@@ -0,0 +1,145 @@
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Dict, List, Set
+
+import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
+from pymongo import CursorType, ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+SOCKETIO_EVENTS_COLLECTION = "socketio_events"
+SOCKETIO_EVENTS_SIZE = 16 * 1024 * 1024  # bytes kept in the capped collection
+# Seqs re-read when a listener reopens its cursor, to catch inserts that landed out of order
+SOCKETIO_RESUME_OVERLAP = 1000
+
+
+class MongoPubSubManager(AsyncPubSubManager):
+    """Fans Socket.IO emits out to every worker through a capped collection.
+
+    Each worker publishes by inserting a document and listens with a tailable
+    cursor, so no broker beyond the existing MongoDB is needed.
+    """
+
+    name = 'mongo'
+
+    def __init__(self, db=None, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        if db is None:
+            from database import db
+        self.db = db
+        self._collection = None
+
+    async def _get_collection(self):
+        if self._collection is None:
+            names = await self.db.list_collection_names(filter={"name": SOCKETIO_EVENTS_COLLECTION})
+            if not names:
+                try:
+                    await self.db.create_collection(SOCKETIO_EVENTS_COLLECTION, capped=True, size=SOCKETIO_EVENTS_SIZE)
+                except Exception:
+                    # Another worker created it first
+                    pass
+            self._collection = self.db[SOCKETIO_EVENTS_COLLECTION]
+        return self._collection
+
+    async def _publish(self, data):
+        collection = await self._get_collection()
+        # ObjectIds come from each publisher's clock and counter, so they don't
+        # order messages across workers; a shared counter does
+        counter = await self.db.counters.find_one_and_update(
+            {"_id": f"socketio:{self.channel}"},
+            {"$inc": {"seq": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        await collection.insert_one({
+            "channel": self.channel,
+            "seq": counter["seq"],
+            "payload": json.dumps(data),
+            "createdAt": datetime.now(timezone.utc)
+        })
+
+    async def _listen(self):
+        collection = await self._get_collection()
+        # Only deliver messages published after this worker started
+        latest = await collection.find_one({"channel": self.channel, "seq": {"$exists": True}}, sort=[("$natural", -1)])
+        floor = latest["seq"] if latest else 0
+        last_seq = floor
+        seen: Set[int] = set()
+        seen_order: Deque[int] = deque()
+        while True:
+            # A seq is taken before its insert, so two publishers can land out of
+            # order; reopening a little before the last seq and skipping the ones
+            # already seen picks up a late insert without repeating anything
+            start = max(floor, last_seq - SOCKETIO_RESUME_OVERLAP)
+            cursor = collection.find(
+                {"channel": self.channel, "seq": {"$gt": start}},
+                cursor_type=CursorType.TAILABLE_AWAIT
+            )
+            try:
+                while cursor.alive:
+                    async for doc in cursor:
+                        seq = doc["seq"]
+                        if seq in seen:
+                            continue
+                        seen.add(seq)
+                        seen_order.append(seq)
+                        if len(seen_order) > SOCKETIO_RESUME_OVERLAP * 2:
+                            seen.discard(seen_order.popleft())
+                        last_seq = max(last_seq, seq)
+                        yield json.loads(doc["payload"])
+            except Exception as e:
+                logger.error(f"Socket.IO pub/sub cursor failed: {e}")
+            # Tailable cursors die on an empty result or when they fall behind; reopen
+            await asyncio.sleep(1)
+
+
+class LoopbackPubSubManager(AsyncPubSubManager):
+    """In-process stand-in for a message queue.
+
+    Every server created with this manager in the same process receives every
+    message, which lets tests run several AsyncServer instances as if they were
+    separate workers.
+    """
+
+    name = 'loopback'
+    _subscribers: Dict[str, List[asyncio.Queue]] = {}
+
+    async def _publish(self, data):
+        for queue in self._subscribers.get(self.channel, []):
+            queue.put_nowait(json.loads(json.dumps(data)))
+
+    async def _listen(self):
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(self.channel, []).append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers[self.channel].remove(queue)
+
+
+def create_client_manager():
+    """Pick the Socket.IO client manager from SOCKETIO_MANAGER.
+
+    memory (default) keeps everything in this process, which is only correct with
+    a single worker. mongo and redis fan emits out across workers.
+    """
+    kind = os.environ.get('SOCKETIO_MANAGER', 'memory').lower()
+    channel = os.environ.get('SOCKETIO_CHANNEL', 'devconnect')
+
+    if kind == 'mongo':
+        return MongoPubSubManager(channel=channel)
+    if kind == 'redis':
+        redis_url = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+        # Needs the optional `redis` package
+        return socketio.AsyncRedisManager(redis_url, channel=channel)
+    if kind == 'loopback':
+        return LoopbackPubSubManager(channel=channel)
+    if kind != 'memory':
+        logger.warning(f"Unknown SOCKETIO_MANAGER '{kind}', using in-memory manager")
+    return None
@@ -0,0 +1,82 @@
+import asyncio
+import gzip
+
+from blobs import LocalBlobBackend, blob_key, variant_key, _sha256_from_url, _image_sha256_from_url
+
+SHA = "ab" * 32
+
+
+def write_temp(tmp_path, data: bytes):
+    path = tmp_path / "upload.tmp"
+    path.write_bytes(data)
+    return path
+
+
+def test_blob_keys_are_sharded_by_hash():
+    assert blob_key(SHA, "Report.PDF") == f"blobs/ab/ab/{SHA}.pdf"
+    assert blob_key(SHA, "no-extension") == f"blobs/ab/ab/{SHA}"
+    assert blob_key(SHA, "weird.ex$t") == f"blobs/ab/ab/{SHA}"
+    assert variant_key(SHA, "thumb") == f"blobs/ab/ab/{SHA}_thumb.webp"
+
+
+def test_put_exists_and_delete(tmp_path):
+    backend = LocalBlobBackend(root=tmp_path / "store")
+    key = blob_key(SHA, "photo.png")
+    temp = write_temp(tmp_path, b"\x89PNG not really")
+
+    async def scenario():
+        assert not await backend.exists(key)
+        await backend.put(temp, key, "image/png")
+        assert await backend.exists(key)
+        await backend.delete(key)
+        assert not await backend.exists(key)
+        # Deleting twice is harmless, GC may retry a half-finished blob
+        await backend.delete(key)
+
+    asyncio.run(scenario())
+    assert not temp.exists()
+    assert not (tmp_path / "store" / f"{key}.gz").exists()
+
+
+def test_compressible_types_get_a_gzip_sibling(tmp_path):
+    backend = LocalBlobBackend(root=tmp_path / "store")
+    key = blob_key(SHA, "data.json")
+    body = b'{"items": [' + b'{"name": "value"}, ' * 500 + b'{}]}'
+    asyncio.run(backend.put(write_temp(tmp_path, body), key, "application/json"))
+
+    compressed = tmp_path / "store" / f"{key}.gz"
+    assert gzip.decompress(compressed.read_bytes()) == body
+
+    asyncio.run(backend.delete(key))
+    assert not compressed.exists()
+
+
+def test_gzip_sibling_is_dropped_when_it_does_not_help(tmp_path):
+    backend = LocalBlobBackend(root=tmp_path / "store")
+    key = blob_key(SHA, "tiny.txt")
+    asyncio.run(backend.put(write_temp(tmp_path, b"x"), key, "text/plain"))
+    assert (tmp_path / "store" / key).read_bytes() == b"x"
+    assert not (tmp_path / "store" / f"{key}.gz").exists()
+
+
+def test_urls_use_the_public_base():
+    key = blob_key(SHA, "a.png")
+    assert LocalBlobBackend().url(key) == f"/uploads/{key}"
+    public = LocalBlobBackend(public_url="https://api.example.com/uploads/")
+    assert public.url(key) == f"https://api.example.com/uploads/{key}"
+
+
+def test_attachment_hash_comes_from_the_blob_url():
+    key = blob_key(SHA, "a.png")
+    assert _sha256_from_url(f"https://api.example.com/uploads/{key}") == SHA
+    assert _sha256_from_url(f"http://localhost:8000/uploads/{key}") == SHA
+    assert _sha256_from_url(f"/uploads/{variant_key(SHA, 'thumb')}") is None
+    assert _sha256_from_url("https://example.com/uploads/other/file.png") is None
+    assert _sha256_from_url(None) is None
+
+
+def test_image_hash_comes_from_original_or_variant_url():
+    assert _image_sha256_from_url(f"/uploads/{variant_key(SHA, 'display')}") == SHA
+    assert _image_sha256_from_url(f"https://api.example.com/uploads/{blob_key(SHA, 'a.jpg')}") == SHA
+    assert _image_sha256_from_url("https://res.cloudinary.com/demo/image/upload/cover.jpg") is None
+    assert _image_sha256_from_url(None) is None
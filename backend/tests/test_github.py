@@ -0,0 +1,161 @@
+import asyncio
+
+import httpx
+
+import github
+from github import GitHubClient
+
+BASE_URL = "https://github.test"
+
+
+def repo(name: str, stars: int = 0):
+    return {
+        "name": name,
+        "description": None,
+        "language": "Python",
+        "stargazers_count": stars,
+        "html_url": f"https://github.com/octo/{name}",
+        "updated_at": "2024-01-01T00:00:00Z"
+    }
+
+
+def make_client(handler) -> GitHubClient:
+    client = GitHubClient(base_url=BASE_URL, token=None)
+    client._client = httpx.AsyncClient(base_url=BASE_URL, transport=httpx.MockTransport(handler))
+    return client
+
+
+def age(client: GitHubClient, username: str, seconds: float):
+    client._cache[username.lower()].fetched_at -= seconds
+
+
+def test_stale_entry_revalidates_with_etag():
+    requests = []
+
+    def handler(request: httpx.Request):
+        requests.append(request)
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, json=[repo("one")], headers={"ETag": '"v1"'})
+
+    async def scenario():
+        client = make_client(handler)
+        first = await client.get_repos("Octo")
+        age(client, "octo", github.GITHUB_FRESH_SECONDS + 1)
+        # Served from cache at once; the 304 refresh runs in the background
+        assert await client.get_repos("octo") == first
+        await asyncio.gather(*client._inflight.values())
+        assert await client.get_repos("octo") == first
+        await client.close()
+        return client
+
+    client = asyncio.run(scenario())
+    assert len(requests) == 2
+    assert "if-none-match" not in requests[0].headers
+    assert requests[1].url.path == "/users/octo/repos"
+    assert client.stats == {"hits": 1, "stale": 1, "misses": 1, "notModified": 1, "errors": 0}
+
+
+def test_stale_entry_is_replaced_by_background_refresh():
+    versions = iter([[repo("old")], [repo("new", stars=5)]])
+
+    def handler(request: httpx.Request):
+        return httpx.Response(200, json=next(versions))
+
+    async def scenario():
+        client = make_client(handler)
+        await client.get_repos("octo")
+        age(client, "octo", github.GITHUB_FRESH_SECONDS + 1)
+        stale = await client.get_repos("octo")
+        await asyncio.gather(*client._inflight.values())
+        fresh = await client.get_repos("octo")
+        await client.close()
+        return stale, fresh
+
+    stale, fresh = asyncio.run(scenario())
+    assert [r["name"] for r in stale] == ["old"]
+    assert fresh[0]["name"] == "new" and fresh[0]["stars"] == 5
+
+
+def test_entry_past_stale_limit_is_fetched_inline():
+    versions = iter([[repo("old")], [repo("new")]])
+
+    def handler(request: httpx.Request):
+        return httpx.Response(200, json=next(versions))
+
+    async def scenario():
+        client = make_client(handler)
+        await client.get_repos("octo")
+        age(client, "octo", github.GITHUB_STALE_SECONDS + 1)
+        repos = await client.get_repos("octo")
+        await client.close()
+        return repos
+
+    assert [r["name"] for r in asyncio.run(scenario())] == ["new"]
+
+
+def test_concurrent_misses_share_one_request():
+    calls = 0
+
+    async def handler(request: httpx.Request):
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.05)
+        return httpx.Response(200, json=[repo("one")])
+
+    async def scenario():
+        client = make_client(handler)
+        results = await asyncio.gather(*(client.get_repos("octo") for _ in range(5)))
+        await client.close()
+        return results
+
+    results = asyncio.run(scenario())
+    assert calls == 1
+    assert all(r == results[0] for r in results)
+
+
+def test_rate_limit_stops_requests_until_reset():
+    calls = 0
+
+    def handler(request: httpx.Request):
+        nonlocal calls
+        calls += 1
+        if request.url.path == "/users/cached/repos":
+            return httpx.Response(200, json=[repo("kept")])
+        return httpx.Response(403, text="rate limited", headers={"Retry-After": "120"})
+
+    async def scenario():
+        client = make_client(handler)
+        await client.get_repos("cached")
+        age(client, "cached", github.GITHUB_STALE_SECONDS + 1)
+        # The error is swallowed: no entry, so nothing to show
+        assert await client.get_repos("octo") == []
+        assert calls == 2
+        # Blocked: the expired entry is served and GitHub is not called
+        kept = await client.get_repos("cached")
+        assert await client.get_repos("someone") == []
+        await client.close()
+        return client, kept
+
+    client, kept = asyncio.run(scenario())
+    assert calls == 2
+    assert [r["name"] for r in kept] == ["kept"]
+    assert client.stats["errors"] == 1
+
+
+def test_unknown_user_is_cached_as_empty():
+    calls = 0
+
+    def handler(request: httpx.Request):
+        nonlocal calls
+        calls += 1
+        return httpx.Response(404, json={"message": "Not Found"})
+
+    async def scenario():
+        client = make_client(handler)
+        assert await client.get_repos("ghost") == []
+        assert await client.get_repos("ghost") == []
+        await client.close()
+
+    asyncio.run(scenario())
+    assert calls == 1
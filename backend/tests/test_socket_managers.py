@@ -0,0 +1,106 @@
+import asyncio
+import json
+
+import socketio
+
+from socket_managers import LoopbackPubSubManager
+
+
+class Worker:
+    """An AsyncServer on the loopback queue that records what it sends to sockets."""
+
+    def __init__(self, channel: str):
+        self.sio = socketio.AsyncServer(client_manager=LoopbackPubSubManager(channel=channel), async_mode="asgi")
+        self.sent = []
+        self.sio.eio.send_packet = self._send_packet
+
+    @classmethod
+    async def start(cls, channel: str, count: int = 1):
+        workers = [cls(channel) for _ in range(count)]
+        for worker in workers:
+            worker.sio.manager.initialize()
+        # The listener tasks subscribe once they first run
+        await wait_until(lambda: len(LoopbackPubSubManager._subscribers.get(channel, [])) == count)
+        return workers
+
+    async def _send_packet(self, eio_sid, packet):
+        # Socket.IO message packets look like 2["event",{...}]
+        event, data = json.loads(packet.data[packet.data.index("["):])
+        self.sent.append((eio_sid, event, data))
+
+    async def connect(self, eio_sid: str, *rooms: str) -> str:
+        sid = await self.sio.manager.connect(eio_sid, "/")
+        for room in rooms:
+            await self.sio.enter_room(sid, room)
+        return sid
+
+
+async def wait_until(condition, timeout: float = 1.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def test_room_emit_reaches_sockets_on_every_worker():
+    async def scenario():
+        a, b = await Worker.start("room-emit", 2)
+        await a.connect("eio-a", "user:1")
+        await b.connect("eio-b", "user:1")
+        await b.connect("eio-other", "user:2")
+
+        await a.sio.emit("new_message", {"content": "hi", "seq": 7}, room="user:1")
+
+        await wait_until(lambda: a.sent and b.sent)
+        await asyncio.sleep(0.05)
+        assert a.sent == [("eio-a", "new_message", {"content": "hi", "seq": 7})]
+        assert b.sent == [("eio-b", "new_message", {"content": "hi", "seq": 7})]
+
+    asyncio.run(scenario())
+
+
+def test_skip_sid_applies_across_workers():
+    async def scenario():
+        a, b = await Worker.start("skip-sid", 2)
+        sender = await a.connect("eio-sender", "user:1")
+        await b.connect("eio-tab", "user:1")
+
+        await a.sio.emit("user_typing", {"from": "1"}, room="user:1", skip_sid=[sender])
+
+        await wait_until(lambda: b.sent)
+        await asyncio.sleep(0.05)
+        assert a.sent == []
+        assert [eio_sid for eio_sid, _, _ in b.sent] == ["eio-tab"]
+
+    asyncio.run(scenario())
+
+
+def test_channels_are_isolated():
+    async def scenario():
+        [a], [b] = await Worker.start("channel-one"), await Worker.start("channel-two")
+        await b.connect("eio-b", "user:1")
+
+        await a.sio.emit("new_notification", {"id": "n1"}, room="user:1")
+
+        await asyncio.sleep(0.1)
+        assert b.sent == []
+
+    asyncio.run(scenario())
+
+
+def test_room_membership_changes_reach_sockets_on_other_workers():
+    async def scenario():
+        a, b = await Worker.start("enter-room", 2)
+        sid = await b.connect("eio-b")
+
+        # Worker a doesn't hold the socket; the change is published to b
+        await a.sio.enter_room(sid, "conversation:1")
+        await a.sio.emit("new_message", {"content": "welcome"}, room="conversation:1")
+        await wait_until(lambda: b.sent)
+
+        await a.sio.leave_room(sid, "conversation:1")
+        await a.sio.emit("new_message", {"content": "gone"}, room="conversation:1")
+        await asyncio.sleep(0.1)
+        assert b.sent == [("eio-b", "new_message", {"content": "welcome"})]
+
+    asyncio.run(scenario())
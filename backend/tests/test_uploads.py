@@ -0,0 +1,38 @@
+import gzip
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from uploads import UploadFiles
+
+SHA = "ab" * 32
+BODY = b'{"a": 1}' * 100
+
+
+def make_client(tmp_path) -> TestClient:
+    shard = tmp_path / "blobs" / "ab" / "ab"
+    shard.mkdir(parents=True)
+    (shard / f"{SHA}.json").write_bytes(BODY)
+    (shard / f"{SHA}.json.gz").write_bytes(gzip.compress(BODY))
+    app = FastAPI()
+    app.mount("/uploads", UploadFiles(directory=tmp_path), name="uploads")
+    return TestClient(app)
+
+
+def test_precompressed_sibling_is_served_through_accept_encoding(tmp_path):
+    client = make_client(tmp_path)
+    url = f"/uploads/blobs/ab/ab/{SHA}.json"
+
+    identity = client.get(url, headers={"Accept-Encoding": "identity"})
+    encoded = client.get(url, headers={"Accept-Encoding": "gzip"})
+
+    assert identity.headers["etag"] == f'"{SHA}"'
+    assert "content-encoding" not in identity.headers
+    assert encoded.headers["content-encoding"] == "gzip"
+    assert encoded.headers["etag"] == f'"{SHA}-gzip"'
+    assert encoded.content == BODY
+
+
+def test_precompressed_sibling_is_not_served_directly(tmp_path):
+    client = make_client(tmp_path)
+    assert client.get(f"/uploads/blobs/ab/ab/{SHA}.json.gz").status_code == 404
@@ -0,0 +1,221 @@
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import uuid
+from email.utils import formatdate
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import aiofiles
+import aiofiles.os
+from fastapi import HTTPException, UploadFile
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+
+from http_cache import etag_matches
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = Path(__file__).parent / "uploads"
+UPLOAD_DIR.mkdir(exist_ok=True)
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # bytes read and written per step
+MAX_MESSAGE_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+MAX_PROJECT_FILE_SIZE = 25 * 1024 * 1024  # 25MB
+MAX_IMAGE_FILE_SIZE = 5 * 1024 * 1024  # 5MB, avatars and cover images
+MULTIPART_ALLOWANCE = 64 * 1024
+
+
+class UploadSizeLimit:
+    """ASGI middleware that caps request bodies on upload routes.
+
+    `limits` maps a path regex to the largest file the route accepts. A
+    declared Content-Length over it is refused before anything is read;
+    otherwise body bytes are counted as the app pulls them from `receive` and
+    the request fails with 413 once the limit is crossed, so an oversized
+    multipart body is never spooled to disk in full.
+    """
+
+    def __init__(self, app, limits: Dict[str, int]):
+        self.app = app
+        self.limits = [(re.compile(pattern), limit) for pattern, limit in limits.items()]
+
+    def _limit_for(self, path: str) -> Optional[int]:
+        for pattern, limit in self.limits:
+            if pattern.fullmatch(path):
+                return limit
+        return None
+
+    async def __call__(self, scope, receive, send):
+        limit = self._limit_for(scope["path"]) if scope["type"] == "http" else None
+        if limit is None:
+            await self.app(scope, receive, send)
+            return
+        # Room for the multipart envelope and form fields around the file
+        max_body = limit + MULTIPART_ALLOWANCE
+        detail = f"File too large (max {limit // (1024 * 1024)}MB)"
+
+        declared = Headers(scope=scope).get("content-length")
+        if declared and declared.isdigit() and int(declared) > max_body:
+            await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body:
+                    # Raised inside the body read, so FastAPI answers with the 413
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def stream_to_temp(file: UploadFile, max_size: int, directory: Path = UPLOAD_DIR) -> Dict[str, Any]:
+    """Copy an upload to a temp file in chunks, hashing as it goes.
+
+    Returns {"tempPath", "size", "sha256"}. Aborts with 413 as soon as the
+    size limit is crossed; the partial temp file is removed on any failure.
+    """
+    temp_path = directory / f".upload-{uuid.uuid4().hex}"
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(temp_path, "wb") as out:
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise HTTPException(status_code=413, detail=f"File too large (max {max_size // (1024 * 1024)}MB)")
+                hasher.update(chunk)
+                await out.write(chunk)
+    except BaseException:
+        await discard(temp_path)
+        raise
+    return {"tempPath": temp_path, "size": size, "sha256": hasher.hexdigest()}
+
+
+async def discard(path: Path):
+    try:
+        await aiofiles.os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# ====================
+# Serving /uploads
+# ====================
+
+IMMUTABLE_PREFIX = "blobs/"  # content-addressed names never change content
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+MUTABLE_CACHE_CONTROL = "public, max-age=3600"
+RANGE_CHUNK_SIZE = 64 * 1024
+# Precompressed siblings (file.br / file.gz) served when the client accepts them
+PRECOMPRESSED = (("br", ".br"), ("gzip", ".gz"))
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Single byte range -> (start, end) inclusive; None if it can't be satisfied."""
+    match = _RANGE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        return None
+    return start, end
+
+
+async def _iter_range(path: str, start: int, length: int):
+    async with aiofiles.open(path, "rb") as f:
+        await f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = await f.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+class UploadFiles(StaticFiles):
+    """StaticFiles for user uploads with cache validators and byte ranges.
+
+    Content-addressed blobs get a strong ETag from their hash and are cached
+    as immutable; older uploads get a size/mtime ETag and a short max-age.
+    Single-range requests return 206, and .br/.gz siblings are served to
+    clients that accept them.
+    """
+
+    def file_response(self, full_path, stat_result: os.stat_result, scope, status_code: int = 200) -> Response:
+        if status_code != 200:
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        full_path = str(full_path)
+        for _, suffix in PRECOMPRESSED:
+            # A .br/.gz sibling is another representation of its file, only served through Accept-Encoding
+            if full_path.endswith(suffix) and os.path.isfile(full_path[:-len(suffix)]):
+                raise HTTPException(status_code=404)
+
+        request_headers = Headers(scope=scope)
+        relative = Path(os.path.relpath(full_path, os.path.realpath(self.directory))).as_posix()
+        immutable = relative.startswith(IMMUTABLE_PREFIX)
+        if immutable:
+            etag = f'"{Path(full_path).stem}"'
+        else:
+            etag = f'"{stat_result.st_size:x}-{int(stat_result.st_mtime):x}"'
+        headers = {
+            "etag": etag,
+            "cache-control": IMMUTABLE_CACHE_CONTROL if immutable else MUTABLE_CACHE_CONTROL,
+            "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+            "accept-ranges": "bytes",
+            "vary": "Accept-Encoding"
+        }
+        media_type = mimetypes.guess_type(str(full_path))[0] or "application/octet-stream"
+
+        if etag_matches(request_headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+
+        # Ranges are served from the identity encoding only
+        range_header = request_headers.get("range")
+        if range_header and request_headers.get("if-range", etag) == etag:
+            byte_range = _parse_range(range_header, stat_result.st_size)
+            if byte_range is None:
+                return Response(status_code=416, headers={**headers, "content-range": f"bytes */{stat_result.st_size}"})
+            start, end = byte_range
+            length = end - start + 1
+            headers.update({
+                "content-range": f"bytes {start}-{end}/{stat_result.st_size}",
+                "content-length": str(length)
+            })
+            return StreamingResponse(_iter_range(str(full_path), start, length), status_code=206, headers=headers, media_type=media_type)
+
+        accepted = request_headers.get("accept-encoding", "")
+        for encoding, suffix in PRECOMPRESSED:
+            if encoding in accepted:
+                try:
+                    encoded_stat = os.stat(f"{full_path}{suffix}")
+                except OSError:
+                    continue
+                encoded_etag = f'{etag[:-1]}-{encoding}"'
+                if etag_matches(request_headers.get("if-none-match"), encoded_etag):
+                    return Response(status_code=304, headers={**headers, "etag": encoded_etag})
+                headers.update({"etag": encoded_etag, "content-encoding": encoding})
+                return FileResponse(f"{full_path}{suffix}", headers=headers, media_type=media_type, stat_result=encoded_stat)
+
+        return FileResponse(full_path, headers=headers, media_type=media_type, stat_result=stat_result)
@@ -71,7 +71,7 @@ const TrendingPosts = () => {
                                         {post.title}
                                     </h3>
                                     <p className="text-xs text-gray-500 mt-1">
-                                        {post.views} views • {post.likes.length} likes
+                                        {post.views} views • {post.likesCount || 0} likes
                                     </p>
                                 </div>
                             </div>
@@ -19,7 +19,6 @@ const FeedPage = () => {
   const [posts, setPosts] = useState([]);
   const [loading, setLoading] = useState(true);
   const navigate = useNavigate();
-  const { user } = useAuth();
 
   const [activeTab, setActiveTab] = useState('foryou');
 
@@ -59,12 +58,11 @@ const FeedPage = () => {
       // Update local state
       setPosts(posts.map(post => {
         if (post.id === postId) {
-          const liked = post.likes.includes('current-user');
+          const liked = post.likedByMe;
           return {
             ...post,
-            likes: liked
-              ? post.likes.filter(id => id !== 'current-user')
-              : [...post.likes, 'current-user']
+            likedByMe: !liked,
+            likesCount: (post.likesCount || 0) + (liked ? -1 : 1)
           };
         }
         return post;
@@ -81,19 +79,18 @@ const FeedPage = () => {
 
       setPosts(posts.map(post => {
         if (post.id === postId) {
-          const isBookmarked = post.bookmarks.includes(user?.id);
+          const isBookmarked = post.bookmarkedByMe;
           return {
             ...post,
-            bookmarks: isBookmarked
-              ? post.bookmarks.filter(id => id !== user?.id)
-              : [...post.bookmarks, user?.id]
+            bookmarkedByMe: !isBookmarked,
+            bookmarksCount: (post.bookmarksCount || 0) + (isBookmarked ? -1 : 1)
           };
         }
         return post;
       }));
 
       const post = posts.find(p => p.id === postId);
-      const isBookmarked = post.bookmarks.includes(user?.id);
+      const isBookmarked = post.bookmarkedByMe;
       toast.success(isBookmarked ? 'Post removed from bookmarks' : 'Post bookmarked');
     } catch (error) {
       toast.error('Failed to bookmark post');
@@ -219,14 +216,8 @@ const FeedPage = () => {
                                 p: ({ node, ...props }) => <p {...props} className="mb-2" />,
                               }}
                             >
-                              {/* If excerpt is just plain text, this might not render code blocks unless excerpt contains markdown. 
-                                   If excerpt is generated from content, it might strip markdown. 
-                                   Let's assume for now we want to show a preview of content if excerpt is missing or just use content truncated.
-                                   But the user asked for it to be visible in feed. 
-                                   If the backend generates plain text excerpts, we might need to use post.content truncated.
-                                   Let's try using post.content truncated if excerpt is not markdown-rich, or just render excerpt as markdown.
-                               */
-                                post.content.length > 300 ? post.content.substring(0, 300) + "..." : post.content
+                              {/* List responses carry the excerpt (markdown) instead of the full content */
+                                post.excerpt
                               }
                             </ReactMarkdown>
                           </div>
@@ -255,7 +246,7 @@ const FeedPage = () => {
                             data-testid={`post-like-btn-${post.id}`}
                           >
                             <Heart className="h-4 w-4" />
-                            <span>{post.likes?.length || 0}</span>
+                            <span>{post.likesCount || 0}</span>
                           </button>
                           <div className="flex items-center space-x-1">
                             {console.log("DEBUG POST:", post)}
@@ -263,18 +254,18 @@ const FeedPage = () => {
                             <span>{post['commentsCount'] || 0}</span>
                           </div>
                           <button
-                            className={`flex items-center space-x-1 transition-colors ${post.bookmarks?.includes(user?.id) ? 'text-blue-500' : 'hover:text-secondary'}`}
+                            className={`flex items-center space-x-1 transition-colors ${post.bookmarkedByMe ? 'text-blue-500' : 'hover:text-secondary'}`}
                             onClick={(e) => handleBookmark(post.id, e)}
                             data-testid={`post-bookmark-btn-${post.id}`}
                           >
-                            <Bookmark className={`h-4 w-4 ${post.bookmarks?.includes(user?.id) ? 'fill-current' : ''}`} />
+                            <Bookmark className={`h-4 w-4 ${post.bookmarkedByMe ? 'fill-current' : ''}`} />
                           </button>
                           <div className="flex items-center space-x-1">
                             <Eye className="h-4 w-4" />
                             <span>{post.views}</span>
                           </div>
                         </div>
-                        <span>{calculateReadTime(post.content)}</span>
+                        <span>{post.readingTime ? `${post.readingTime} min read` : calculateReadTime(post.excerpt || '')}</span>
                       </CardFooter>
                     </Card>
                   </motion.div>
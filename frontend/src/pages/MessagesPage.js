@@ -30,7 +30,11 @@ const MessagesPage = () => {
   const [attachments, setAttachments] = useState([]);
   const [uploading, setUploading] = useState(false);
   const [showGroupInfo, setShowGroupInfo] = useState(false);
+  const [olderCursor, setOlderCursor] = useState(null);
+  const [loadingOlder, setLoadingOlder] = useState(false);
   const scrollRef = useRef(null);
+  const keepScrollRef = useRef(false);
+  const activeIdRef = useRef(null);
   const fileInputRef = useRef(null);
 
   useEffect(() => {
@@ -57,6 +61,15 @@ const MessagesPage = () => {
   }, [socket, activeConversation, user]);
 
   useEffect(() => {
+    activeIdRef.current = activeConversation?.id || null;
+  }, [activeConversation]);
+
+  useEffect(() => {
+    // Prepending an older page keeps the reader where they were
+    if (keepScrollRef.current) {
+      keepScrollRef.current = false;
+      return;
+    }
     scrollToBottom();
   }, [messages]);
 
@@ -80,19 +93,46 @@ const MessagesPage = () => {
   };
 
   const fetchMessages = async (conversationId) => {
+    setOlderCursor(null);
     try {
       const response = await axios.get(`${API}/conversations/${conversationId}/messages`, {
         headers: { Authorization: `Bearer ${token}` }
       });
       setMessages(response.data);
+      // Set only when there are older messages than this page
+      setOlderCursor(response.headers['x-next-cursor'] || null);
       scrollToBottom();
     } catch (error) {
       console.error('Failed to fetch messages:', error);
     }
   };
 
+  const loadOlderMessages = async () => {
+    if (!activeConversation || !olderCursor || loadingOlder) return;
+    const conversationId = activeConversation.id;
+    setLoadingOlder(true);
+    try {
+      const response = await axios.get(`${API}/conversations/${conversationId}/messages`, {
+        headers: { Authorization: `Bearer ${token}` },
+        params: { before: olderCursor }
+      });
+      // The reader switched conversations while this page was loading
+      if (activeIdRef.current !== conversationId) return;
+      keepScrollRef.current = true;
+      setMessages(prev => [...response.data, ...prev]);
+      setOlderCursor(response.headers['x-next-cursor'] || null);
+    } catch (error) {
+      console.error('Failed to load older messages:', error);
+      toast.error('Failed to load older messages');
+    } finally {
+      setLoadingOlder(false);
+    }
+  };
+
   const handleSelectConversation = (conv) => {
     setActiveConversation(conv);
+    // Opening the history marks it read on the server
+    setConversations(prev => prev.map(c => (c.id === conv.id ? { ...c, unreadCount: 0 } : c)));
     fetchMessages(conv.id);
     setShowGroupInfo(false);
   };
@@ -431,7 +471,7 @@ const MessagesPage = () => {
                           )}
                         </div>
                         {conv.lastMessage && (
-                          <p className={`text-xs sm:text-sm truncate ${!conv.lastMessage.read && conv.lastMessage.receiverId === user.id
+                          <p className={`text-xs sm:text-sm truncate ${conv.unreadCount > 0
                             ? 'text-white font-medium'
                             : 'text-gray-400'
                             }`}>
@@ -498,6 +538,13 @@ const MessagesPage = () => {
                   {/* Messages */}
                   <ScrollArea className="flex-1 p-3 sm:p-4">
                     <div className="space-y-3 sm:space-y-4">
+                      {olderCursor && (
+                        <div className="flex justify-center">
+                          <Button variant="ghost" size="sm" onClick={loadOlderMessages} disabled={loadingOlder}>
+                            {loadingOlder ? 'Loading...' : 'Load older messages'}
+                          </Button>
+                        </div>
+                      )}
                       {messages.map((msg, idx) => {
                         const isMe = msg.senderId === user.id;
                         const sender = msg.senderDetails || activeConversation.participantDetails?.find(p => p.id === msg.senderId);
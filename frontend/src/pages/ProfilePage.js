@@ -398,7 +398,7 @@ const ProfilePage = () => {
                         </CardContent>
                         <CardContent className="pb-2 pt-0">
                           <div className="flex items-center gap-4 text-sm text-gray-400">
-                            <div className="flex items-center gap-1"><Heart className="h-4 w-4" /> {post.likes?.length || 0}</div>
+                            <div className="flex items-center gap-1"><Heart className="h-4 w-4" /> {post.likesCount || 0}</div>
                             <div className="flex items-center gap-1"><MessageCircle className="h-4 w-4" /> {post.commentsCount || 0}</div>
                             <div className="flex items-center gap-1"><Eye className="h-4 w-4" /> {post.views || 0}</div>
                           </div>
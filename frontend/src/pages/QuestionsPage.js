@@ -100,7 +100,9 @@ const QuestionsPage = () => {
 
       // Update local state
       setQuestions(questions.map(q =>
-        q.id === questionId ? { ...q, upvotes: response.data.upvotes } : q
+        q.id === questionId
+          ? { ...q, upvotesCount: response.data.upvotes.length, upvotedByMe: response.data.upvotes.includes(user.id) }
+          : q
       ));
     } catch (error) {
       toast.error('Failed to upvote');
@@ -225,14 +227,14 @@ const QuestionsPage = () => {
                       <Button
                         variant="ghost"
                         size="icon"
-                        className={`h-8 w-8 hover:bg-white/10 ${user && question.upvotes?.includes(user.id) ? 'text-primary' : 'text-gray-400'
+                        className={`h-8 w-8 hover:bg-white/10 ${user && question.upvotedByMe ? 'text-primary' : 'text-gray-400'
                           }`}
                         onClick={(e) => handleUpvote(e, question.id)}
                       >
                         <ChevronUp className="h-6 w-6" />
                       </Button>
                       <span className="text-sm font-medium text-gray-300">
-                        {question.upvotes?.length || 0}
+                        {question.upvotesCount || 0}
                       </span>
                     </div>
 
@@ -246,7 +248,7 @@ const QuestionsPage = () => {
                         {question.title}
                       </h3>
                       <p className="text-gray-400 text-sm line-clamp-2">
-                        {question.description}
+                        {question.excerpt}
                       </p>
                     </div>
                   </div>
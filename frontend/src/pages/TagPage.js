@@ -209,7 +209,7 @@ const TagPage = () => {
                                             <h2 className="text-xl font-semibold text-white mb-2">{post.title}</h2>
                                             {post.excerpt && (
                                                 <div className="text-gray-400 mb-4 line-clamp-3">
-                                                    <ReactMarkdown>{post.content.substring(0, 300) + "..."}</ReactMarkdown>
+                                                    <ReactMarkdown>{post.excerpt}</ReactMarkdown>
                                                 </div>
                                             )}
 
@@ -224,7 +224,7 @@ const TagPage = () => {
                                             <div className="flex items-center gap-6 mt-6 text-sm text-gray-400">
                                                 <div className="flex items-center gap-1">
                                                     <Heart className="h-4 w-4" />
-                                                    {post.likes.length}
+                                                    {post.likesCount || 0}
                                                 </div>
                                                 <div className="flex items-center gap-1">
                                                     <MessageCircle className="h-4 w-4" />
@@ -283,7 +283,7 @@ const TagPage = () => {
                                         <CardContent>
                                             <h2 className="text-xl font-semibold text-white mb-2">{question.title}</h2>
                                             <div className="text-gray-400 mb-4 line-clamp-2">
-                                                {question.description.substring(0, 200)}...
+                                                {question.excerpt}
                                             </div>
 
                                             <div className="flex flex-wrap gap-2 mt-4">